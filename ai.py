@@ -1,46 +1,541 @@
 """AI integration helpers using Google's Gemini API.
 
 This module provides a thin wrapper around the `genai` client to send a
-prompt and return the text response. The `system_prompt` from `utils`
-is prepended to guide the assistant's behavior.
+prompt and return the text response. The assistant's persona (see
+`utils.personas`) is passed as the request's `system_instruction`, or,
+where the API supports it, as a reusable cached-content handle, instead
+of being pasted in front of every prompt. The persona is picked per
+intent: "chat" for general questions, "email" for email drafting.
+
+`ask_gemini_streaming` uses the SDK's streaming call and hands each
+complete sentence to a callback as soon as it arrives, so speech can
+start before the model has finished the reply.
+
+Successful replies are stored in `response_cache`, and
+`start_assistant` answers repeated prompts from it without calling the
+model. `start_assistant_async` is the same entry point for the asyncio
+runtime, built on the client's `aio` interface.
+
+All model calls go through `resilience.ResilientCaller` (deadline,
+jittered retries, hedging, circuit breaker). When a call fails or the
+breaker is open, the reply falls back to a stale cached answer or
+`ERROR_REPLY`. `latency_stats()` exposes the latency histograms and
+`token_stats()` the per-call token usage.
+
+Chat questions are sent with the session's conversation memory (see
+`memory.py`) so follow-ups have context; the response cache is still
+keyed by the question alone.
 """
 
-from google import genai
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from utils import lazy_import
 from config import API_KEY
-from utils import system_prompt
+from config import (
+    GEMINI_TIMEOUT,
+    GEMINI_RETRIES,
+    GEMINI_BACKOFF,
+    GEMINI_HEDGE,
+    GEMINI_HEDGE_MIN_SAMPLES,
+    GEMINI_CHUNK_TIMEOUT,
+    BREAKER_FAILURES,
+    BREAKER_RESET,
+    GEMINI_BASE_URL,
+    CONTEXT_CACHE,
+    CONTEXT_CACHE_TTL,
+)
+from resilience import ResilientCaller, CircuitBreaker, CircuitOpenError, DeadlineExceeded
+from tracing import span, record
+from utils import personas, iter_sentences, SentenceSplitter
+from response_cache import response_cache
+from memory import current_memory
+
+MODEL = "gemini-2.0-flash"
+ERROR_REPLY = "Some Error Occurred. Sorry From Jarvis"
+
+# The SDK import and client construction are deferred to the first
+# request so they don't delay startup
+genai = lazy_import("google.genai")
+client = None
+
+
+def get_client():
+    """Return the shared Gemini client, creating it on first use."""
+    global client
+    if client is None:
+        # Initialize a reusable Gemini client with the provided API key.
+        # The HTTP timeout backs up the caller's deadline so abandoned
+        # attempts don't hold sockets forever.
+        http_options = {"timeout": int(GEMINI_TIMEOUT * 1000)}
+        if GEMINI_BASE_URL:
+            http_options["base_url"] = GEMINI_BASE_URL
+        client = genai.Client(api_key=API_KEY, http_options=http_options)
+    return client
+
+
+# persona -> (cached content name or None, monotonic refresh time). None
+# means caching was refused (e.g. persona below the API's minimum size)
+# and plain `system_instruction` is used until the refresh time.
+_context_caches = {}
+_context_lock = threading.Lock()
+
+
+def _cached_content(persona):
+    if not CONTEXT_CACHE:
+        return None
+    with _context_lock:
+        entry = _context_caches.get(persona)
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        try:
+            cache = get_client().caches.create(
+                model=MODEL,
+                config={"system_instruction": personas[persona], "ttl": f"{CONTEXT_CACHE_TTL}s"},
+            )
+            name = cache.name
+        except Exception as e:
+            print(f"Context cache unavailable for '{persona}' persona:", e)
+            name = None
+        # Refresh a little before the server-side TTL runs out
+        _context_caches[persona] = (name, time.monotonic() + CONTEXT_CACHE_TTL * 0.9)
+        return name
+
+
+def persona_config(persona="chat", **extra):
+    """Return a generation config that applies `persona` to the request."""
+    name = _cached_content(persona)
+    if name is not None:
+        return {"cached_content": name, **extra}
+    return {"system_instruction": personas[persona], **extra}
+
+
+class TokenLedger:
+    """Per-call token usage reported by the API, with running totals.
+
+    `cached_tokens` counts prompt tokens served from a context cache;
+    those are billed at the reduced cached rate rather than re-sent.
+    """
+
+    FIELDS = ("prompt_tokens", "cached_tokens", "output_tokens", "total_tokens")
+
+    def __init__(self, window=100):
+        self.recent = deque(maxlen=window)
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind, persona, usage):
+        if usage is None:
+            return
+        row = {
+            "kind": kind,
+            "persona": persona,
+            "prompt_tokens": usage.prompt_token_count or 0,
+            "cached_tokens": usage.cached_content_token_count or 0,
+            "output_tokens": usage.candidates_token_count or 0,
+            "total_tokens": usage.total_token_count or 0,
+        }
+        with self._lock:
+            self.calls += 1
+            self.recent.append(row)
+            for field in self.FIELDS:
+                self.totals[field] += row[field]
+
+    def report(self):
+        """Return totals, the share of prompt tokens served from cache and recent calls."""
+        with self._lock:
+            prompt = self.totals["prompt_tokens"]
+            return {
+                "calls": self.calls,
+                **self.totals,
+                "cached_share": self.totals["cached_tokens"] / prompt if prompt else 0.0,
+                "recent": list(self.recent),
+            }
+
+
+tokens = TokenLedger()
+
+
+# One breaker for the backend; separate histograms for whole replies and
+# for time-to-first-chunk of streamed replies, so each hedges on its own p95
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+gemini = ResilientCaller(
+    "gemini", timeout=GEMINI_TIMEOUT, retries=GEMINI_RETRIES, backoff=GEMINI_BACKOFF,
+    hedge=GEMINI_HEDGE, hedge_min_samples=GEMINI_HEDGE_MIN_SAMPLES, breaker=breaker,
+)
 
-# Initialize a reusable Gemini client with the provided API key
-client = genai.Client(api_key=API_KEY)
 
+def _close_stream(opened):
+    # Result of `_open_stream` whose caller gave up on it (the other
+    # hedged attempt won): close the HTTP stream instead of leaking it
+    _, stream = opened
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
 
-def ask_gemini(prompt: str) -> str:
+
+gemini_stream = ResilientCaller(
+    "gemini-stream", timeout=GEMINI_TIMEOUT, retries=GEMINI_RETRIES, backoff=GEMINI_BACKOFF,
+    hedge=GEMINI_HEDGE, hedge_min_samples=GEMINI_HEDGE_MIN_SAMPLES, breaker=breaker,
+    discard=_close_stream,
+)
+
+
+def with_memory(prompt, persona="chat", context=None):
+    """Return the model contents for `prompt`, with conversation context for chat.
+
+    `context` is the value `cache_context` returned, so the contents and
+    the cache decision agree even if a turn is added in between.
+    """
+    # Email drafts and summaries stand alone
+    return current_memory().prompt(prompt, context) if persona == "chat" else prompt
+
+
+def cache_context(persona="chat"):
+    """Conversation context `with_memory` sends; the response cache skips non-empty ones."""
+    return current_memory().context() if persona == "chat" else ""
+
+
+def fallback_reply(prompt: str, persona="chat", context=None) -> str:
+    """Answer to give when the model can't be reached."""
+    if context is None:
+        context = cache_context(persona)
+    stale = response_cache.get_stale(prompt, persona, context)
+    return stale if stale is not None else ERROR_REPLY
+
+
+def latency_stats() -> dict:
+    """Return resilience counters and latency histograms per call type."""
+    return {"generate": gemini.stats(), "stream": gemini_stream.stats()}
+
+
+def token_stats() -> dict:
+    """Return per-call and total token usage."""
+    return tokens.report()
+
+
+def _forget_context_cache(persona):
+    # A cached-content handle can expire or be deleted server-side; drop
+    # it so the retry (or next call) recreates it or uses system_instruction
+    with _context_lock:
+        _context_caches.pop(persona, None)
+
+
+def _generate(contents, persona="chat", **extra):
+    config = persona_config(persona, **extra)
+    try:
+        response = get_client().models.generate_content(model=MODEL, contents=contents, config=config)
+    except Exception:
+        if "cached_content" in config:
+            _forget_context_cache(persona)
+        raise
+    tokens.record("generate", persona, response.usage_metadata)
+    return response
+
+
+def _open_stream(contents, persona="chat"):
+    # Start a stream and wait for its first chunk, so the deadline,
+    # retries and hedging apply to time-to-first-token
+    config = persona_config(persona)
+    try:
+        stream = iter(get_client().models.generate_content_stream(
+            model=MODEL, contents=contents, config=config,
+        ))
+        first = next(stream, None)
+    except Exception:
+        if "cached_content" in config:
+            _forget_context_cache(persona)
+        raise
+    return first, stream
+
+
+def ask_gemini(prompt: str, persona="chat") -> str:
     """Send a prompt to Gemini and return the assistant's reply as text.
 
-    The `system_prompt` is prepended to every request so the assistant
+    The persona is sent as the system instruction so the assistant
     maintains consistent personality and instructions.
 
     Args:
         prompt: User input or instruction to send to Gemini.
+        persona: Key of `utils.personas` to answer as.
 
     Returns:
         The text response from the model, or a friendly error message
         if the API call fails.
     """
-    full_prompt = f"{system_prompt}\nUser: {prompt}"
     try:
+        context = cache_context(persona)
         # Use a lightweight flash model for fast responses; swap model
         # name if you have access to other Gemini variants.
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=full_prompt,
-        )
+        with span("gemini"):
+            response = gemini.call(_generate, with_memory(prompt, persona, context), persona)
+        response_cache.put(prompt, response.text, persona, context)
         return response.text
     except Exception as e:
         # Print error for debugging but return a user-friendly message
         print("Gemini API error:", e)
-        return "Some Error Occurred. Sorry From Jarvis"
+        return fallback_reply(prompt, persona)
+
+
+def _paced(stream, timeout=GEMINI_CHUNK_TIMEOUT):
+    """Yield chunks of `stream`, failing if one takes longer than `timeout`.
+
+    The stream is read on a helper thread, since a blocked read can't be
+    interrupted; after a timeout that thread closes the stream as soon
+    as its read returns.
+
+    Raises:
+        DeadlineExceeded: No chunk arrived within `timeout` seconds.
+    """
+    chunks = queue.Queue()
+    abandoned = threading.Event()
+
+    def pump():
+        try:
+            for chunk in stream:
+                if abandoned.is_set():
+                    break
+                chunks.put((True, chunk))
+            chunks.put((True, None))
+        except Exception as e:
+            chunks.put((False, e))
+        finally:
+            if abandoned.is_set():
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+
+    threading.Thread(target=pump, name="gemini-stream-reader", daemon=True).start()
+    while True:
+        try:
+            ok, item = chunks.get(timeout=timeout)
+        except queue.Empty:
+            abandoned.set()
+            raise DeadlineExceeded(f"no chunk from Gemini in {timeout:.1f}s")
+        if not ok:
+            raise item
+        if item is None:
+            return
+        yield item
+
+
+def _chain(first, rest, persona):
+    # Usage metadata is complete on the last chunk of a stream
+    last = first
+    if first is not None:
+        yield first
+    for chunk in _paced(rest):
+        last = chunk
+        yield chunk
+    if last is not None:
+        tokens.record("stream", persona, last.usage_metadata)
+
+
+def ask_gemini_streaming(prompt: str, on_sentence, persona="chat") -> str:
+    """Stream a Gemini reply, passing each sentence to `on_sentence`.
+
+    Args:
+        prompt: User input or instruction to send to Gemini.
+        on_sentence: Callable invoked with every complete sentence while
+            later sentences are still being generated.
+        persona: Key of `utils.personas` to answer as.
+
+    Returns:
+        The full reply text (for logging), or the fallback reply if the
+        stream fails before producing anything.
+    """
+    sentences = []
+    context = cache_context(persona)
+    try:
+        start = time.perf_counter()
+        first, stream = gemini_stream.call(_open_stream, with_memory(prompt, persona, context), persona)
+        record("gemini_first_chunk", time.perf_counter() - start)
+        chunks = (chunk.text for chunk in _chain(first, stream, persona) if chunk.text)
+        for sentence in iter_sentences(chunks):
+            sentences.append(sentence)
+            on_sentence(sentence)
+    except Exception as e:
+        print("Gemini API error:", e)
+        if not sentences:
+            reply = fallback_reply(prompt, persona)
+            on_sentence(reply)
+            return reply
+        # Partial reply: speak and log it, but don't cache it
+        return " ".join(sentences)
+    answer = " ".join(sentences)
+    response_cache.put(prompt, answer, persona, context)
+    return answer
+
+
+# Asks for one answer per numbered question, returned as a JSON array
+BATCH_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {"type": "ARRAY", "items": {"type": "STRING"}},
+}
+BATCH_INSTRUCTIONS = (
+    "The user asked several things at once. Answer each numbered request "
+    "separately and reply with a JSON array of strings, one answer per "
+    "request, in the same order."
+)
+
+
+def ask_gemini_batch(prompts: list, context=None) -> list:
+    """Answer several prompts with a single Gemini request.
+
+    The request carries the conversation context like a single chat
+    question, and replies are cached under the same rules.
+
+    Args:
+        prompts: User requests to answer.
+        context: `cache_context()` read by the caller, or None to read it.
+
+    Returns:
+        One reply per prompt, in order. If the model's reply does not
+        split into exactly one answer per prompt, each prompt is asked
+        on its own instead.
+    """
+    if context is None:
+        context = cache_context()
+    numbered = "\n".join(f"{n}. {p}" for n, p in enumerate(prompts, 1))
+    contents = with_memory(f"{BATCH_INSTRUCTIONS}\n{numbered}", "chat", context)
+    try:
+        response = gemini.call(_generate, contents, "chat", **BATCH_CONFIG)
+        answers = json.loads(response.text)
+    except json.JSONDecodeError:
+        answers = None
+    except Exception as e:
+        print("Gemini API error:", e)
+        return [fallback_reply(p, "chat", context) for p in prompts]
+
+    if (
+        not isinstance(answers, list)
+        or len(answers) != len(prompts)
+        or not all(isinstance(a, str) for a in answers)
+    ):
+        print("Batched Gemini reply did not match the requests; asking separately")
+        return [ask_gemini(p) for p in prompts]
+
+    for prompt, answer in zip(prompts, answers):
+        response_cache.put(prompt, answer, "chat", context)
+    return answers
+
+
+def summarize(summary: str, turns: list, max_tokens: int) -> str:
+    """Fold conversation turns into a running summary.
+
+    Args:
+        summary: The current summary ("" for none).
+        turns: (command, answer) pairs to add, oldest first.
+        max_tokens: Approximate length limit for the result.
+
+    Returns:
+        The updated summary.
+
+    Raises:
+        Exception: The model call failed; the caller keeps the turns
+            and tries again later.
+    """
+    lines = [f"Current summary: {summary or '(empty)'}", "New turns:"]
+    lines += [f"User: {command}\nJarvis: {answer}" for command, answer in turns]
+    lines.append(f"Keep the updated summary under {max_tokens * 3 // 4} words.")
+    response = gemini.call(_generate, "\n".join(lines), "summary")
+    return response.text
+
+
+def start_assistant_batch(queries: list) -> list:
+    """Get replies for several queries, using one model call for all misses."""
+    context = cache_context()
+    answers = [response_cache.get(q, "chat", context) for q in queries]
+    missing = [i for i, a in enumerate(answers) if a is None]
+    if len(missing) == 1:
+        answers[missing[0]] = ask_gemini(queries[missing[0]])
+    elif missing:
+        fresh = ask_gemini_batch([queries[i] for i in missing], context)
+        for i, answer in zip(missing, fresh):
+            answers[i] = answer
+    return answers
+
+
+def start_assistant(query: str, on_sentence=None, persona="chat") -> str:
+    """Public wrapper used by other modules to get an AI response.
+
+    When `on_sentence` is given the reply is streamed sentence by
+    sentence to it; the full text is returned either way. Cached
+    replies are returned (and passed to `on_sentence`) without a model
+    call. `persona` selects the system instruction ("chat", "email").
+    """
+    cached = response_cache.get(query, persona, cache_context(persona))
+    if cached is not None:
+        if on_sentence is not None:
+            for sentence in iter_sentences([cached]):
+                on_sentence(sentence)
+        return cached
+
+    if on_sentence is not None:
+        return ask_gemini_streaming(query, on_sentence, persona)
+    return ask_gemini(query, persona)
+
+
+async def ask_gemini_async(prompt: str, on_sentence, persona="chat") -> str:
+    """Async counterpart of `ask_gemini_streaming` using `client.aio`."""
+    splitter = SentenceSplitter()
+    sentences = []
+    start = time.monotonic()
+    try:
+        # Shares the breaker and deadline with the sync path; retries and
+        # hedging are left to the sync `ResilientCaller`
+        if not breaker.allow():
+            raise CircuitOpenError("gemini circuit is open")
+        # Creating a context cache is a blocking call; keep it off the loop
+        config = await asyncio.to_thread(persona_config, persona)
+        context = await asyncio.to_thread(cache_context, persona)
+        contents = await asyncio.to_thread(with_memory, prompt, persona, context)
+        stream = await asyncio.wait_for(
+            get_client().aio.models.generate_content_stream(model=MODEL, contents=contents, config=config),
+            GEMINI_TIMEOUT,
+        )
+        last = None
+        async for chunk in stream:
+            last = chunk
+            if start is not None and chunk.text:
+                gemini_stream.histogram.record(time.monotonic() - start)
+                start = None
+            if chunk.text:
+                for sentence in splitter.feed(chunk.text):
+                    sentences.append(sentence)
+                    on_sentence(sentence)
+        for sentence in splitter.flush():
+            sentences.append(sentence)
+            on_sentence(sentence)
+        if last is not None:
+            tokens.record("stream", persona, last.usage_metadata)
+        breaker.record_success()
+    except Exception as e:
+        print("Gemini API error:", e)
+        if not isinstance(e, CircuitOpenError):
+            breaker.record_failure()
+        if not sentences:
+            reply = fallback_reply(prompt, persona)
+            on_sentence(reply)
+            return reply
+        return " ".join(sentences)
+    answer = " ".join(sentences)
+    # Cache writes may touch the database; keep them off the event loop
+    await asyncio.to_thread(response_cache.put, prompt, answer, persona, context)
+    return answer
 
 
-def start_assistant(query: str) -> str:
-    """Public wrapper used by other modules to get an AI response."""
-    return ask_gemini(query)
+async def start_assistant_async(query: str, on_sentence, persona="chat") -> str:
+    """Async wrapper with the same caching behaviour as `start_assistant`."""
+    cached = await asyncio.to_thread(
+        lambda: response_cache.get(query, persona, cache_context(persona)))
+    if cached is not None:
+        for sentence in iter_sentences([cached]):
+            on_sentence(sentence)
+        return cached
+    return await ask_gemini_async(query, on_sentence, persona)
\ No newline at end of file
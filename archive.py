@@ -0,0 +1,163 @@
+"""Compressed monthly archives of `ai_log`.
+
+`retention.py` moves months that fall out of the hot window into
+`ARCHIVE_DIR/ai_log-YYYY-MM.jsonl.gz`: one JSON object per row, newest
+first, so archives can be read in the same order as `db.iter_history`
+without loading a whole month. `db.iter_history_pages` continues into
+the archives after the live table, which keeps archived history
+readable through the history API.
+
+`ARCHIVE_DIR/index.json` records each month's row count and highest
+id, so incremental readers (`export.py`) skip months they have already
+seen without opening them.
+
+Archived months are not searchable: "search my history" (FULLTEXT or
+the embedded index in `history_search.py`) only covers the live table.
+"""
+
+import datetime
+import glob
+import gzip
+import heapq
+import json
+import os
+import re
+
+from config import ARCHIVE_DIR
+
+_NAME = re.compile(r"ai_log-(\d{4})-(\d{2})\.jsonl\.gz$")
+
+
+def path_for(month, directory=ARCHIVE_DIR):
+    """Archive file for the month starting at `month`."""
+    return os.path.join(directory, f"ai_log-{month:%Y-%m}.jsonl.gz")
+
+
+def write_month(month, pages, directory=ARCHIVE_DIR):
+    """Write rows (newest first) for `month` and return (path, row count).
+
+    If the month already has an archive (rows logged late with an old
+    timestamp, or a run that archived the month but died before dropping
+    it), the new rows are merged into it: both are streamed in
+    (timestamp, id) order, rows already archived are kept once, and the
+    count is that of the merged file.
+
+    The file is written under a temporary name, flushed to disk, then
+    renamed, so a crash never leaves a partial archive behind that could
+    be mistaken for a complete one.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = path_for(month, directory)
+    tmp = path + ".tmp"
+    rows = (row for page in pages for row in page)
+    if os.path.exists(path):
+        rows = heapq.merge(iter_month(month, directory), rows,
+                           key=lambda row: (row[3], row[0]), reverse=True)
+    count = 0
+    max_id = 0
+    last = None
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            lines = []
+            for row_id, command, response, timestamp in rows:
+                if (timestamp, row_id) == last:
+                    continue
+                last = (timestamp, row_id)
+                max_id = max(max_id, row_id)
+                lines.append(json.dumps({
+                    "id": row_id,
+                    "command": command,
+                    "response": response,
+                    "timestamp": timestamp.isoformat(" "),
+                }))
+                if len(lines) == 1000:
+                    f.write(("\n".join(lines) + "\n").encode("utf-8"))
+                    count += len(lines)
+                    lines = []
+            if lines:
+                f.write(("\n".join(lines) + "\n").encode("utf-8"))
+                count += len(lines)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    index = load_index(directory)
+    index[f"{month:%Y-%m}"] = {"rows": count, "max_id": max_id}
+    save_index(index, directory)
+    return path, count
+
+
+def load_index(directory=ARCHIVE_DIR):
+    """Return {"YYYY-MM": {"rows": n, "max_id": id}} for archived months."""
+    try:
+        with open(os.path.join(directory, "index.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_index(index, directory=ARCHIVE_DIR):
+    path = os.path.join(directory, "index.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def months(directory=ARCHIVE_DIR):
+    """Return archived months (as datetimes), newest first."""
+    found = []
+    for path in glob.glob(os.path.join(directory, "ai_log-*.jsonl.gz")):
+        match = _NAME.search(path)
+        if match:
+            found.append(datetime.datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(found, reverse=True)
+
+
+def iter_month(month, directory=ARCHIVE_DIR):
+    """Yield (id, command, response, timestamp) rows of one month, newest first."""
+    with gzip.open(path_for(month, directory), "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            yield (
+                row["id"],
+                row["command"],
+                row["response"],
+                datetime.datetime.fromisoformat(row["timestamp"]),
+            )
+
+
+def iter_pages_since(after_id, page_size, directory=ARCHIVE_DIR):
+    """Yield archived rows with id > `after_id`, oldest first, in pages.
+
+    Months whose highest id (from the index) is at most `after_id` are
+    skipped without being opened. Files are stored newest first, so each
+    month read is loaded into memory to be reversed.
+    """
+    index = load_index(directory)
+    page = []
+    for month in reversed(months(directory)):
+        known = index.get(f"{month:%Y-%m}")
+        if known is not None and known["max_id"] <= after_id:
+            continue
+        rows = [row for row in iter_month(month, directory) if row[0] > after_id]
+        for row in reversed(rows):
+            page.append(row)
+            if len(page) == page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def iter_pages(page_size, directory=ARCHIVE_DIR):
+    """Yield archived rows newest first, in lists of at most `page_size`."""
+    page = []
+    for month in months(directory):
+        for row in iter_month(month, directory):
+            page.append(row)
+            if len(page) == page_size:
+                yield page
+                page = []
+    if page:
+        yield page
@@ -0,0 +1,484 @@
+"""Offline end-to-end benchmark of the assistant's turn latency.
+
+Replays a trace of spoken queries through `main.main` (one call per
+turn) or through the full `main.start_jarvis` loop, with every external
+service replaced by a local fake with configurable latency:
+
+* speech: `voice.take_command` returns the next trace query and
+  `voice.speak` models synthesis latency plus playback at a speaking rate,
+* model: `ai.client` is an in-process fake Gemini client (plain,
+  streaming and batched JSON replies),
+* mail: the outbox's `smtplib` is a fake SMTP server,
+* database: `db`'s batch writer and reads sleep instead of touching
+  MySQL/SQLite; messages go to `messenger.RecordingTransport` and
+  launcher/shutdown actions do nothing.
+
+It reports p50/p95/p99 for each stage (stt, dispatch, ai, tts, db and
+the whole turn) and turns per second, and can save the result as a
+baseline or compare against one.
+
+Traces:
+    *.txt    one query per line
+    *.jsonl  {"query": "...", "replies": ["...", ...]} per line; replies
+             answer follow-up questions (email, message dialogues)
+    *.csv    a chat log export (`log.csv`: id, command, response, timestamp)
+    --from-db N replays the N most recent commands in `ai_log`
+
+Usage:
+    python bench_e2e.py trace.txt [--mode main|loop] [--repeat 3]
+                        [--save-baseline base.json] [--baseline base.json]
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import random
+import smtplib as real_smtplib
+import sys
+import threading
+import time
+import types
+
+DEFAULT_TRACE = [
+    "jarvis what time is it right now",
+    "jarvis what is the capital of france",
+    "jarvis tell me a fun fact about octopuses",
+    "jarvis open youtube",
+    "jarvis what is the capital of france",
+    "jarvis play lofi beats",
+    "jarvis explain how rainbows form and open github",
+    {"query": "jarvis send a message", "replies": ["98765 43210", "running late"]},
+    {"query": "jarvis send an email", "replies": ["bob at example dot com", "status update",
+                                                  "no", "all tasks are done", "yes"]},
+]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+class Recorder:
+    """Collects durations per stage."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        return {
+            stage: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+            for stage, values in sorted(self.samples.items())
+        }
+
+
+class Latency:
+    """A base delay with +/- `jitter` fraction of random noise."""
+
+    def __init__(self, seconds, jitter):
+        self.seconds = seconds
+        self.jitter = jitter
+
+    def sample(self):
+        return max(0.0, self.seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+
+# ---- fakes ----------------------------------------------------------
+
+class FakeUsage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(str(prompt)) // 4
+        self.cached_content_token_count = 0
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, prompt=""):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+
+class FakeModels:
+    REPLY = "Here is a short answer from the fake model. It has a second sentence too."
+
+    def __init__(self, first, chunk):
+        self.first = first
+        self.chunk = chunk
+
+    def generate_content(self, model, contents, config=None):
+        self.first.sleep()
+        if config and config.get("response_mime_type") == "application/json":
+            questions = [l for l in str(contents).splitlines() if l[:1].isdigit()]
+            return FakeResponse(json.dumps([f"{self.REPLY} ({q})" for q in questions]), contents)
+        return FakeResponse(self.REPLY, contents)
+
+    def generate_content_stream(self, model, contents, config=None):
+        words = self.REPLY.split(" ")
+        self.first.sleep()
+        for i in range(0, len(words), 4):
+            if i:
+                self.chunk.sleep()
+            piece = " ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
+            yield FakeResponse(piece, contents)
+
+
+class FakeCaches:
+    def create(self, **kwargs):
+        raise RuntimeError("context caching is not available on the fake client")
+
+
+class FakeClient:
+    """Stands in for `google.genai.Client` (sync interface only)."""
+
+    def __init__(self, first, chunk):
+        self.models = FakeModels(first, chunk)
+        self.caches = FakeCaches()
+
+
+class FakeSMTP:
+    latency = None
+    sent = 0
+
+    def __init__(self, host, port, timeout=None):
+        FakeSMTP.latency.sleep()  # connect + greeting
+
+    def starttls(self):
+        FakeSMTP.latency.sleep()
+
+    def login(self, user, password):
+        FakeSMTP.latency.sleep()
+
+    def noop(self):
+        return (250, b"OK")
+
+    def send_message(self, message):
+        FakeSMTP.latency.sleep()
+        FakeSMTP.sent += 1
+
+    def quit(self):
+        pass
+
+    close = quit
+
+
+def fake_smtplib(latency):
+    FakeSMTP.latency = latency
+    module = types.SimpleNamespace(SMTP=FakeSMTP)
+    # Keep the real exception classes for the outbox's error handling
+    for name in dir(real_smtplib):
+        if name.startswith("SMTP") and name.endswith(("Error", "Refused", "Disconnected")):
+            setattr(module, name, getattr(real_smtplib, name))
+    return module
+
+
+class FakeHandle:
+    def __init__(self, end):
+        self.end = end
+        self.done = False
+
+    def wait(self, timeout=None):
+        delay = self.end - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay if timeout is None else min(delay, timeout))
+        self.done = True
+        return True
+
+    def cancel(self):
+        self.end = time.perf_counter()
+
+
+class FakeSpeech:
+    """Replaces `voice.speak`: synthesis delay, then playback in order."""
+
+    def __init__(self, recorder, synth, rate):
+        self.recorder = recorder
+        self.synth = synth
+        self.rate = rate          # characters per second; 0 = instant playback
+        self.free_at = 0.0
+        self._lock = threading.Lock()
+
+    def speak(self, text, lang="en", slow=False, block=True):
+        now = time.perf_counter()
+        with self._lock:
+            start = max(now + self.synth.sample(), self.free_at)
+            end = start + (len(text) / self.rate if self.rate else 0.0)
+            self.free_at = end
+        self.recorder.add("tts", start - now)
+        handle = FakeHandle(end)
+        if block:
+            handle.wait()
+        return handle
+
+
+class FakeListener:
+    """Replaces `voice.take_command` with trace queries and their replies."""
+
+    def __init__(self, latency, loop_trace=None):
+        self.latency = latency
+        self.replies = []
+        self.queue = list(loop_trace or [])
+
+    def set_replies(self, replies):
+        self.replies = list(replies)
+
+    def take_command(self):
+        self.latency.sleep()
+        if self.replies:
+            return self.replies.pop(0)
+        if self.queue:
+            entry = self.queue.pop(0)
+            self.set_replies(entry["replies"])
+            return entry["query"]
+        # Follow-up questions with no scripted answer are confirmed
+        return "yes"
+
+
+def install_fakes(args, recorder):
+    """Patch every external service; returns the loaded modules."""
+    import config as cfg
+    cfg.PREWARM_BACKENDS = False
+    cfg.TTS_PREWARM = False
+    # The retention job would archive (or fail to reach) the real database
+    cfg.LOG_RETENTION_MONTHS = 0
+
+    import db
+    import voice as vc
+    import ai
+    import commands
+    import launcher
+    import messenger
+    import outbox
+    import main
+
+    db_latency = Latency(args.db_latency, args.jitter)
+
+    def write_batch(items):
+        start = time.perf_counter()
+        db_latency.sleep()
+        recorder.add("db", time.perf_counter() - start)
+
+    def read(result):
+        def fn(*a, **k):
+            db_latency.sleep()
+            return result
+        return fn
+
+    def no_connection():
+        raise RuntimeError("bench_e2e: database access is faked; stub this db reader")
+
+    db.write_batch = write_batch
+    db.cache_get = read(None)
+    db.cache_purge = read(0)
+    db.memory_load = read(None)
+    db.recent_turns = read([])
+    db.timings = read([])
+    db.supports_fulltext = read(False)
+    db.search_history = read([])
+    db.iter_log_since = read(iter(()))
+    db.iter_log_range = read(iter(()))
+    db.iter_history_pages = read(iter(()))
+    # Anything left unstubbed fails loudly instead of opening a connection
+    db.get_connection = no_connection
+
+    ai.client = FakeClient(Latency(args.ai_latency, args.jitter), Latency(args.ai_chunk, args.jitter))
+    ai.CONTEXT_CACHE = False
+
+    outbox.smtplib = fake_smtplib(Latency(args.smtp_latency, args.jitter))
+    messenger._dispatcher = messenger.MessageDispatcher(messenger.RecordingTransport(), window=0.05)
+    messenger._dispatcher.start()
+
+    launcher.launch = lambda entry: None
+    launcher.web_search = lambda query: None
+    commands.play_song = lambda query: None
+    commands.shutdown = lambda: None
+    commands.restart = lambda: None
+
+    speech = FakeSpeech(recorder, Latency(args.tts_latency, args.jitter), args.speech_rate)
+    vc.speak = speech.speak
+    vc.prewarm = lambda phrases, background=True: None
+    vc.wake_word_listener = lambda wake_word="jarvis", spotter=None: None
+
+    # Stage timers around the real code paths
+    main.engine.match = recorder.wrap("dispatch", main.engine.match)
+    ai.start_assistant = recorder.wrap("ai", ai.start_assistant)
+    ai.start_assistant_batch = recorder.wrap("ai", ai.start_assistant_batch)
+    return main, vc
+
+
+# ---- traces ---------------------------------------------------------
+
+def load_trace(path):
+    """Return a list of {"query", "replies"} entries from a trace file."""
+    entries = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    entries.append({"query": item["query"], "replies": item.get("replies", [])})
+        elif path.endswith(".csv"):
+            for row in csv.reader(f):
+                if len(row) > 1 and row[1].strip():
+                    entries.append({"query": row[1], "replies": []})
+        else:
+            entries = [{"query": line.strip(), "replies": []} for line in f if line.strip()]
+    return entries
+
+
+def trace_from_db(count):
+    import db
+    return [{"query": command, "replies": []} for command, _, _ in reversed(db.recent_turns(None, count))]
+
+
+def normalize_trace(entries):
+    trace = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"query": entry, "replies": []}
+        query = entry["query"].lower()
+        # start_jarvis only acts on queries addressed to Jarvis
+        if "jarvis" not in query:
+            query = "jarvis " + query
+        trace.append({"query": query, "replies": list(entry["replies"])})
+    return trace
+
+
+# ---- runs -----------------------------------------------------------
+
+def run(trace, args):
+    recorder = Recorder()
+    main, vc = install_fakes(args, recorder)
+    listener = FakeListener(Latency(args.stt_latency, args.jitter))
+    vc.take_command = recorder.wrap("stt", listener.take_command)
+
+    turns = 0
+    start = time.perf_counter()
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    with quiet:
+        if args.mode == "main":
+            timed_main = recorder.wrap("turn", main.main)
+            for _ in range(args.repeat):
+                for entry in trace:
+                    listener.set_replies(entry["replies"])
+                    timed_main(entry["query"])
+                    turns += 1
+        else:
+            loop = trace * args.repeat + [{"query": "jarvis stop", "replies": []}]
+            turns = len(loop)
+            listener.queue = loop
+            main.run_compound = recorder.wrap("turn", main.run_compound)
+            main.start_jarvis()
+        main.db.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": args.mode,
+        "turns": turns,
+        "seconds": elapsed,
+        "turns_per_second": turns / elapsed if elapsed else None,
+        "stages": recorder.summary(),
+    }
+
+
+def ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def report(result):
+    print(f"{result['turns']} turns in {result['seconds']:.2f}s "
+          f"({result['turns_per_second']:.2f} turns/s, mode={result['mode']})")
+    print(f"{'stage':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<10} {s['count']:>6} {ms(s['p50']):>9} {ms(s['p95']):>9} {ms(s['p99']):>9}")
+
+
+def compare(result, baseline, tolerance=0.10):
+    """Print changes against `baseline`; returns True if anything regressed."""
+    regressed = False
+    print(f"\nvs baseline ({baseline['turns_per_second']:.2f} turns/s):")
+
+    def change(new, old, higher_is_better=False):
+        nonlocal regressed
+        if new is None or not old:
+            return "-"
+        delta = (new - old) / old
+        worse = delta < -tolerance if higher_is_better else delta > tolerance
+        regressed |= worse
+        return f"{delta:+.1%}" + (" REGRESSION" if worse else "")
+
+    print(f"  turns/s {change(result['turns_per_second'], baseline['turns_per_second'], True)}")
+    for stage, s in result["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            continue
+        print(f"  {stage:<10} p50 {change(s['p50'], old['p50'])}, p95 {change(s['p95'], old['p95'])}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", nargs="?", help="trace file (.txt, .jsonl or .csv); default: built-in")
+    parser.add_argument("--from-db", type=int, metavar="N", help="replay the N latest ai_log commands")
+    parser.add_argument("--mode", choices=("main", "loop"), default="main",
+                        help="call main.main per turn, or run the start_jarvis loop")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the trace")
+    parser.add_argument("--stt-latency", type=float, default=0.02)
+    parser.add_argument("--ai-latency", type=float, default=0.15, help="seconds to first chunk")
+    parser.add_argument("--ai-chunk", type=float, default=0.02, help="seconds between chunks")
+    parser.add_argument("--tts-latency", type=float, default=0.03)
+    parser.add_argument("--speech-rate", type=float, default=0.0,
+                        help="playback speed in characters/s (0 = instant)")
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--smtp-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of each latency")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="compare against this saved result")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown vs baseline")
+    parser.add_argument("--save-baseline", help="write the result to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the assistant's output")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.from_db:
+        entries = trace_from_db(args.from_db)
+    elif args.trace:
+        entries = load_trace(args.trace)
+    else:
+        entries = DEFAULT_TRACE
+    result = run(normalize_trace(entries), args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(result)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if baseline is not None and compare(result, baseline, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,83 @@
+"""Micro-benchmark: compiled intent engine vs. an if/elif substring chain.
+
+For a growing number of synthetic intents, this times routing a mix of
+queries (late matches and misses, the chain's worst cases) through
+
+* a sequential chain of `keyword in query` tests, like the original
+  `main.main`, and
+* an `intents.IntentEngine` with the same keywords.
+
+Usage: python bench_intents.py [--repeat N]
+"""
+
+import argparse
+import timeit
+
+from intents import IntentEngine
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel"]
+
+
+def keywords(count):
+    """Return `count` distinct two-word keywords."""
+    return [f"{WORDS[i % len(WORDS)]} {i}" for i in range(count)]
+
+
+def build_chain(keys):
+    def route(query):
+        for name, keyword in keys:
+            if keyword in query:
+                return name
+        return None
+    return route
+
+
+def build_engine(keys):
+    engine = IntentEngine()
+    for priority, (name, keyword) in enumerate(reversed(keys)):
+        engine.register(name, None, any_of=(keyword,), priority=priority)
+
+    def route(query):
+        intent = engine.match(query)
+        return intent.name if intent is not None else None
+    return route
+
+
+def queries(keys):
+    last = keys[-1][1]
+    middle = keys[len(keys) // 2][1]
+    return [
+        f"jarvis please {last} for me now",
+        f"could you {middle} right away",
+        "jarvis what is the weather like in the mountains",
+        "tell me a joke about programmers and coffee",
+    ]
+
+
+def run(counts, repeat):
+    print(f"{'intents':>8} {'chain us':>10} {'engine us':>10} {'speedup':>8}")
+    for count in counts:
+        keys = [(f"intent{i}", k) for i, k in enumerate(keywords(count))]
+        chain = build_chain(keys)
+        engine = build_engine(keys)
+        sample = queries(keys)
+
+        # Both routers must agree before their timings mean anything
+        for q in sample:
+            assert chain(q) == engine(q), q
+
+        def time_router(router):
+            timer = timeit.Timer(lambda: [router(q) for q in sample])
+            best = min(timer.repeat(repeat=5, number=repeat))
+            return best / (repeat * len(sample)) * 1e6
+
+        chain_us = time_router(chain)
+        engine_us = time_router(engine)
+        print(f"{count:>8} {chain_us:>10.2f} {engine_us:>10.2f} {chain_us / engine_us:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000, help="routing passes per timing")
+    args = parser.parse_args()
+    run([8, 32, 128, 512, 2048], args.repeat)
@@ -1,18 +1,23 @@
 """High-level system and messaging commands used by the assistant.
 
 This module contains functions for system actions (shutdown/restart),
-messaging (email, WhatsApp), simple PC search automation, and media
-playback helpers. Functions are designed to be called from `main.py`.
+messaging (email, WhatsApp), opening sites, apps and files through the
+launcher index, and media playback helpers. Functions are designed to be called from `main.py`.
+
+Third-party backends are imported lazily, so importing this module is
+cheap and the wake-word loop starts without waiting for them.
 """
 
 import os
 import datetime
-import smtplib
-import pywhatkit
-import keyboard
-import config as c
-import webbrowser
-import time
+from utils import lazy_import
+
+# Heavy backends load on first use: pywhatkit in particular is slow and
+# touches the network when imported.
+pywhatkit = lazy_import("pywhatkit")
+outbox = lazy_import("outbox")  # starts its SMTP worker on the first email
+messenger = lazy_import("messenger")  # starts its dispatcher on the first message
+launcher = lazy_import("launcher")
 
 
 def tell_time():
@@ -33,73 +38,68 @@ def restart():
     os.system("shutdown /r /t 1")
 
 def send_email(to_email, subject, msg):
-    """Send an email via Gmail SMTP server.
-    
+    """Queue an email for delivery by the background outbox.
+
+    The SMTP session is kept open by `outbox.Outbox`, which retries
+    failed sends, so this returns immediately.
+
     Args:
         to_email (str): Recipient email address
         subject (str): Email subject line
         msg (str): Email body/message content
-    
+
     Returns:
         str: Confirmation message
     """
-    server = smtplib.SMTP("smtp.gmail.com", 587)
-    server.starttls()
+    outbox.get_outbox().submit(to_email, subject, msg)
+    return "Email queued for sending"
 
-    sender_email = c.mail
-    password = c.password   
-
-    server.login(sender_email, password)
-    email_text = "Subject:"+subject+"\n\n"+msg
+def send_whatsapp(number, message):
+    """Queue a WhatsApp message for the background dispatcher.
 
-    server.sendmail(sender_email, to_email, email_text)
-    server.quit()
-    return "Email sent successfully"
+    Returns immediately; the dispatcher's worker thread sends queued
+    messages one after another, each in its own WhatsApp Web tab that
+    is opened, given time to load and closed again.
 
-def send_whatsapp(number, message):
-    """Send a WhatsApp message using pywhatkit (schedules for next minute).
-    
     Args:
-        number (str): Recipient phone number (without country code, will add +91)
+        number (str): Recipient phone number (country code added if missing)
         message (str): Message content to send
-    
+
     Returns:
-        str: Confirmation message
+        messenger.Delivery: Handle with the message's delivery status
     """
-    now = datetime.datetime.now()
-    hour = now.hour
-    minute = now.minute + 1  # Schedule for next minute
+    return messenger.get_dispatcher().submit(messenger.international(number), message)
 
-    pywhatkit.sendwhatmsg("+91"+number, message, hour, minute)
-    return "WhatsApp message sent successfully"
-    
 
 
 def search(query):
+    """Open the best launcher match for `query`, or search the web for it.
+
+    Args:
+        query (str): Spoken command, e.g. "open spotify"
 
-    """Search inside Windows using WIN key + typing."""
-    
+    Returns:
+        launcher.Entry or None: What was opened; None means a web search
+    """
     # Clean command
     query = query.replace("search", "").replace("open", "").replace("jarvis", "").strip()
 
-    # Open Start Menu
-    keyboard.press_and_release('windows')
-    time.sleep(0.3)
-
-    # Type what you want to search
-    keyboard.write(query)
-    time.sleep(0.4)
-
-    # Open first result
-    keyboard.press_and_release('enter')
+    found = launcher.get_index().find(query)
+    if found:
+        launcher.launch(found[0])
+        return found[0]
+    launcher.web_search(query)
+    return None
 
 
 def play_song(query):
     pywhatkit.playonyt(query)
 
 def web(query):
-    for site in c.sites:
-            if site.lower() in query.lower():
-
-                webbrowser.get("windows-default").open(c.sites[site])
+    """Open the configured site whose name best matches `query`."""
+    for entry in launcher.get_index().find(query, limit=5):
+        if entry.kind == "site":
+            launcher.launch(entry)
+            return entry
+    return None
 
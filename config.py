@@ -9,12 +9,68 @@ an encrypted secrets store for real deployments.
 """
 
 # ==================== DATABASE CONFIGURATION ====================
+# Storage backend: "mysql" (server below) or "sqlite" (embedded file,
+# no server needed; see `storage.py`)
+DB_BACKEND = "mysql"
+SQLITE_PATH = "jarvis.db"     # Database file for the sqlite backend
+
 # MySQL database connection credentials
 DB_USER = "root"              # MySQL username
 DB_PASSWORD = "1234"          # MySQL password
 DB_HOST = "localhost"         # MySQL server host
 DB_NAME = "jarvis_backup"     # Database name for storing chat logs
 
+# Connection pool and background log writer tuning. Interactions are
+# queued by `db.response` and written in batches by a worker thread so
+# the voice loop never waits on the database.
+DB_POOL_SIZE = 3              # Persistent connections kept open
+LOG_QUEUE_SIZE = 1000         # Max interactions waiting to be written
+LOG_BATCH_SIZE = 50           # Flush once this many rows are pending
+LOG_FLUSH_INTERVAL = 2.0      # ...or after this many seconds
+LOG_ENQUEUE_TIMEOUT = 0.05    # Seconds to wait on a full queue before dropping
+HISTORY_PAGE_SIZE = 500       # Rows per keyset page when reading history
+# "search my history": "fulltext" uses MySQL's FULLTEXT index when
+# `ai_log` has one (falling back to the embedded index otherwise, e.g.
+# with LOG_PARTITIONED), "embedded" always uses the in-process inverted
+# index in `history_search.py`.
+HISTORY_SEARCH = "fulltext"
+HISTORY_SEARCH_LIMIT = 3      # Matches read back per search
+
+# ==================== LOG RETENTION ====================
+# On MySQL, `ai_log` (and `ai_timing`) are partitioned by month so old
+# months can be dropped as whole partitions. Partitioning costs FULLTEXT search: MySQL has no
+# FULLTEXT indexes on partitioned tables, so `db_setup.py` drops it and
+# history search uses the embedded index instead. Set False (before
+# running `db_setup.py`) to keep FULLTEXT; retention then deletes old
+# months row by row.
+LOG_PARTITIONED = True
+LOG_PARTITIONS_AHEAD = 2      # Empty monthly partitions kept ahead of now
+# Full months kept in `ai_log` before the current one; older months are
+# moved to compressed files in ARCHIVE_DIR by `retention.py` (daily).
+LOG_RETENTION_MONTHS = 6
+ARCHIVE_DIR = "archive"
+RETENTION_INTERVAL = 24 * 60 * 60  # Seconds between retention runs
+
+# ==================== LOG EXPORT ====================
+# `export.py` (and the "chat log" command) append only the rows added
+# since the last export of each destination, tracked in EXPORT_STATE.
+EXPORT_FORMAT = "jsonl"       # "jsonl" (gzip) or "parquet" (needs pyarrow)
+EXPORT_DIR = "exports"
+EXPORT_STATE = "exports/state.json"
+EXPORT_ROW_GROUP = 50000      # Rows per Parquet row group
+
+# ==================== TRACING ====================
+# Time each stage of a turn (listen, recognize, dispatch, Gemini, TTS)
+# and store the timings in `ai_timing` next to `ai_log`. Summarize with
+# "performance report" or `python tracing.py`.
+TRACE_ENABLED = True
+
+# ==================== STARTUP ====================
+# Heavy backends (pywhatkit, the launcher index, the Gemini client, the DB pool)
+# load lazily. When True they are also loaded in the background right
+# after the wake-word loop starts.
+PREWARM_BACKENDS = True
+
 # ==================== API KEYS ====================
 # Google Gemini API key for AI responses
 API_KEY = ""
@@ -22,6 +78,75 @@ API_KEY = ""
 # convenient, but in shared or production environments prefer
 # environment variables or a secrets manager (e.g., Vault, AWS Secrets).
 
+# ==================== AI RESPONSE CACHE ====================
+# Replies to repeated prompts are served from a cache keyed by the
+# normalized prompt and the system prompt version.
+AI_CACHE_SIZE = 256               # Entries kept in the in-memory LRU tier
+AI_CACHE_TTL = 24 * 60 * 60       # Seconds before a cached reply expires
+AI_CACHE_PERSIST = True           # Also store replies in the `ai_cache` table
+# Prompts containing any of these words are time-sensitive and always
+# go to the model.
+AI_CACHE_BYPASS_WORDS = (
+    "time", "today", "tonight", "tomorrow", "yesterday", "now", "date",
+    "day", "weather", "news", "latest", "current", "score", "price",
+)
+
+# ==================== VOICE CONFIGURATION ====================
+# Synthesized speech is cached on disk, keyed by a hash of the text,
+# language and speed, so repeated phrases skip the gTTS round trip.
+TTS_CACHE_DIR = "tts_cache"               # Folder for cached mp3 files
+TTS_CACHE_MAX_BYTES = 50 * 1024 * 1024    # Evict least recently used above this
+TTS_PREWARM = True                        # Synthesize fixed prompts at startup
+
+# Wake-word capture keeps one microphone stream open and only sends
+# voiced segments (found by a local energy gate) to recognition.
+VAD_PREROLL = 0.3           # Seconds of audio kept before speech starts
+VAD_HANGOVER = 0.6          # Seconds of silence that end a segment
+VAD_MIN_SEGMENT = 0.25      # Shorter bursts (clicks, taps) are ignored
+VAD_MAX_SEGMENT = 5.0       # Segments are cut at this length
+VAD_ENERGY_RATIO = 1.5      # Speech must be this much louder than ambient
+VAD_RING_SECONDS = 10       # Audio history kept in the ring buffer
+# `take_command` calibrates the recognizer's energy threshold once,
+# stores it here, and then only nudges it from the silence around each
+# utterance instead of sampling ambient noise on every turn.
+CALIBRATION_FILE = "calibration.json"
+CALIBRATION_DRIFT = 0.35     # Recalibrate when ambient moves this fraction
+CALIBRATION_HISTORY = 50     # Threshold changes kept for tuning
+# Offline wake-word spotter: None (use Google) or "sphinx" (pocketsphinx)
+WAKE_SPOTTER = None
+
+# ==================== GEMINI RESILIENCE ====================
+# Every Gemini call runs under a deadline with jittered retries; slow
+# calls are hedged after the observed p95, and repeated failures open a
+# circuit breaker that answers from cache/fallback until it resets.
+GEMINI_TIMEOUT = 10.0           # Seconds per call, all attempts included
+GEMINI_RETRIES = 2              # Extra attempts after a failure
+GEMINI_BACKOFF = 0.25           # Base seconds for exponential backoff
+GEMINI_HEDGE = True             # Race a second request after p95 latency
+GEMINI_HEDGE_MIN_SAMPLES = 20   # Calls observed before hedging starts
+GEMINI_CHUNK_TIMEOUT = 5.0      # Max seconds between chunks of a streamed reply
+BREAKER_FAILURES = 5            # Consecutive failures that open the circuit
+BREAKER_RESET = 30.0            # Seconds before a trial call is allowed
+# Point the client at another endpoint, e.g. the local fake model
+# server in `fake_gemini.py` ("http://127.0.0.1:8765"). None = Google.
+GEMINI_BASE_URL = None
+
+# Personas are sent as a system instruction. With CONTEXT_CACHE the
+# persona is uploaded once as cached content and referenced by handle;
+# if the API refuses (personas shorter than its minimum cacheable size),
+# plain system_instruction is used until the TTL passes.
+CONTEXT_CACHE = True
+CONTEXT_CACHE_TTL = 3600        # Seconds a cached persona lives
+
+# ==================== CONVERSATION MEMORY ====================
+# Recent turns are sent with each AI question so follow-ups have
+# context. Older turns are folded into a rolling summary to keep the
+# context under a fixed token budget (see `memory.py`).
+MEMORY_ENABLED = True
+MEMORY_TOKEN_BUDGET = 1200      # Max estimated tokens of summary + turns
+MEMORY_SUMMARY_TOKENS = 250     # Target length of the rolling summary
+MEMORY_LOAD_TURNS = 20          # Logged turns read back on first use
+
 # ==================== EMAIL CONFIGURATION ====================
 # Gmail account credentials for sending emails via SMTP
 mail = ""        # Sender email address
@@ -29,6 +154,49 @@ password = ""            # Gmail App Password
 # If using Gmail, generate an App Password for SMTP access and
 # avoid storing your regular account password here.
 
+# Outgoing mail is queued and sent by a background worker over one
+# persistent SMTP connection (see `outbox.py`).
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+SMTP_STARTTLS = True
+SMTP_TIMEOUT = 10.0        # Seconds per SMTP operation
+SMTP_IDLE_TIMEOUT = 120.0  # Close the connection after this long without mail
+SMTP_NOOP_AFTER = 30.0     # Health-check an idle connection before reuse
+SMTP_MAX_ATTEMPTS = 5      # Tries per message before it is marked failed
+SMTP_BACKOFF = 2.0         # Base seconds for exponential retry backoff
+SMTP_CLOSE_TIMEOUT = 60.0  # Seconds to keep delivering queued mail at exit
+
+# ==================== WHATSAPP ====================
+# Messages are queued and sent by a background dispatcher (see
+# `messenger.py`). Messages arriving close together are sent as one
+# batch, but pywhatkit still loads WhatsApp Web in a new tab for each.
+WHATSAPP_COUNTRY_CODE = "+91"   # Prefixed to numbers spoken without one
+WHATSAPP_COALESCE_WINDOW = 0.0  # Seconds to wait for more messages per batch
+WHATSAPP_LOAD_WAIT = 15         # Seconds for WhatsApp Web to load, per message
+WHATSAPP_CLOSE_TIMEOUT = 60.0   # Seconds to keep sending queued messages at exit
+
+# ==================== LAUNCHER ====================
+# "open"/"search" commands are matched against an index of the sites
+# below, installed applications and recent files (see `launcher.py`).
+LAUNCHER_REFRESH = 60.0         # Seconds between checks for changed sources
+LAUNCHER_MIN_SCORE = 0.45       # Minimum fuzzy (trigram) similarity to accept
+LAUNCHER_RECENT_FILES = 50      # Recent files included in the index
+SEARCH_URL = "https://www.google.com/search?q={}"  # Used when nothing matches
+
+# ==================== SERVER MODE ====================
+# `python main.py --serve` answers text queries from many clients over
+# WebSocket (streamed) and HTTP (see `server.py`).
+SERVER_HOST = "127.0.0.1"       # Local only; clients can run local commands
+SERVER_PORT = 8770
+SERVER_WORKERS = 8              # Turns handled at the same time
+SERVER_QUEUE = 32               # Admitted turns waiting for a worker; more are refused
+SERVER_SESSION_QUEUE = 4        # Queries one session may have waiting
+SERVER_MAX_SESSIONS = 256
+SERVER_SESSION_TTL = 30 * 60    # Seconds before an idle session is dropped
+SERVER_ANSWER_TIMEOUT = 60.0    # Seconds to wait for the answer to a follow-up question
+# Intents refused for remote clients (they act on the host machine)
+SERVER_BLOCKED_INTENTS = ("shutdown", "restart")
+
 # ==================== WEBSITE SHORTCUTS ====================
 # Predefined websites that can be opened via voice commands
 # Format: [command_name, url]
@@ -2,52 +2,528 @@
 """Database helpers for logging and retrieving AI interaction history.
 
 This module provides minimal functions used by `main.py` to persist
-and fetch chat logs stored in the `ai_log` table.
+and fetch chat logs stored in the `ai_log` table. Statements run on
+the storage backend chosen by `DB_BACKEND` (MySQL or embedded SQLite,
+see `storage.py`).
+
+Writes go through the backend's pooled connections and a background
+writer thread: `response` only enqueues the interaction, and the writer
+flushes pending rows with a single `executemany` once enough rows are
+waiting or the flush interval has passed.
 """
 
-import mysql.connector as mysql  # mysql.connector implements the MySQL DB-API
-from config import DB_USER, DB_PASSWORD, DB_HOST, DB_NAME
+import atexit
+import datetime
+import queue
+import threading
+import time
+
+import archive
+import storage
+from config import (
+    LOG_QUEUE_SIZE,
+    LOG_BATCH_SIZE,
+    LOG_FLUSH_INTERVAL,
+    LOG_ENQUEUE_TIMEOUT,
+    HISTORY_PAGE_SIZE,
+)
+
+
+# The timestamp is taken when the turn happens, not when the batch is
+# flushed, so rows keep their real order and time
+INSERT_LOG = "INSERT INTO ai_log (command, response, timestamp, source) VALUES (%s, %s, %s, %s)"
+# Per-stage turn timings (see `tracing.py`), keyed by the ai_log timestamp
+INSERT_TIMING = "INSERT INTO ai_timing (log_at, stage, ms) VALUES (%s, %s, %s)"
+
+
+def get_connection():
+    """Borrow a connection from the configured backend.
+
+    Calling `close()` on the returned connection hands it back (to the
+    pool for MySQL, to the thread for SQLite) instead of tearing it down.
+    The backend and its driver are loaded on first use.
+    """
+    return storage.get_backend().connect()
+
+
+def sql(statement):
+    """Adapt a %s-placeholder statement to the configured backend."""
+    return storage.get_backend().sql(statement)
+
+
+def supports_fulltext():
+    """True if the backend has the FULLTEXT index used by `search_history`."""
+    return storage.get_backend().fulltext
+
+
+class FullTextUnavailable(Exception):
+    """`ai_log` has no FULLTEXT index to search (SQLite, or partitioned MySQL)."""
+
+
+# Sentinel placed on the queue to tell the writer to drain and exit
+_STOP = object()
+
+
+class LogWriter(threading.Thread):
+    """Background thread that batches `ai_log` inserts.
+
+    Each queued item is a (statement, params) pair; a flush runs one
+    `executemany` per distinct statement in a single transaction, so
+    other tables written from the voice loop (e.g. `ai_cache`) share
+    the same batching. Rows are flushed when `batch_size` rows are pending or when the
+    oldest pending row has waited `flush_interval` seconds. The queue is
+    bounded; `submit` waits at most `enqueue_timeout` seconds for room
+    and drops the row (counting it in `dropped`) rather than stalling
+    the caller.
+    """
+
+    def __init__(self, maxsize=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(name="jarvis-log-writer", daemon=True)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+
+    def submit(self, statement, params, timeout=LOG_ENQUEUE_TIMEOUT):
+        """Queue a row for writing. Returns False if it had to be dropped."""
+        try:
+            self._queue.put((statement, params), timeout=timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stop(self, timeout=None):
+        """Ask the writer to flush everything pending and wait for it."""
+        # Blocking put: the stop marker must not be dropped on a full queue
+        self._queue.put(_STOP)
+        self.join(timeout)
+
+    def run(self):
+        batch = []
+        deadline = None
+        while True:
+            # Sleep until the next row arrives or the batch is due
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
 
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            write_batch(batch)
+            self.written += len(batch)
+        except Exception as e:
+            # Keep the writer alive; a lost batch must not kill logging
+            print("Log writer error:", e)
 
-def response(command, answer):
-    """Append a single command/response pair to the `ai_log` table.
+
+def write_batch(items):
+    """Write queued (statement, params) items in one transaction."""
+    grouped = {}
+    for statement, params in items:
+        grouped.setdefault(statement, []).append(params)
+
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        for statement, rows in grouped.items():
+            cursor.executemany(sql(statement), rows)
+        mycon.commit()
+    finally:
+        mycon.close()  # returns the connection to the pool
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter()
+            _writer.start()
+    return _writer
+
+
+def response(command, answer, at=None, timings=None, source="default"):
+    """Queue a single command/response pair for the `ai_log` table.
+
+    The row is written asynchronously by the background writer; this
+    call returns immediately.
 
     Args:
         command: The user's spoken/written command text.
         answer: The AI assistant's response text.
+        at: When the interaction happened (defaults to now).
+        timings: Optional {stage: ms} from `tracing.take`, written to
+            `ai_timing` in the same batch.
+        source: Name of the conversation the turn belongs to ("default"
+            for the local voice user, "session-ID" for server clients),
+            so `recent_turns` reloads only that conversation.
+
+    Returns:
+        True if the row was queued, False if the queue was full and the
+        row was dropped.
     """
-    # Create a short-lived DB connection for this write operation
-    mycon = mysql.connect(
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        database=DB_NAME,
-    )
-    cursor = mycon.cursor()
+    at = at or datetime.datetime.now()
+    writer = _get_writer()
+    queued = writer.submit(INSERT_LOG, (command, answer, at, source))
+    if queued and timings:
+        for stage, ms in timings.items():
+            writer.submit(INSERT_TIMING, (at, stage, ms))
+    return queued
+
+
+# Persistent tier of the AI response cache (see `response_cache.py`)
+CACHE_COLUMNS = ("cache_key", "prompt", "response", "expires_at")
+
+
+def cache_get(key, now):
+    """Return the cached response for `key` and its expiry, or None.
+
+    Args:
+        key: Cache key (hex digest) built by `response_cache`.
+        now: Current datetime; expired entries are ignored.
+
+    Returns:
+        A (response, expires_at) tuple, or None when missing/expired.
+    """
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        cursor.execute(
+            sql("SELECT response, expires_at FROM ai_cache WHERE cache_key = %s AND expires_at > %s"),
+            (key, now),
+        )
+        return cursor.fetchone()
+    finally:
+        mycon.close()
+
+
+def cache_put(key, prompt, answer, expires_at):
+    """Queue an upsert of a cached response through the log writer."""
+    statement = storage.get_backend().upsert("ai_cache", CACHE_COLUMNS, "cache_key")
+    return _get_writer().submit(statement, (key, prompt[:255], answer, expires_at))
+
+
+def cache_purge(now):
+    """Delete expired `ai_cache` rows. Returns the number removed."""
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        cursor.execute(sql("DELETE FROM ai_cache WHERE expires_at <= %s"), (now,))
+        mycon.commit()
+        return cursor.rowcount
+    finally:
+        mycon.close()
+
+
+# Rolling conversation summary (see `memory.py`)
+MEMORY_COLUMNS = ("name", "summary", "folded_until")
 
-    # Parameterized query prevents injection and handles escaping
-    query = "INSERT INTO ai_log (command, response) VALUES (%s, %s)"
-    cursor.execute(query, (command, answer))
-    mycon.commit()
-    mycon.close()
+
+def memory_load(name):
+    """Return the stored (summary, folded_until) for a memory, or None."""
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        cursor.execute(sql("SELECT summary, folded_until FROM ai_memory WHERE name = %s"), (name,))
+        return cursor.fetchone()
+    finally:
+        mycon.close()
+
+
+def memory_save(name, summary, folded_until):
+    """Queue an upsert of a memory's summary through the log writer."""
+    statement = storage.get_backend().upsert("ai_memory", MEMORY_COLUMNS, "name")
+    return _get_writer().submit(statement, (name, summary, folded_until))
+
+
+def recent_turns(after, limit, source="default"):
+    """Return up to `limit` (command, response, timestamp) rows, newest-first.
+
+    Only rows of conversation `source` logged after `after` are returned
+    (all of them when None). Served by idx_ai_log_ts_id, so this walks
+    the newest index entries rather than scanning the table.
+    """
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        if after is None:
+            cursor.execute(
+                sql("SELECT command, response, timestamp FROM ai_log WHERE source = %s "
+                    "ORDER BY timestamp DESC, id DESC LIMIT %s"),
+                (source, limit),
+            )
+        else:
+            cursor.execute(
+                sql("SELECT command, response, timestamp FROM ai_log "
+                    "WHERE source = %s AND timestamp > %s "
+                    "ORDER BY timestamp DESC, id DESC LIMIT %s"),
+                (source, after, limit),
+            )
+        return cursor.fetchall()
+    finally:
+        mycon.close()
+
+
+def timings(since, until=None):
+    """Return (stage, ms) rows from `ai_timing` logged in a time window."""
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        if until is None:
+            cursor.execute(sql("SELECT stage, ms FROM ai_timing WHERE log_at >= %s"), (since,))
+        else:
+            cursor.execute(
+                sql("SELECT stage, ms FROM ai_timing WHERE log_at >= %s AND log_at < %s"),
+                (since, until),
+            )
+        return cursor.fetchall()
+    finally:
+        mycon.close()
+
+
+def close(timeout=10):
+    """Drain pending log rows and stop the background writer."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None and writer.is_alive():
+        writer.stop(timeout)
+
+
+# Registered once: `close` is a no-op without a writer, and a writer
+# started again after `close` is still drained at exit
+atexit.register(close)
+
+
+# Keyset pagination on (timestamp, id), served by idx_ai_log_ts_id. The
+# expanded OR form lets the database use a range scan on the index
+# instead of sorting the whole table.
+FIRST_PAGE = (
+    "SELECT id, command, response, timestamp FROM ai_log "
+    "ORDER BY timestamp DESC, id DESC LIMIT %s"
+)
+NEXT_PAGE = (
+    "SELECT id, command, response, timestamp FROM ai_log "
+    "WHERE timestamp < %s OR (timestamp = %s AND id < %s) "
+    "ORDER BY timestamp DESC, id DESC LIMIT %s"
+)
+
+
+def iter_history_pages(page_size=HISTORY_PAGE_SIZE, include_archive=True):
+    """Yield chat logs newest-first as lists of at most `page_size` rows.
+
+    Each page is a separate keyset query that resumes after the last
+    (timestamp, id) seen, so memory use stays bounded by one page no
+    matter how large `ai_log` grows. Months already moved out of the
+    table by `retention.py` follow, read from the archive files.
+
+    Args:
+        page_size: Rows per page.
+        include_archive: Continue into archived months after the table.
+
+    Yields:
+        Lists of (id, command, response, timestamp) tuples.
+    """
+    yield from _iter_live_pages(page_size)
+    if include_archive:
+        yield from archive.iter_pages(page_size)
+
+
+def _iter_live_pages(page_size):
+    mycon = get_connection()
+    try:
+        # Streaming cursor: rows are fetched as they are read rather
+        # than copied client-side up front.
+        cursor = storage.get_backend().streaming_cursor(mycon)
+        last = None
+        while True:
+            if last is None:
+                cursor.execute(sql(FIRST_PAGE), (page_size,))
+            else:
+                ts, row_id = last
+                cursor.execute(sql(NEXT_PAGE), (ts, ts, row_id, page_size))
+
+            page = []
+            row = cursor.fetchone()
+            while row is not None:
+                page.append(row)
+                row = cursor.fetchone()
+
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last = (page[-1][3], page[-1][0])
+    finally:
+        mycon.close()
+
+
+def iter_history(page_size=HISTORY_PAGE_SIZE, include_archive=True):
+    """Yield chat log rows one at a time, newest-first."""
+    for page in iter_history_pages(page_size, include_archive):
+        yield from page
+
+
+def iter_log_range(start, end, page_size=HISTORY_PAGE_SIZE):
+    """Yield pages of rows logged in [start, end), newest first.
+
+    The same keyset walk as `iter_history_pages`, bounded to one time
+    range (a month being archived by `retention.py`). On a partitioned
+    table only the matching partition is read.
+
+    Yields:
+        Lists of (id, command, response, timestamp) tuples.
+    """
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        cursor.execute(
+            sql("SELECT id, command, response, timestamp FROM ai_log "
+                "WHERE timestamp >= %s AND timestamp < %s "
+                "ORDER BY timestamp DESC, id DESC LIMIT %s"),
+            (start, end, page_size),
+        )
+        page = cursor.fetchall()
+        while page:
+            yield page
+            if len(page) < page_size:
+                return
+            ts, row_id = page[-1][3], page[-1][0]
+            cursor.execute(
+                sql("SELECT id, command, response, timestamp FROM ai_log "
+                    "WHERE timestamp >= %s AND (timestamp < %s OR (timestamp = %s AND id < %s)) "
+                    "ORDER BY timestamp DESC, id DESC LIMIT %s"),
+                (start, ts, ts, row_id, page_size),
+            )
+            page = cursor.fetchall()
+    finally:
+        mycon.close()
+
+
+def iter_log_since(after_id, page_size=HISTORY_PAGE_SIZE):
+    """Yield pages of rows with id > `after_id`, oldest first.
+
+    A primary-key range scan, used to catch up incremental consumers
+    (the embedded search index) on rows they have not seen yet.
+
+    Yields:
+        Lists of (id, command, response, timestamp) tuples.
+    """
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        while True:
+            cursor.execute(
+                sql("SELECT id, command, response, timestamp FROM ai_log "
+                    "WHERE id > %s ORDER BY id LIMIT %s"),
+                (after_id, page_size),
+            )
+            page = cursor.fetchall()
+            if not page:
+                return
+            yield page
+            after_id = page[-1][0]
+    finally:
+        mycon.close()
+
+
+def fetch_log_rows(ids):
+    """Return {id: (command, response, timestamp)} for the `ai_log` rows in `ids`.
+
+    Ids with no row (e.g. moved to the archive since) are left out.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        cursor.execute(
+            sql("SELECT id, command, response, timestamp FROM ai_log "
+                "WHERE id IN (" + ", ".join(["%s"] * len(ids)) + ")"),
+            ids,
+        )
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        mycon.close()
+
+
+def search_history(words, limit, since=None, until=None):
+    """Rank `ai_log` rows against `words` with the FULLTEXT index.
+
+    Natural-language mode scores rows by relevance; LIMIT keeps the
+    result to the top matches, and the date range is applied in the
+    same query.
+
+    Returns:
+        A list of (id, command, response, timestamp, score), best first.
+
+    Raises:
+        FullTextUnavailable: The backend has no FULLTEXT index on
+            `ai_log`; use the embedded index in `history_search` instead.
+    """
+    if not supports_fulltext():
+        raise FullTextUnavailable(f"{storage.get_backend().name} has no FULLTEXT index on ai_log")
+    where = ["MATCH (command, response) AGAINST (%s IN NATURAL LANGUAGE MODE)"]
+    params = [words]
+    if since is not None:
+        where.append("timestamp >= %s")
+        params.append(since)
+    if until is not None:
+        where.append("timestamp < %s")
+        params.append(until)
+    statement = (
+        "SELECT id, command, response, timestamp, "
+        "MATCH (command, response) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score "
+        "FROM ai_log WHERE " + " AND ".join(where) + " ORDER BY score DESC LIMIT %s"
+    )
+    mycon = get_connection()
+    try:
+        cursor = mycon.cursor()
+        try:
+            cursor.execute(statement, [words] + params + [limit])
+        except Exception as e:
+            # 1191: "Can't find FULLTEXT index matching the column list"
+            if getattr(e, "errno", None) == 1191:
+                raise FullTextUnavailable("ai_log has no FULLTEXT index (run db_setup.py)") from e
+            raise
+        return cursor.fetchall()
+    finally:
+        mycon.close()
 
 
 def fetch_logs():
     """Return all chat logs ordered newest-first.
 
+    This materializes the whole history, archives included; prefer `iter_history` or
+    `iter_history_pages` for anything that may be large.
+
     Returns:
         A list of rows from `ai_log` as tuples: (id, command, response, timestamp).
     """
-    mycon = mysql.connect(
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        database=DB_NAME,
-    )
-    cursor = mycon.cursor()
-
-    query = "SELECT * FROM ai_log ORDER BY timestamp DESC"
-    cursor.execute(query)
-    logs = cursor.fetchall()
-    mycon.close()
-    return logs
\ No newline at end of file
+    return list(iter_history())
@@ -1,48 +1,272 @@
-"""Initialize the MySQL database and create required tables.
+"""Initialize the database and create required tables.
 
 This script is intended to be run once when installing or setting up the
-assistant. It creates the database (if missing) and a single table
-`ai_log` that stores user commands, AI responses and timestamps.
+assistant. For the MySQL backend it creates the database (if missing),
+the `ai_log` table that stores user commands, AI responses and
+timestamps, and the cache/memory tables next to it. For the SQLite
+backend it creates the database file with the same tables.
 
 Usage: run this script with a Python interpreter that has access to
-the MySQL server configured in `config.py`.
+the database configured in `config.py` (`DB_BACKEND`).
 """
 
-# Standard MySQL connector import (DB-API)
-import mysql.connector as mysql
+import datetime
+
 # Import DB credentials from project config
-from config import DB_USER, DB_PASSWORD, DB_HOST, DB_NAME
-
-# Connect to MySQL server (not selecting a database yet)
-mycon = mysql.connect(
-    host=DB_HOST,
-    user=DB_USER,
-    password=DB_PASSWORD
-)
-
-# Cursor used to execute SQL statements
-cursor = mycon.cursor()
-
-# Create the database if it does not already exist
-cursor.execute("CREATE DATABASE IF NOT EXISTS {}".format(DB_NAME))
-mycon.commit()
-print("Database created successfully!")
-
-# Switch the connection to use the newly created (or existing) database
-cursor.execute("USE {}".format(DB_NAME))
-mycon.commit()
-
-# Create a simple table to store AI interaction logs
-query2 = """CREATE TABLE IF NOT EXISTS ai_log (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    command VARCHAR(255) NOT NULL,
-    response TEXT NOT NULL,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)
-"""
-cursor.execute(query2)
-mycon.commit()
-print("Table 'ai_log' created successfully!")
+from config import DB_BACKEND, DB_USER, DB_PASSWORD, DB_HOST, DB_NAME, LOG_PARTITIONED, LOG_PARTITIONS_AHEAD
+
+
+def index_exists(cursor, table, index):
+    """Return True if `index` is already defined on `table`."""
+    cursor.execute(
+        "SELECT 1 FROM information_schema.statistics "
+        "WHERE table_schema = %s AND table_name = %s AND index_name = %s LIMIT 1",
+        (DB_NAME, table, index),
+    )
+    return cursor.fetchone() is not None
+
+
+def column_exists(cursor, table, column):
+    """Return True if `table` already has `column`."""
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = %s AND table_name = %s AND column_name = %s LIMIT 1",
+        (DB_NAME, table, column),
+    )
+    return cursor.fetchone() is not None
+
+
+def add_source_column(cursor, mycon):
+    """Migration for tables created before turns were tagged with a source.
+
+    `source` names the conversation a turn belongs to ("default" for the
+    local voice user, "session-ID" for `server.py` clients), so memory
+    reloads only its own turns after a restart.
+    """
+    if not column_exists(cursor, "ai_log", "source"):
+        cursor.execute("ALTER TABLE ai_log ADD COLUMN source VARCHAR(40) NOT NULL DEFAULT 'default'")
+        mycon.commit()
+        print("Column 'source' added to 'ai_log'.")
+
+
+def setup_log(cursor, mycon):
+    """Create the unpartitioned `ai_log` table and its indexes."""
+    # Create a simple table to store AI interaction logs
+    query2 = """CREATE TABLE IF NOT EXISTS ai_log (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        command VARCHAR(255) NOT NULL,
+        response TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        source VARCHAR(40) NOT NULL DEFAULT 'default',
+        INDEX idx_ai_log_ts_id (timestamp, id),
+        FULLTEXT INDEX ft_ai_log_text (command, response)
+    )
+    """
+    cursor.execute(query2)
+    mycon.commit()
+    print("Table 'ai_log' created successfully!")
+
+    # Migration for tables created before the history index existed. The
+    # (timestamp, id) index backs keyset pagination in `db.iter_history`.
+    if not index_exists(cursor, "ai_log", "idx_ai_log_ts_id"):
+        cursor.execute("CREATE INDEX idx_ai_log_ts_id ON ai_log (timestamp, id)")
+        mycon.commit()
+        print("Index 'idx_ai_log_ts_id' added to 'ai_log'.")
+
+    # Migration for the FULLTEXT index behind "search my history" (see
+    # `history_search.py`). Building it on a large table takes a while.
+    if not index_exists(cursor, "ai_log", "ft_ai_log_text"):
+        cursor.execute("CREATE FULLTEXT INDEX ft_ai_log_text ON ai_log (command, response)")
+        mycon.commit()
+        print("Index 'ft_ai_log_text' added to 'ai_log'.")
+
+
+def setup_partitioned_log(cursor, mycon):
+    """Create `ai_log` partitioned by month, or convert an existing table.
+
+    Each month lives in its own partition (`pYYYYMM`), so `retention.py`
+    can drop a whole month at once after archiving it. MySQL requires
+    the partitioning column in every unique key, hence the (id, timestamp)
+    primary key, and has no FULLTEXT indexes on partitioned tables.
+    """
+    import retention
+
+    this_month = retention.month_start(datetime.datetime.now())
+    last = retention.add_months(this_month, LOG_PARTITIONS_AHEAD)
+
+    cursor.execute("SHOW TABLES LIKE 'ai_log'")
+    if cursor.fetchone() is None:
+        cursor.execute(f"""CREATE TABLE ai_log (
+        id INT AUTO_INCREMENT,
+        command VARCHAR(255) NOT NULL,
+        response TEXT NOT NULL,
+        timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        source VARCHAR(40) NOT NULL DEFAULT 'default',
+        PRIMARY KEY (id, timestamp),
+        INDEX idx_ai_log_ts_id (timestamp, id)
+    )
+    {retention.partition_clause(this_month, last)}
+    """)
+        mycon.commit()
+        print("Table 'ai_log' created successfully (partitioned by month)!")
+        return
+
+    if retention.partitions(cursor):
+        print("Table 'ai_log' is already partitioned.")
+        return
+
+    # Migration for an existing unpartitioned table. This rebuilds the
+    # table, which takes a while when it is large.
+    if index_exists(cursor, "ai_log", "ft_ai_log_text"):
+        cursor.execute("DROP INDEX ft_ai_log_text ON ai_log")
+    if not index_exists(cursor, "ai_log", "idx_ai_log_ts_id"):
+        cursor.execute("CREATE INDEX idx_ai_log_ts_id ON ai_log (timestamp, id)")
+    cursor.execute(
+        "ALTER TABLE ai_log MODIFY timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)"
+    )
+    cursor.execute("SELECT MIN(timestamp) FROM ai_log")
+    oldest = cursor.fetchone()[0]
+    # The first partition also holds everything older than its month
+    first = retention.month_start(oldest) if oldest else this_month
+    cursor.execute(f"ALTER TABLE ai_log {retention.partition_clause(first, last)}")
+    mycon.commit()
+    print("Table 'ai_log' partitioned by month.")
+
+
+def setup_partitioned_timing(cursor, mycon):
+    """Create `ai_timing` partitioned by month on `log_at`, or convert it.
+
+    Lets `retention.py` prune timings by dropping whole months, like
+    `ai_log`, instead of deleting them row by row.
+    """
+    import retention
+
+    this_month = retention.month_start(datetime.datetime.now())
+    last = retention.add_months(this_month, LOG_PARTITIONS_AHEAD)
+    column = retention.PARTITIONED_TABLES["ai_timing"]
+
+    cursor.execute("SHOW TABLES LIKE 'ai_timing'")
+    if cursor.fetchone() is None:
+        cursor.execute(f"""CREATE TABLE ai_timing (
+        id INT AUTO_INCREMENT,
+        log_at DATETIME NOT NULL,
+        stage VARCHAR(32) NOT NULL,
+        ms DOUBLE NOT NULL,
+        PRIMARY KEY (id, log_at),
+        INDEX idx_ai_timing_log_at (log_at)
+    )
+    {retention.partition_clause(this_month, last, column)}
+    """)
+        mycon.commit()
+        print("Table 'ai_timing' created successfully (partitioned by month)!")
+        return
+
+    if retention.partitions(cursor, "ai_timing"):
+        print("Table 'ai_timing' is already partitioned.")
+        return
+
+    # Migration for an existing unpartitioned table (rebuilds it)
+    cursor.execute("ALTER TABLE ai_timing DROP PRIMARY KEY, ADD PRIMARY KEY (id, log_at)")
+    cursor.execute("SELECT MIN(log_at) FROM ai_timing")
+    oldest = cursor.fetchone()[0]
+    first = retention.month_start(oldest) if oldest else this_month
+    cursor.execute(f"ALTER TABLE ai_timing {retention.partition_clause(first, last, column)}")
+    mycon.commit()
+    print("Table 'ai_timing' partitioned by month.")
+
+
+def setup_mysql():
+    """Create the MySQL database, tables and indexes (idempotent)."""
+    # Standard MySQL connector import (DB-API)
+    import mysql.connector as mysql
+
+    # Connect to MySQL server (not selecting a database yet)
+    mycon = mysql.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+
+    # Cursor used to execute SQL statements
+    cursor = mycon.cursor()
+
+    # Create the database if it does not already exist
+    cursor.execute("CREATE DATABASE IF NOT EXISTS {}".format(DB_NAME))
+    mycon.commit()
+    print("Database created successfully!")
+
+    # Switch the connection to use the newly created (or existing) database
+    cursor.execute("USE {}".format(DB_NAME))
+    mycon.commit()
+
+    if LOG_PARTITIONED:
+        setup_partitioned_log(cursor, mycon)
+    else:
+        setup_log(cursor, mycon)
+    add_source_column(cursor, mycon)
+
+    # Persistent tier of the AI response cache. Keys are hashes of the
+    # normalized prompt and system prompt version (see `response_cache.py`).
+    query3 = """CREATE TABLE IF NOT EXISTS ai_cache (
+        cache_key CHAR(64) PRIMARY KEY,
+        prompt VARCHAR(255) NOT NULL,
+        response TEXT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        INDEX idx_ai_cache_expires (expires_at)
+    )
+    """
+    cursor.execute(query3)
+    mycon.commit()
+    print("Table 'ai_cache' created successfully!")
+
+    # Rolling summary of older conversation turns (see `memory.py`).
+    # `folded_until` is the timestamp of the newest `ai_log` turn already in
+    # the summary; later turns are read back verbatim.
+    query4 = """CREATE TABLE IF NOT EXISTS ai_memory (
+        name VARCHAR(32) PRIMARY KEY,
+        summary TEXT NOT NULL,
+        folded_until DATETIME NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """
+    cursor.execute(query4)
+    mycon.commit()
+    print("Table 'ai_memory' created successfully!")
+
+    # Per-stage timings of each turn (see `tracing.py`). `log_at` is the
+    # timestamp of the matching `ai_log` row. DATETIME keeps whole seconds,
+    # so it places timings in time for reports but can't reliably join
+    # them back to a single `ai_log` row. Partitioned like `ai_log`.
+    if LOG_PARTITIONED:
+        setup_partitioned_timing(cursor, mycon)
+    else:
+        query5 = """CREATE TABLE IF NOT EXISTS ai_timing (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            log_at DATETIME NOT NULL,
+            stage VARCHAR(32) NOT NULL,
+            ms DOUBLE NOT NULL,
+            INDEX idx_ai_timing_log_at (log_at)
+        )
+        """
+        cursor.execute(query5)
+        mycon.commit()
+        print("Table 'ai_timing' created successfully!")
+
+    # Close connection cleanly
+    mycon.close()
+
+
+def setup_sqlite():
+    """Create the SQLite database file and its tables (idempotent)."""
+    import storage
+
+    backend = storage.SQLiteBackend()
+    backend.connect()  # the first connection creates the schema
+    print(f"SQLite database '{backend.path}' ready (WAL mode).")
+
 
-# Close connection cleanly
-mycon.close()
\ No newline at end of file
+if DB_BACKEND == "sqlite":
+    setup_sqlite()
+else:
+    setup_mysql()
@@ -0,0 +1,251 @@
+"""Incremental export of `ai_log` to compressed JSONL or Parquet.
+
+Each destination keeps a watermark in `EXPORT_STATE`: the id and
+timestamp of the last row it received. A run reads only rows after
+that id (`db.iter_log_since`, a primary-key range scan streamed page by
+page) and appends them, so a nightly export costs as much as the day's
+new rows, not the whole table. Rows after the watermark that
+`retention.py` has already moved to `archive/` (all archived rows for a
+first or `--full` export) are read from the archive files first, so an
+export never misses rows retention dropped from the table.
+
+* "jsonl": one gzip-compressed JSON object per line. Every run appends
+  a new gzip member to the same file (readers such as `gzip.open` or
+  `zcat` see one continuous stream). The watermark also records the
+  file size, and a run first truncates anything past it, so an export
+  interrupted before its watermark was saved can't leave duplicates.
+* "parquet": a directory of `part-<first id>-<last id>.parquet` files,
+  one per run, written in row groups of `EXPORT_ROW_GROUP` rows.
+  Requires `pyarrow`.
+
+Nothing here touches voice or display, so it runs headless, e.g. from
+cron:
+
+    python export.py --format jsonl
+    0 2 * * * cd /path/to/Jarvis1.0 && python export.py --format parquet
+"""
+
+import datetime
+import glob
+import gzip
+import itertools
+import json
+import os
+
+import archive
+import db
+from config import EXPORT_FORMAT, EXPORT_DIR, EXPORT_STATE, EXPORT_ROW_GROUP, HISTORY_PAGE_SIZE
+
+FORMATS = ("jsonl", "parquet")
+
+
+def load_state(path=EXPORT_STATE):
+    """Return {destination: watermark} from the state file."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state, path=EXPORT_STATE):
+    """Write the state file atomically (temp file, then rename)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def default_out(fmt):
+    """Default destination for `fmt` inside EXPORT_DIR."""
+    return os.path.join(EXPORT_DIR, "ai_log.jsonl.gz" if fmt == "jsonl" else "ai_log-parquet")
+
+
+def destination_key(out, fmt):
+    return f"{fmt}:{os.path.abspath(out)}"
+
+
+def write_jsonl(out, pages, size):
+    """Append rows to a gzip JSONL file, starting at byte `size`.
+
+    Returns:
+        (row count, last row, new file size).
+    """
+    directory = os.path.dirname(out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    last = None
+    with open(out, "ab") as raw:
+        # Drop the tail of a run that never saved its watermark
+        raw.truncate(size)
+        raw.seek(size)
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            for page in pages:
+                lines = [
+                    json.dumps({
+                        "id": row_id,
+                        "command": command,
+                        "response": response,
+                        "timestamp": timestamp.isoformat(" "),
+                    })
+                    for row_id, command, response, timestamp in page
+                ]
+                f.write(("\n".join(lines) + "\n").encode("utf-8"))
+                count += len(page)
+                last = page[-1]
+        raw.flush()
+        os.fsync(raw.fileno())
+        size = raw.tell()
+    return count, last, size
+
+
+def write_parquet(out, pages, row_group=EXPORT_ROW_GROUP):
+    """Write rows to a new part file in the `out` directory.
+
+    Pages from the database are gathered into row groups of `row_group`
+    rows, so at most one row group is held in memory.
+
+    Returns:
+        (row count, last row, part file path or None).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("command", pa.string()),
+        ("response", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+    os.makedirs(out, exist_ok=True)
+    tmp = os.path.join(out, ".part.tmp")
+    writer = None
+    buffered = []
+    count = 0
+    first = last = None
+
+    def flush():
+        columns = zip(*buffered)
+        arrays = [pa.array(values, field.type) for values, field in zip(columns, schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        buffered.clear()
+
+    try:
+        for page in pages:
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+                first = page[0]
+            buffered.extend(page)
+            count += len(page)
+            last = page[-1]
+            if len(buffered) >= row_group:
+                flush()
+        if writer is None:
+            return 0, None, None
+        if buffered:
+            flush()
+        writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp)
+        raise
+    path = os.path.join(out, f"part-{first[0]:012d}-{last[0]:012d}.parquet")
+    os.replace(tmp, path)
+    return count, last, path
+
+
+def pages_since(mark, page_size=HISTORY_PAGE_SIZE):
+    """Yield pages of rows after the watermark `mark`, oldest first.
+
+    Archived rows come first, then the live table. If a month is in both
+    (retention stopped between archiving and dropping it), the live rows
+    the archive already gave are skipped. `mark["last_id"]` follows the
+    highest id yielded: archived rows logged late can have higher ids
+    than the live rows after them.
+    """
+    after_id = mark.get("last_id", 0)
+    archived = set()
+    for page in archive.iter_pages_since(after_id, page_size):
+        archived.update(row[0] for row in page)
+        mark["last_id"] = max(mark.get("last_id", 0), max(row[0] for row in page))
+        yield page
+    for page in db.iter_log_since(after_id, page_size):
+        page = [row for row in page if row[0] not in archived]
+        if page:
+            mark["last_id"] = max(mark.get("last_id", 0), page[-1][0])
+            yield page
+
+
+def export(out=None, fmt=EXPORT_FORMAT, full=False, state_path=EXPORT_STATE,
+           page_size=HISTORY_PAGE_SIZE):
+    """Export `ai_log` rows added since the last run to `out`.
+
+    Args:
+        out: Destination file (jsonl) or directory (parquet); defaults
+            to `default_out(fmt)`.
+        fmt: "jsonl" or "parquet".
+        full: Ignore the watermark and export everything again,
+            replacing what the destination holds.
+        state_path: Watermark file shared by all destinations.
+        page_size: Rows read from the database per page.
+
+    Returns:
+        The number of rows exported.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; use one of {', '.join(FORMATS)}")
+    out = out or default_out(fmt)
+    state = load_state(state_path)
+    key = destination_key(out, fmt)
+    mark = {} if full else state.get(key, {})
+    if not os.path.exists(out) or (fmt == "jsonl" and os.path.getsize(out) < mark.get("bytes", 0)):
+        # The destination was removed or replaced: start it over
+        mark = {}
+    if not mark and fmt == "parquet":
+        for part in glob.glob(os.path.join(out, "part-*.parquet")):
+            os.remove(part)
+
+    pages = pages_since(mark, page_size)
+    first_page = next(pages, None)
+    if first_page is None:
+        count, last = 0, None
+    elif fmt == "jsonl":
+        count, last, size = write_jsonl(out, itertools.chain([first_page], pages), mark.get("bytes", 0))
+        mark["bytes"] = size
+    else:
+        count, last, _ = write_parquet(out, itertools.chain([first_page], pages))
+
+    if last is not None:
+        mark["last_timestamp"] = last[3].isoformat(" ")
+    mark["rows"] = mark.get("rows", 0) + count
+    mark["exported_at"] = datetime.datetime.now().isoformat(" ", "seconds")
+    state[key] = mark
+    save_state(state, state_path)
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Export new ai_log rows since the last run")
+    parser.add_argument("--format", dest="fmt", choices=FORMATS, default=EXPORT_FORMAT)
+    parser.add_argument("--out", help="destination file (jsonl) or directory (parquet)")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and export everything")
+    parser.add_argument("--state", default=EXPORT_STATE, help="watermark file")
+    args = parser.parse_args()
+
+    out = args.out or default_out(args.fmt)
+    start = time.perf_counter()
+    try:
+        exported = export(out, args.fmt, args.full, args.state)
+    finally:
+        db.close()
+    print(f"Exported {exported} rows to {out} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,167 @@
+"""Local stand-in for the Gemini REST API, for tests and benchmarks.
+
+Serves `models/<model>:generateContent` and
+`models/<model>:streamGenerateContent?alt=sse` with configurable
+latency, jitter and failure rate, so the resilience layer (deadlines,
+retries, hedging, circuit breaker) can be exercised without network
+access. Point the client at it with `GEMINI_BASE_URL` in `config.py`.
+
+Usage: python fake_gemini.py [--port 8765] [--latency 0.2] [--jitter 0.1]
+                             [--error-rate 0.0] [--reply "text"]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "This is a reply from the fake model. It has two sentences."
+
+
+class FakeGemini:
+    """Behaviour knobs shared by all request handlers."""
+
+    def __init__(self, latency=0.2, jitter=0.0, error_rate=0.0, reply=DEFAULT_REPLY,
+                 chunk_delay=0.05, slow_every=0, slow_latency=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+        # Every `slow_every`-th request (0 = none) takes `slow_latency`
+        # seconds instead, for a predictable latency tail
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        # Requests still to fail with 503 before `error_rate` applies again
+        self.fail_next = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def delay(self, number):
+        if self.slow_every and number % self.slow_every == 0:
+            time.sleep(self.slow_latency)
+            return
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self):
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+        return random.random() < self.error_rate
+
+    def reply_for(self, body):
+        """Return the configured reply, or a JSON array for batched prompts."""
+        config = body.get("generationConfig", {})
+        if config.get("responseMimeType") == "application/json":
+            text = body["contents"][0]["parts"][0]["text"]
+            questions = [line for line in text.splitlines() if line[:1].isdigit()]
+            return json.dumps([f"{self.reply} ({q})" for q in questions])
+        return self.reply
+
+
+def response_json(text, prompt_tokens=0):
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": len(text.split()),
+            "totalTokenCount": prompt_tokens + len(text.split()),
+        },
+    }
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without TCP_NODELAY
+        # the body waits ~40 ms for the client's delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass  # keep benchmark output clean
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            with fake._lock:
+                fake.requests += 1
+                number = fake.requests
+            prompt_tokens = len(json.dumps([body.get("systemInstruction"), body.get("contents")]).split())
+
+            fake.delay(number)
+            if fake.should_fail():
+                self._send_json(503, {"error": {"code": 503, "message": "fake overload",
+                                                "status": "UNAVAILABLE"}})
+                return
+
+            text = fake.reply_for(body)
+            if ":streamGenerateContent" in self.path:
+                self._stream(text, prompt_tokens)
+            elif ":generateContent" in self.path:
+                self._send_json(200, response_json(text, prompt_tokens))
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "unknown method",
+                                                "status": "NOT_FOUND"}})
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, text, prompt_tokens):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = text.split(" ")
+            for i in range(0, len(words), 4):
+                piece = " ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
+                event = f"data: {json.dumps(response_json(piece, prompt_tokens))}\r\n\r\n"
+                self._chunk(event.encode("utf-8"))
+                time.sleep(fake.chunk_delay)
+            self._chunk(b"")
+
+        def _chunk(self, data):
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(fake=None, host="127.0.0.1", port=8765):
+    """Start the fake server in a daemon thread and return the server.
+
+    `port=0` picks a free port; read it from `server.server_address`.
+    """
+    fake = fake or FakeGemini()
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before replying")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of latency noise")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 replies")
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    args = parser.parse_args()
+
+    server = serve(FakeGemini(args.latency, args.jitter, args.error_rate, args.reply), port=args.port)
+    print(f"Fake Gemini listening on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
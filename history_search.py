@@ -0,0 +1,262 @@
+"""Full-text search over past interactions in `ai_log`.
+
+`search` returns the top-k interactions matching some words, optionally
+limited to a date range:
+
+* on MySQL it uses the FULLTEXT index on (command, response) created by
+  `db_setup.py`, ranked by MATCH ... AGAINST relevance,
+* otherwise (SQLite backend, no FULLTEXT index, or
+  `HISTORY_SEARCH = "embedded"`, which is the case with the default
+  `LOG_PARTITIONED`) it uses an in-process `InvertedIndex` ranked with
+  BM25. The index is built from the log in a background thread (started
+  at startup by `prewarm`, or by the first search) and then only reads
+  rows added since, using the id watermark. Searches made while the
+  first build is running answer from the rows indexed so far instead of
+  waiting.
+
+The index keeps postings (row ids and term frequencies), document
+lengths and timestamps, not the text: its memory grows with the number
+of distinct (term, row) pairs, and the command and response of the top
+hits are read back from `ai_log` by id.
+
+Both cover the live `ai_log` table only; months that `retention.py` has
+moved to `archive/` are not searched.
+
+`parse_query` turns a spoken request ("search my history for pasta
+last week") into search words and a date range.
+"""
+
+import datetime
+import heapq
+import math
+import re
+import threading
+
+import db
+from config import HISTORY_SEARCH, HISTORY_SEARCH_LIMIT
+
+# Common words carry no signal and make posting lists huge
+STOPWORDS = frozenset(
+    "a an and are as at be by did do for from how i in is it me my of on or "
+    "that the this to was what when where which who why with you your".split()
+)
+
+
+def tokenize(text):
+    """Lowercase words of `text`, without stopwords."""
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS]
+
+
+class InvertedIndex:
+    """In-memory BM25 index of (command, response) documents.
+
+    Only postings are kept; `load` returns the text of the top hits.
+
+    Attributes:
+        postings: term -> {doc id: term frequency}.
+        lengths: doc id -> number of indexed terms.
+        timestamps: doc id -> timestamp, for date ranges and retention.
+        last_id: Highest `ai_log` id indexed so far.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, load=None):
+        # ids -> {id: (command, response, timestamp)}
+        self.load = load or db.fetch_log_rows
+        self.postings = {}
+        self.lengths = {}
+        self.timestamps = {}
+        self.total_length = 0
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, doc_id, command, response, timestamp):
+        terms = tokenize(command) + tokenize(response)
+        with self._lock:
+            if doc_id in self.lengths:
+                return
+            self.timestamps[doc_id] = timestamp
+            self.lengths[doc_id] = len(terms)
+            self.total_length += len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            self.last_id = max(self.last_id, doc_id)
+
+    def remove_before(self, timestamp):
+        """Drop documents older than `timestamp` (e.g. after retention)."""
+        with self._lock:
+            old = {d for d, ts in self.timestamps.items() if ts is not None and ts < timestamp}
+            if not old:
+                return 0
+            for doc_id in old:
+                del self.timestamps[doc_id]
+                self.total_length -= self.lengths.pop(doc_id)
+            # Without the text, which terms a document had is unknown:
+            # one pass over the postings (retention runs daily)
+            for term in list(self.postings):
+                posting = self.postings[term]
+                for doc_id in old.intersection(posting):
+                    del posting[doc_id]
+                if not posting:
+                    del self.postings[term]
+        return len(old)
+
+    def search(self, words, limit=HISTORY_SEARCH_LIMIT, since=None, until=None):
+        """Return up to `limit` (id, command, response, timestamp, score), best first.
+
+        Ranking uses the index alone; one `load` call then reads the
+        text of the winners. Hits whose row is gone are skipped.
+        """
+        terms = set(tokenize(words))
+        with self._lock:
+            count = len(self.lengths)
+            if not count or not terms:
+                return []
+            average = self.total_length / count
+            scores = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * self.lengths[doc_id] / average)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / norm
+
+            def in_range(doc_id):
+                ts = self.timestamps[doc_id]
+                return (since is None or ts >= since) and (until is None or ts < until)
+
+            hits = (d for d in scores if (since is None and until is None) or in_range(d))
+            best = heapq.nlargest(limit, hits, key=scores.__getitem__)
+        rows = self.load(best) if best else {}
+        return [(d, *rows[d], scores[d]) for d in best if d in rows]
+
+
+_index = None
+_index_lock = threading.Lock()
+_update_lock = threading.Lock()    # one catch-up with the log at a time
+_built = threading.Event()         # the first (full) build has finished
+
+
+def _catch_up():
+    with _update_lock:
+        for page in db.iter_log_since(_index.last_id):
+            for row_id, command, response, timestamp in page:
+                _index.add(row_id, command, response, timestamp)
+
+
+def _build():
+    try:
+        _catch_up()
+    except Exception as e:
+        print("History index build error:", e)
+    finally:
+        _built.set()
+
+
+def start_index():
+    """Create the shared index and build it from the log in a daemon thread."""
+    global _index
+    with _index_lock:
+        if _index is not None:
+            return _index
+        _index = InvertedIndex()
+    threading.Thread(target=_build, name="jarvis-history-index", daemon=True).start()
+    return _index
+
+
+def building():
+    """True while the first build of the embedded index is running."""
+    return _index is not None and not _built.is_set()
+
+
+def prewarm():
+    """Start building the index at startup if searches will use it."""
+    if HISTORY_SEARCH == "embedded" or not db.supports_fulltext():
+        start_index()
+
+
+def embedded_index():
+    """Return the shared inverted index, catching up on new log rows.
+
+    While the first build is still running the index is returned as it
+    is (rows indexed so far); after that, rows logged since the last
+    search are added first, which only reads those rows.
+    """
+    index = start_index()
+    if _built.is_set():
+        _catch_up()
+    return index
+
+
+# Set once `db.search_history` reports that the FULLTEXT index is missing
+_fulltext_missing = False
+
+
+def search(words, limit=HISTORY_SEARCH_LIMIT, since=None, until=None):
+    """Return the best matching interactions for `words`.
+
+    Args:
+        words: Free text to look for in commands and responses.
+        limit: Maximum number of results.
+        since: Only interactions at or after this datetime.
+        until: Only interactions before this datetime.
+
+    Returns:
+        A list of (id, command, response, timestamp, score), best first.
+    """
+    global _fulltext_missing
+    if HISTORY_SEARCH != "embedded" and not _fulltext_missing and db.supports_fulltext():
+        try:
+            return db.search_history(words, limit, since, until)
+        except db.FullTextUnavailable as e:
+            print(f"{e}; using the embedded index")
+            _fulltext_missing = True
+    return embedded_index().search(words, limit, since, until)
+
+
+_PREFIX = re.compile(
+    r"^.*?\b(?:search|find|look up|look through)\b(?: in)?(?: my)? (?:chat )?history\b(?: for| about)?"
+)
+_DAYS = re.compile(r"\b(?:in the )?(?:last|past) (\d+) days\b")
+
+
+def parse_query(text, now=None):
+    """Split a spoken history search into (words, since, until).
+
+    Understands "today", "yesterday", "this week", "last week",
+    "this month", "last month" and "last N days".
+    """
+    now = now or datetime.datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    text = _PREFIX.sub("", text.lower().replace("jarvis", "")).strip()
+
+    since = until = None
+    match = _DAYS.search(text)
+    if match:
+        since = today - datetime.timedelta(days=int(match.group(1)))
+        text = text.replace(match.group(0), "")
+    else:
+        week = today - datetime.timedelta(days=today.weekday())
+        month = today.replace(day=1)
+        last_month = (month - datetime.timedelta(days=1)).replace(day=1)
+        ranges = {
+            "yesterday": (today - datetime.timedelta(days=1), today),
+            "today": (today, None),
+            "last week": (week - datetime.timedelta(days=7), week),
+            "this week": (week, None),
+            "last month": (last_month, month),
+            "this month": (month, None),
+        }
+        for phrase, (start, end) in ranges.items():
+            if re.search(r"\b" + phrase + r"\b", text):
+                since, until = start, end
+                text = re.sub(r"\b(?:from |in |during )?" + phrase + r"\b", "", text)
+                break
+    return " ".join(text.split()), since, until
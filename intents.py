@@ -0,0 +1,164 @@
+"""Registry-based intent matching for routing user commands.
+
+Commands register keyword and/or regex patterns with an `IntentEngine`.
+All keywords are compiled into a single prefix-trie regex (wrapped in a
+lookahead so overlapping keywords are all seen) and all regex patterns
+into a second one, so matching a query is one scan per regex no matter
+how many intents are registered. Candidates are then scored: an intent
+matches when every `all_of` keyword and at least one `any_of` keyword
+(or one of its patterns) is present; ties go to the intent with the
+higher priority, then to the one with more hits.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Intent:
+    """A named command and the patterns that trigger it.
+
+    Attributes:
+        name: Identifier used in logs and traces.
+        handler: Callable taking the query and returning the reply text.
+        any_of: Keywords of which at least one must appear.
+        all_of: Keywords that must all appear.
+        patterns: Regexes that trigger the intent on their own.
+        priority: Higher wins when several intents match.
+        exclusive: The handler holds a spoken dialogue or affects the
+            whole system, so it must not run alongside other commands.
+    """
+
+    name: str
+    handler: object
+    any_of: tuple = ()
+    all_of: tuple = ()
+    patterns: tuple = ()
+    priority: int = 0
+    exclusive: bool = False
+    order: int = field(default=0, compare=False)
+
+
+def trie_regex(words):
+    """Build a regex matching any of `words`, factored by common prefix.
+
+    Python's `re` tries alternatives one by one, so a flat
+    "kw1|kw2|...|kwN" costs O(N) at every position. Nesting the
+    alternation as a trie means each position only explores branches
+    whose first characters actually match, and the greedy optional
+    groups return the longest keyword found.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class IntentEngine:
+    """Holds registered intents and matches queries against them."""
+
+    def __init__(self):
+        self.intents = []
+        self._keyword_re = None
+        self._pattern_re = None
+        self._keyword_hits = {}   # matched text -> [(intent index, keyword)]
+        self._pattern_owner = {}  # regex group name -> intent index
+
+    def register(self, name, handler, any_of=(), all_of=(), patterns=(), priority=0,
+                 exclusive=False):
+        """Add an intent. Keywords are matched case-insensitively as substrings."""
+        intent = Intent(
+            name=name,
+            handler=handler,
+            any_of=tuple(k.lower() for k in any_of),
+            all_of=tuple(k.lower() for k in all_of),
+            patterns=tuple(patterns),
+            priority=priority,
+            exclusive=exclusive,
+            order=len(self.intents),
+        )
+        self.intents.append(intent)
+        self._keyword_re = None  # recompile lazily on next match
+        return intent
+
+    def intent(self, name, **kwargs):
+        """Decorator form of `register`."""
+        def decorator(func):
+            self.register(name, func, **kwargs)
+            return func
+        return decorator
+
+    def _compile(self):
+        keywords = {}
+        for index, intent in enumerate(self.intents):
+            for keyword in intent.any_of + intent.all_of:
+                keywords.setdefault(keyword, []).append(index)
+
+        # The trie regex reports the longest keyword at each position;
+        # shorter keywords that prefix the matched text are credited too.
+        ordered = sorted(keywords, key=len, reverse=True)
+        self._keyword_hits = {
+            text: [(i, k) for k in ordered if text.startswith(k) for i in keywords[k]]
+            for text in ordered
+        }
+        self._keyword_re = re.compile("(?=(" + trie_regex(ordered) + "))") if ordered else None
+
+        groups = []
+        self._pattern_owner = {}
+        for index, intent in enumerate(self.intents):
+            for n, pattern in enumerate(intent.patterns):
+                group = f"i{index}_{n}"
+                self._pattern_owner[group] = index
+                groups.append(f"(?P<{group}>{pattern})")
+        self._pattern_re = re.compile("|".join(groups), re.IGNORECASE) if groups else None
+
+    def candidates(self, query):
+        """Return (intent, hits) for every intent the query satisfies."""
+        if self._keyword_re is None:
+            self._compile()
+        query = query.lower()
+
+        # Only intents that got at least one hit are considered, so the
+        # cost depends on the query, not on how many intents exist
+        seen = {}
+        pattern_hits = {}
+        if self._keyword_re is not None:
+            for match in self._keyword_re.finditer(query):
+                for index, keyword in self._keyword_hits[match.group(1)]:
+                    seen.setdefault(index, set()).add(keyword)
+        if self._pattern_re is not None:
+            for match in self._pattern_re.finditer(query):
+                index = self._pattern_owner[match.lastgroup]
+                pattern_hits[index] = pattern_hits.get(index, 0) + 1
+
+        found = []
+        for index in seen.keys() | pattern_hits.keys():
+            intent = self.intents[index]
+            keys = seen.get(index, set())
+            hits = pattern_hits.get(index, 0)
+            if not all(k in keys for k in intent.all_of):
+                continue
+            any_ok = any(k in keys for k in intent.any_of) if intent.any_of else bool(intent.all_of)
+            if any_ok or hits:
+                found.append((intent, len(keys) + hits))
+        return found
+
+    def match(self, query):
+        """Return the best matching `Intent` for `query`, or None."""
+        found = self.candidates(query)
+        if not found:
+            return None
+        # Priority first, then hit count, then registration order
+        best = max(found, key=lambda c: (c[0].priority, c[1], -c[0].order))
+        return best[0]
@@ -0,0 +1,365 @@
+"""Launcher index for "open"/"search" commands.
+
+Replaces typing into the Start menu with `keyboard` and fixed sleeps.
+A `LauncherIndex` is built once (in the background at startup) from
+
+* the configured `sites`,
+* installed applications: `.desktop` files on Linux, Start-menu
+  shortcuts on Windows,
+* recently used files (the desktop's recent-files list),
+
+and `find` returns the best entry for a spoken name:
+
+* exact and word-prefix matches come from a sorted list of names and
+  name words, searched with `bisect`,
+* misheard names ("spotfy", "libre ofice") fall back to a trigram
+  index, scored by Dice similarity.
+
+Entries are launched directly (browser, process, or the desktop's file
+opener), with no UI automation. `refresh` re-reads only the sources
+whose files changed since the last scan. `find` starts it in a
+background thread at most once every `LAUNCHER_REFRESH` seconds and
+keeps answering from the current index until the new one is ready.
+"""
+
+import bisect
+import glob
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import webbrowser
+from dataclasses import dataclass
+from xml.etree import ElementTree
+
+from config import sites, LAUNCHER_REFRESH, LAUNCHER_MIN_SCORE, LAUNCHER_RECENT_FILES, SEARCH_URL
+
+
+@dataclass(frozen=True)
+class Entry:
+    """Something that can be opened.
+
+    Attributes:
+        name: Spoken name the entry is matched on.
+        kind: "site", "app" or "file".
+        target: URL, command line or file path.
+    """
+
+    name: str
+    kind: str
+    target: str
+
+
+def normalize(text):
+    """Lowercase and reduce to words, so "LibreOffice-Writer" ~ "libreoffice writer"."""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ---- sources --------------------------------------------------------
+# Each source returns (paths to watch, loader). The loader returns
+# entries and only runs when one of the watched paths changed.
+
+def site_entries():
+    return [Entry(normalize(key), "site", url) for key, url in sites.items()]
+
+
+def _desktop_dirs():
+    data_dirs = os.environ.get("XDG_DATA_DIRS", "/usr/local/share:/usr/share").split(":")
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
+    return [os.path.join(d, "applications") for d in [data_home] + data_dirs]
+
+
+def parse_desktop_file(path):
+    """Return an app `Entry` for a .desktop file, or None if it is hidden."""
+    fields = {}
+    in_entry = False
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    # Only the main group; ignore [Desktop Action ...]
+                    in_entry = line == "[Desktop Entry]"
+                elif in_entry and "=" in line:
+                    key, value = line.split("=", 1)
+                    fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return None
+    if (
+        fields.get("Type") != "Application"
+        or fields.get("NoDisplay") == "true"
+        or fields.get("Hidden") == "true"
+        or not fields.get("Exec")
+        or not fields.get("Name")
+    ):
+        return None
+    # Drop field codes (%f, %U, ...); nothing is passed to the app
+    command = re.sub(r"%[a-zA-Z]", "", fields["Exec"]).replace("%%", "%").strip()
+    return Entry(normalize(fields["Name"]), "app", command)
+
+
+def app_entries(dirs):
+    entries = []
+    if sys.platform == "win32":
+        for d in dirs:
+            for path in glob.glob(os.path.join(d, "**", "*.lnk"), recursive=True):
+                name = os.path.splitext(os.path.basename(path))[0]
+                entries.append(Entry(normalize(name), "app", path))
+        return entries
+    for d in dirs:
+        for path in glob.glob(os.path.join(d, "**", "*.desktop"), recursive=True):
+            entry = parse_desktop_file(path)
+            if entry is not None:
+                entries.append(entry)
+    return entries
+
+
+def _app_dirs():
+    if sys.platform == "win32":
+        return [
+            os.path.join(os.environ.get("APPDATA", ""), r"Microsoft\Windows\Start Menu\Programs"),
+            os.path.join(os.environ.get("PROGRAMDATA", ""), r"Microsoft\Windows\Start Menu\Programs"),
+        ]
+    return _desktop_dirs()
+
+
+def _recent_path():
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("APPDATA", ""), r"Microsoft\Windows\Recent")
+    return os.path.join(
+        os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")),
+        "recently-used.xbel",
+    )
+
+
+def recent_entries(path, limit=LAUNCHER_RECENT_FILES):
+    """Return entries for the most recently used files."""
+    files = []
+    if sys.platform == "win32":
+        links = sorted(glob.glob(os.path.join(path, "*.lnk")), key=os.path.getmtime, reverse=True)
+        files = [(os.path.splitext(os.path.basename(p))[0], p) for p in links[:limit]]
+    else:
+        try:
+            root = ElementTree.parse(path).getroot()
+        except (OSError, ElementTree.ParseError):
+            return []
+        bookmarks = sorted(root.iter("bookmark"), key=lambda b: b.get("modified", ""), reverse=True)
+        for bookmark in bookmarks[:limit]:
+            href = bookmark.get("href", "")
+            if href.startswith("file://"):
+                local = urllib.parse.unquote(urllib.parse.urlparse(href).path)
+                files.append((os.path.splitext(os.path.basename(local))[0], local))
+    return [Entry(normalize(name), "file", target) for name, target in files if normalize(name)]
+
+
+def _stamp(paths):
+    """Cheap change detector: mtimes of the watched paths (and one level below)."""
+    stamp = []
+    for path in paths:
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+            continue
+        if os.path.isdir(path):
+            # Installing an app usually touches a subfolder, not the root
+            for child in os.scandir(path):
+                if child.is_dir():
+                    stamp.append(child.stat().st_mtime_ns)
+    return tuple(stamp)
+
+
+def default_sources():
+    return {
+        "sites": ((), site_entries),
+        "apps": (tuple(_app_dirs()), lambda: app_entries(_app_dirs())),
+        "recent": ((_recent_path(),), lambda: recent_entries(_recent_path())),
+    }
+
+
+# ---- index ----------------------------------------------------------
+
+class LauncherIndex:
+    """Prefix + trigram index over launchable entries."""
+
+    # Among equally good matches, sites beat apps and apps beat files
+    KIND_RANK = {"site": 2, "app": 1, "file": 0}
+
+    def __init__(self, sources=None, refresh_interval=LAUNCHER_REFRESH):
+        self.sources = sources if sources is not None else default_sources()
+        self.refresh_interval = refresh_interval
+        self.entries = []
+        self._by_source = {}
+        self._stamps = {}
+        self._keys = []          # sorted (key, entry index): full names and name suffixes
+        self._grams = {}         # trigram -> set of entry indexes
+        self._checked = 0.0
+        self._refreshing = False
+        # `_lock` guards the searchable index; `_refresh_lock` lets one
+        # scan run at a time without holding up `find`
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Reload sources whose files changed. Returns True if anything changed.
+
+        Sources are scanned and the new index is built without holding
+        the search lock, so `find` keeps using the old index meanwhile.
+        """
+        changed = False
+        with self._refresh_lock:
+            self._checked = time.monotonic()
+            for name, (paths, load) in self.sources.items():
+                stamp = _stamp(paths)
+                if name in self._by_source and self._stamps.get(name) == stamp:
+                    continue
+                try:
+                    self._by_source[name] = load()
+                except Exception as e:
+                    print(f"Launcher source '{name}' failed:", e)
+                    self._by_source.setdefault(name, [])
+                self._stamps[name] = stamp
+                changed = True
+            if changed:
+                index = self._build()
+                with self._lock:
+                    self.entries, self._keys, self._grams = index
+        return changed
+
+    def _build(self):
+        # Dedupe by (name, kind); the first source to list a name keeps it
+        seen = set()
+        entries = []
+        for source in self._by_source.values():
+            for entry in source:
+                if entry.name and (entry.name, entry.kind) not in seen:
+                    seen.add((entry.name, entry.kind))
+                    entries.append(entry)
+
+        keys = []
+        grams = {}
+        for i, entry in enumerate(entries):
+            words = entry.name.split()
+            # Every word boundary starts a key, so "writer" finds
+            # "libreoffice writer" by prefix as well
+            for w in range(len(words)):
+                keys.append((" ".join(words[w:]), i))
+            for gram in trigrams(entry.name):
+                grams.setdefault(gram, set()).add(i)
+        keys.sort()
+        return entries, keys, grams
+
+    def _maybe_refresh(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._checked < self.refresh_interval:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="jarvis-launcher-refresh",
+                         daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def _rank(self, index, score):
+        entry = self.entries[index]
+        # Prefer better scores, then shorter names, then sites over apps over files
+        return (score, -len(entry.name), self.KIND_RANK[entry.kind])
+
+    def find(self, query, limit=1):
+        """Return up to `limit` best entries for `query`, best first."""
+        self._maybe_refresh()
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            scores = {}
+            # Prefix matches: one bisect, then walk while keys still match
+            start = bisect.bisect_left(self._keys, (query,))
+            for key, i in self._keys[start:]:
+                if not key.startswith(query):
+                    break
+                exact = key == self.entries[i].name
+                score = 2.0 if exact else 1.0 + len(query) / len(key) / 2
+                scores[i] = max(scores.get(i, 0.0), score)
+
+            # Fuzzy matches from shared trigrams (Dice coefficient)
+            if len(scores) < limit:
+                query_grams = trigrams(query)
+                shared = {}
+                for gram in query_grams:
+                    for i in self._grams.get(gram, ()):
+                        shared[i] = shared.get(i, 0) + 1
+                for i, count in shared.items():
+                    if i in scores:
+                        continue
+                    dice = 2 * count / (len(query_grams) + len(trigrams(self.entries[i].name)))
+                    if dice >= LAUNCHER_MIN_SCORE:
+                        scores[i] = dice
+
+            best = sorted(scores, key=lambda i: self._rank(i, scores[i]), reverse=True)
+            return [self.entries[i] for i in best[:limit]]
+
+
+# ---- launching ------------------------------------------------------
+
+_browser = None
+
+
+def _get_browser():
+    global _browser
+    if _browser is None:
+        _browser = webbrowser.get()
+    return _browser
+
+
+def _open_path(path):
+    if sys.platform == "win32":
+        os.startfile(path)
+    elif sys.platform == "darwin":
+        subprocess.Popen(["open", path], start_new_session=True)
+    else:
+        subprocess.Popen(["xdg-open", path], start_new_session=True,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def launch(entry):
+    """Open `entry` directly: URL in the browser, app process, or file."""
+    if entry.kind == "site":
+        _get_browser().open(entry.target)
+    elif entry.kind == "app" and sys.platform != "win32":
+        subprocess.Popen(shlex.split(entry.target), start_new_session=True,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        # Windows shortcuts and files go to the shell's default handler
+        _open_path(entry.target)
+
+
+def web_search(query):
+    """Open a browser search for `query`."""
+    _get_browser().open(SEARCH_URL.format(urllib.parse.quote_plus(query)))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the shared index, building it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LauncherIndex()
+    return _index
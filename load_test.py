@@ -0,0 +1,153 @@
+"""Load test of the text server (`server.py`) against fake backends.
+
+Starts a `JarvisServer` in-process on a free port, with Gemini, SMTP,
+WhatsApp, the launcher and the database replaced by the latency-modelled
+fakes of `bench_e2e.py`, then connects many WebSocket clients at once.
+Each client replays the trace turn by turn: it sends a query, answers
+follow-up questions ("ask" events) from the trace's replies, and waits
+for the reply before sending the next one.
+
+It reports throughput, how many queries admission control refused, and
+p50/p95/p99 of time to the first streamed sentence, time to the full
+reply, and time spent queued for a worker.
+
+Usage:
+    python load_test.py [--clients 50] [--turns 10] [--workers 8] [--queue 32]
+                        [--ai-latency 0.3] [--think 0.0] [trace.txt]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import threading
+import time
+
+import bench_e2e
+from bench_e2e import percentile
+
+
+def start_server(args):
+    """Install the fakes and run a server in a background thread."""
+    import voice as vc
+
+    # The server sends speech to clients through `voice.speak`'s text
+    # redirect, so keep the real function rather than the bench's fake
+    speak = vc.speak
+    bench_e2e.install_fakes(args, bench_e2e.Recorder())
+    vc.speak = speak
+
+    import main
+    import server as srv
+
+    server = srv.JarvisServer(main.engine, main.main, workers=args.workers, queue_size=args.queue,
+                              session_queue=args.session_queue, max_sessions=args.clients * 2)
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=lambda: asyncio.run(server.serve("127.0.0.1", 0, ready)),
+        name="jarvis-server", daemon=True,
+    )
+    thread.start()
+    if not ready.wait(10):
+        raise RuntimeError("server did not start")
+    return server
+
+
+async def client(url, trace, turns, think, results):
+    """One simulated user: `turns` queries, one at a time."""
+    from websockets.asyncio.client import connect
+
+    offset = random.randrange(len(trace))
+    async with connect(url) as ws:
+        json.loads(await ws.recv())  # session id
+        for i in range(turns):
+            entry = trace[(offset + i) % len(trace)]
+            replies = list(entry["replies"])
+            start = time.perf_counter()
+            first = None
+            await ws.send(entry["query"])
+            while True:
+                event = json.loads(await ws.recv())
+                kind = event["type"]
+                if kind == "say" and first is None:
+                    first = time.perf_counter() - start
+                elif kind == "ask":
+                    await ws.send(replies.pop(0) if replies else "no")
+                elif kind in ("reply", "error", "busy"):
+                    break
+            elapsed = time.perf_counter() - start
+            results.append({
+                "type": kind,
+                "first": first,
+                "total": elapsed,
+                "queue": event.get("queue_ms", 0) / 1000,
+            })
+            if kind == "busy":
+                # Back off before retrying, like a well-behaved client
+                await asyncio.sleep(0.05 + random.random() * 0.1)
+            elif think:
+                await asyncio.sleep(random.uniform(0, 2 * think))
+
+
+async def drive(port, trace, args):
+    url = f"ws://127.0.0.1:{port}/"
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url, trace, args.turns, args.think, results)
+                           for _ in range(args.clients)))
+    return results, time.perf_counter() - start
+
+
+def ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def report(results, seconds, server):
+    done = [r for r in results if r["type"] == "reply"]
+    busy = sum(r["type"] == "busy" for r in results)
+    errors = sum(r["type"] == "error" for r in results)
+    print(f"{len(done)} replies in {seconds:.2f}s ({len(done) / seconds:.1f} turns/s), "
+          f"{busy} refused (busy), {errors} errors")
+    print(f"{'metric':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, key in (("first say", "first"), ("reply", "total"), ("queued", "queue")):
+        values = [r[key] for r in done if r[key] is not None]
+        print(f"{name:<12} {ms(percentile(values, 50)):>9} {ms(percentile(values, 95)):>9} "
+              f"{ms(percentile(values, 99)):>9}")
+    print("server:", server.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", nargs="?", help="trace file (.txt, .jsonl or .csv); default: built-in")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent WebSocket clients")
+    parser.add_argument("--turns", type=int, default=10, help="queries per client")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds between a client's queries")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue", type=int, default=32, help="admitted turns waiting for a worker")
+    parser.add_argument("--session-queue", type=int, default=4)
+    parser.add_argument("--ai-latency", type=float, default=0.3, help="seconds to first chunk")
+    parser.add_argument("--ai-chunk", type=float, default=0.02, help="seconds between chunks")
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--smtp-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of each latency")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the assistant's output")
+    args = parser.parse_args()
+    # Unused by the server (speech goes to clients as text)
+    args.tts_latency = 0.0
+    args.speech_rate = 0.0
+
+    random.seed(args.seed)
+    entries = bench_e2e.load_trace(args.trace) if args.trace else bench_e2e.DEFAULT_TRACE
+    trace = bench_e2e.normalize_trace(entries)
+
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    with quiet:
+        server = start_server(args)
+        results, seconds = asyncio.run(drive(server.port, trace, args))
+        server.close()
+        import db
+        db.close()
+    report(results, seconds, server)
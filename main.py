@@ -6,206 +6,432 @@ runtime loop that listens for the wake word and dispatches commands to
 `main` for handling.
 """
 
-import ai
-import commands as cmd
 import db
 import voice as vc
 import config as cfg
 import utils as uls
-import os
+import ast
+import threading
+from intents import IntentEngine
+import planner
+import tracing
+from memory import log_turn
+
+# Loaded on first use of an intent that needs them (or by
+# `prewarm_backends`), so the wake-word loop starts right away
+ai = uls.lazy_import("ai")
+cmd = uls.lazy_import("commands")
+
+
+# Routing table for local commands. Priorities keep the precedence the
+# old if/elif chain had (e.g. "play a message" is a message, not a song).
+engine = IntentEngine()
+
+
+# --------------------------
+# TIME
+# --------------------------
+# Return current system time
+@engine.intent("time", all_of=("time", "right now"), priority=80)
+def handle_time(query):
+    b = cmd.tell_time()
+    vc.speak(b)
+    return b
+
+
+# --------------------------
+# SHUTDOWN
+# --------------------------
+# Shut down the system
+@engine.intent("shutdown", any_of=("shutdown",), priority=70, exclusive=True)
+def handle_shutdown(query):
+    vc.speak("Shutting down the system")
+    return cmd.shutdown()
+
+
+# --------------------------
+# RESTART
+# --------------------------
+# Restart the system
+@engine.intent("restart", any_of=("restart",), priority=60, exclusive=True)
+def handle_restart(query):
+    vc.speak("Restarting the system")
+    return cmd.restart()
+
+
+# --------------------------
+# EMAIL
+# --------------------------
+# Send email through Gmail SMTP
+@engine.intent("email", any_of=("email",), priority=50, exclusive=True)
+def handle_email(query):
+    try:
+        # Get recipient email
+        vc.speak("Whom should I send it to?")
+        t1 = vc.take_command().lower()
+        to = uls.fix_email_spoken(t1)
+
+        # Get email subject
+        vc.speak("What is the subject?")
+        subject = vc.take_command()
+
+        # Ask if AI should generate content
+        vc.speak("Should I generate the content using AI?")
+        response = vc.take_command().lower()
+
+        if "yes" in response:
+            # Generate professional email using AI
+            content = ai.start_assistant("Generate a professional email about " + subject, persona="email")
+            vc.speak(content)
+
+            # Ask for revisions
+            vc.speak("Do you want to make any changes?")
+            resp = vc.take_command().lower()
+
+            if "yes" in resp:
+                # Incorporate user changes via AI
+                vc.speak("What changes do you want to make?")
+                changes = vc.take_command()
+                content = content + ". Also include: " + changes
+                content = ai.start_assistant(
+                    "Generate a professional email about "
+                    + subject
+                    + " with the following details: "
+                    + content,
+                    persona="email",
+                )
+        else:
+            # Manually compose email
+            while True:
+                vc.speak("Tell me the content.")
+                content = vc.take_command()
+
+                vc.speak("Here is the content: " + content)
+                vc.speak("Is this correct?")
+
+                if "yes" in vc.take_command().lower():
+                    break
+
+        # Only queues the email; the outbox sends it in the background
+        b = f"Queued Email to {to} | Subject: {subject} | Content: {content}"
+        vc.speak(cmd.send_email(to, subject, content))
+
+    except Exception:
+        b = "Sorry Sir. I am unable to send the email right now."
+        vc.speak(b)
+    return b
+
+
+# --------------------------
+# WHATSAPP MESSAGE
+# --------------------------
+# Send WhatsApp message
+@engine.intent("message", any_of=("message",), priority=40, exclusive=True)
+def handle_message(query):
+    try:
+        # Get recipient phone number
+        vc.speak("Whom should I send it to?")
+        to = vc.take_command()
+
+        # Get message content
+        vc.speak("What do you want to send?")
+        msg = vc.take_command()
+
+        # Convert spoken number format to digits
+        number = uls.fix_email_spoken(to)
+
+        # Only queues the message; delivery happens in the background
+        delivery = cmd.send_whatsapp(number, msg)
+        b = "Queued message to "+ to + ": " + msg + " (" + delivery.status + ")"
+        vc.speak("Message queued")
+
+    except Exception:
+        b = "Sorry Sir. I am unable to send the message right now."
+        vc.speak(b)
+    return b
+
+
+# --------------------------
+# OPEN / SEARCH
+# --------------------------
+@engine.intent("open", any_of=("open", "search"), priority=30)
+def handle_open(query):
+    # Normalize the command by removing wake-word and the verb
+    query = query.replace("jarvis", "").replace("open", "").strip()
+
+    # Sites, installed apps and recent files are looked up in the
+    # launcher index and opened directly.
+    entry = cmd.search(query)
+    if entry is not None:
+        vc.speak("Opening Sir")
+        return "Opening " + entry.name
+    # Nothing matched: `cmd.search` opened a web search instead.
+    vc.speak("Ok sir")
+    return "Searching " + query
+
+
+# --------------------------
+# PLAY
+# --------------------------
+@engine.intent("play", any_of=("play",), priority=20)
+def handle_play(query):
+    # Extract the song/playlist identifier from the spoken command
+    query = query.replace("jarvis", "").replace("play", "").strip()
+
+    # Inform the user and hand off to the player helper. The
+    # `cmd.play_song` implementation is expected to accept an
+    # optional query string identifying what to play.
+    vc.speak("Playing sir")
+    cmd.play_song(query)
+    return "Playing " + query
+
+
+# --------------------------
+# HISTORY SEARCH
+# --------------------------
+# Read back past interactions matching the spoken words
+@engine.intent("history search", all_of=("history",), any_of=("search", "find", "look"),
+               priority=35)
+def handle_history_search(query):
+    import history_search
+
+    words, since, until = history_search.parse_query(query)
+    if not words:
+        b = "What should I look for in your history?"
+        vc.speak(b)
+        return b
+    try:
+        results = history_search.search(words, since=since, until=until)
+    except Exception as e:
+        print("History search error:", e)
+        b = "Unable to search your history right now."
+        vc.speak(b)
+        return b
+
+    if not results:
+        b = "I found nothing about " + words + " in your history."
+        if history_search.building():
+            b += " I am still indexing older conversations."
+        vc.speak(b)
+        return b
+    vc.speak(f"I found {len(results)} matches.")
+    lines = []
+    for _, command, response, timestamp, _ in results:
+        line = f"On {timestamp:%B %d}, you said {command}. I answered: {response[:200]}"
+        lines.append(line)
+        vc.speak(line)
+    return " | ".join(lines)
+
+
+# --------------------------
+# PERFORMANCE REPORT
+# --------------------------
+# Summarize stored turn timings (see `tracing.py`)
+@engine.intent("performance report", all_of=("performance",), any_of=("report", "stats"),
+               priority=12)
+def handle_performance_report(query):
+    try:
+        summary = tracing.report()
+    except Exception as e:
+        print("Performance report error:", e)
+        summary = None
+    if not summary or "total" not in summary:
+        b = "I have no timings for the last day."
+        vc.speak(b)
+        return b
+
+    print(tracing.format_report(summary))
+    total = summary["total"]
+    stages = {k: v for k, v in summary.items() if k != "total"}
+    slowest = max(stages, key=lambda k: stages[k]["p95"]) if stages else None
+    b = (
+        f"Over the last day, {total['count']} turns took {total['p50']:.0f} milliseconds "
+        f"at the median and {total['p95']:.0f} at the 95th percentile."
+    )
+    if slowest is not None:
+        b += f" The slowest stage is {slowest}, at {stages[slowest]['p95']:.0f} milliseconds."
+    vc.speak(b)
+    return b
+
+
+# --------------------------
+# CHAT LOG
+# --------------------------
+# Export chat history added since the last export (see `export.py`)
+@engine.intent("chat log", all_of=("chat log",), priority=10)
+def handle_chat_log(query):
+    try:
+        import export
+
+        count = export.export()
+        if count:
+            print("Exported to", export.default_out(cfg.EXPORT_FORMAT))
+            b = f"Exported {count} new interactions."
+        else:
+            b = "Chat log is already up to date."
+
+    except Exception as e:
+        print("Export error:", e)
+        b = "Unable to fetch chat log."
+    vc.speak(b)
+    return b
+
+
+# --------------------------
+# DEFAULT → AI RESPONSE
+# --------------------------
+# If no specific command matches, use AI to generate response
+def handle_ai(query):
+    # Stream the reply and queue each sentence for speech as soon as
+    # it arrives, so audio starts before generation has finished
+    handles = []
+    b = ai.start_assistant(
+        query,
+        on_sentence=lambda sentence: handles.append(vc.speak(sentence, block=False)),
+    )
+    print("Jarvis:", b)
+    if handles:
+        with tracing.span("tts"):
+            handles[-1].wait()
+    return b
 
 
 def main(query):
     """Handle a single user query string and perform appropriate action.
 
-    The function tries to match known command patterns (time, shutdown,
-    email, messages, etc.). If none match, the query is forwarded to the
-    AI assistant. The returned/produced string is also logged to the DB.
+    The query is matched against the intents registered on `engine`
+    (time, shutdown, email, messages, etc.). If none match, the query is
+    forwarded to the AI assistant. The returned/produced string is also
+    logged to the DB.
 
     Args:
         query: Text of the user's command (lowercased by caller).
-    """
-    # --------------------------
-    # TIME
-    # --------------------------
-    # Return current system time
-    if "time" in query and "right now" in query:
-        b = cmd.tell_time()
-        vc.speak(b)
 
-    # --------------------------
-    # SHUTDOWN
-    # --------------------------
-    # Shut down the system
-    elif "shutdown" in query:
-        vc.speak("Shutting down the system")
-        b = cmd.shutdown()
-        a = False  # Exit main loop
-
-    # --------------------------
-    # RESTART
-    # --------------------------
-    # Restart the system
-    elif "restart" in query:
-        vc.speak("Restarting the system")
-        b = cmd.restart()
-
-    # --------------------------
-    # EMAIL
-    # --------------------------
-    # Send email through Gmail SMTP
-    elif "email" in query:
-        try:
-            # Get recipient email
-            vc.speak("Whom should I send it to?")
-            t1 = vc.take_command().lower()
-            to = uls.fix_email_spoken(t1)
-
-            # Get email subject
-            vc.speak("What is the subject?")
-            subject = vc.take_command()
-
-            # Ask if AI should generate content
-            vc.speak("Should I generate the content using AI?")
-            response = vc.take_command().lower()
-
-            if "yes" in response:
-                # Generate professional email using AI
-                content = ai.start_assistant("Generate a professional email about " + subject)
-                vc.speak(content)
-
-                # Ask for revisions
-                vc.speak("Do you want to make any changes?")
-                resp = vc.take_command().lower()
-
-                if "yes" in resp:
-                    # Incorporate user changes via AI
-                    vc.speak("What changes do you want to make?")
-                    changes = vc.take_command()
-                    content = content + ". Also include: " + changes
-                    content = ai.start_assistant(
-                        "Generate a professional email about "
-                        + subject
-                        + " with the following details: "
-                        + content
-                    )
-            else:
-                # Manually compose email
-                while True:
-                    vc.speak("Tell me the content.")
-                    content = vc.take_command()
-
-                    vc.speak("Here is the content: " + content)
-                    vc.speak("Is this correct?")
-
-                    if "yes" in vc.take_command().lower():
-                        break
-
-            b = f"Sending Email to {to} | Subject: {subject} | Content: {content}"
-            vc.speak("Sending Email...")
-            vc.speak(cmd.send_email(to, subject, content))
-
-        except Exception:
-            b = "Sorry Sir. I am unable to send the email right now."
-            vc.speak(b)
-
-    # --------------------------
-    # WHATSAPP MESSAGE
-    # --------------------------
-    # Send WhatsApp message
-    elif "message" in query:
+    Returns:
+        The handler's reply text (what was spoken or streamed).
+    """
+    with tracing.turn():
+        with tracing.span("dispatch"):
+            intent = engine.match(query)
+        handler = intent.handler if intent is not None else handle_ai
+        with tracing.span("ai" if intent is None else "command"):
+            b = handler(query)
+
+        # Save interaction to database
         try:
-            # Get recipient phone number
-            vc.speak("Whom should I send it to?")
-            to = vc.take_command()
-
-            # Get message content
-            vc.speak("What do you want to send?")
-            msg = vc.take_command()
-
-            vc.speak("Sending message...")
-            # Convert spoken number format to digits
-            number = uls.fix_email_spoken(to)
-
-            b = "Sending message to"+ to + ":" + msg
-            cmd.send_whatsapp(number, msg)
-
-        except Exception:
-            b = "Sorry Sir. I am unable to send the message right now."
-            vc.speak(b)
-    
-    elif "open" in query or "search" in query:
-        # Normalize the command by removing wake-word and the verb
-        query = query.replace("jarvis", "").replace("open", "").strip()
-
-        # NOTE: `cfg.sites` in `config.py` is a list of [name,url] pairs.
-        # The original code checks `cfg.sites.keys()` which will raise
-        # AttributeError if `sites` is not a dict. Here we keep behavior
-        # unchanged but add a helpful comment for future maintainers.
-        if query in cfg.sites.keys():
-            # If the site key is known, delegate to `cmd.web` (assumed to
-            # open a site by key). Speak confirmation to the user.
-            cmd.web(query)
-            vc.speak("Opening Sir")
-        else:
-            # If no predefined site matches, do a general search instead.
-            vc.speak("Ok sir")
-            cmd.search(query)
-
+            # Persist the user's query and the assistant's response and add
+            # them to conversation memory. This only enqueues the row; a
+            # background writer batches the inserts so the next
+            # `take_command` is not held up by the database.
+            log_turn(query, b, tracing.take())
+        except:
+            pass
+    return b
+
+def run_compound(query):
+    """Handle a command that may contain several "and"-joined requests.
+
+    Single requests go through `main` as before. Compound ones are
+    planned by `planner`: independent local actions run concurrently,
+    all AI questions share one Gemini call, and each fragment is logged
+    on its own.
+
+    Returns:
+        False if one of the fragments asked the assistant to stop.
+    """
+    steps = planner.plan(query, engine)
+    keep_running = not any(step.stop for step in steps)
+    work = [step for step in steps if not step.stop]
+
+    if len(work) == 1:
+        main(work[0].fragment)
+    elif work:
+        with tracing.span("compound"):
+            results = planner.execute(work, ai.start_assistant_batch, vc.speak)
+        # One turn, one set of timings: logged with the first fragment only
+        timings = tracing.take()
+        for n, (fragment, b) in enumerate(results):
+            try:
+                log_turn(fragment, b, timings if n == 0 else None)
+            except Exception:
+                pass
+
+    if not keep_running:
+        vc.speak("Goodbye sir.")
+    return keep_running
+
+
+def static_phrases():
+    """Return every literal string passed to `vc.speak` in this module.
+
+    Used to pre-warm the TTS cache so fixed prompts ("Opening Sir",
+    "Whom should I send it to?", the greeting, ...) play instantly.
+    """
+    with open(__file__, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    phrases = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "speak"
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+            and node.args[0].value not in phrases
+        ):
+            phrases.append(node.args[0].value)
+    return phrases
+
+
+def backend_steps():
+    """Return (name, callable) pairs that load each lazy backend."""
+    return [
+        ("gtts", lambda: uls.preload(vc.gtts)),
+        ("pygame", lambda: uls.preload(vc.pygame)),
+        ("commands", lambda: uls.preload(cmd)),
+        ("pywhatkit", lambda: uls.preload(cmd.pywhatkit)),
+        ("launcher index", lambda: cmd.launcher.get_index()),
+        ("gemini client", lambda: ai.get_client()),
+        ("database pool", lambda: db.get_connection().close()),
+        ("history index", prewarm_history_index),
+    ]
+
+
+def prewarm_history_index():
+    import history_search
+
+    history_search.prewarm()
+
+
+def prewarm_backends():
+    """Load command backends and clients in a background thread.
+
+    Started once the wake loop is running, so the first email, message
+    or AI request doesn't pay for imports and connection setup.
+    """
+    steps = backend_steps()
 
-    elif "play" in query:
-        # Extract the song/playlist identifier from the spoken command
-        query = query.replace("jarvis", "").replace("play", "").strip()
+    def run():
+        for name, step in steps:
+            try:
+                step()
+            except Exception as e:
+                print(f"Prewarm of {name} failed:", e)
 
-        # Inform the user and hand off to the player helper. The
-        # `cmd.play_song` implementation is expected to accept an
-        # optional query string identifying what to play.
-        vc.speak("Playing sir")
-        cmd.play_song(query)
+    thread = threading.Thread(target=run, name="jarvis-prewarm", daemon=True)
+    thread.start()
+    return thread
 
 
-    # --------------------------
-    # CHAT LOG
-    # --------------------------
-    # Export chat history to CSV file
-    elif "chat log" in query:
-        try:
-            import csv
-            # Fetch all logs from database
-            logs = db.fetch_logs()
-
-            # Write logs to CSV file
-            with open("log.csv", "w", newline="") as f:
-                writer = csv.writer(f)
-                for log in logs:
-                    writer.writerow(list(log))
-
-            # Open CSV file in default application
-            os.startfile("log.csv")
-            b = "Chat log exported."
-
-        except Exception:
-            b = "Unable to fetch chat log."
-            vc.speak(b)
-
-    # --------------------------
-    # DEFAULT → AI RESPONSE
-    # --------------------------
-    # If no specific command matches, use AI to generate response
-    else:
+def start_retention():
+    """Archive `ai_log` months past the hot window in the background."""
+    if cfg.LOG_RETENTION_MONTHS:
+        import retention
 
-        b = ai.start_assistant(query)
-        print("Jarvis:", b)
-        vc.speak(b)
+        retention.start()
 
-    # Save interaction to database
-    try:
-        # Persist the user's query and the assistant's response. This
-        # uses a short-lived DB connection inside `db.response` so errors
-        # are isolated from the main loop.
-        db.response(query, b)
-    except:
-        pass
 
 def start_jarvis():
     """Start the assistant's wake-word loop and process incoming queries.
@@ -216,22 +442,72 @@ def start_jarvis():
     loop and end the program.
     """
     print("Initializing Jarvis.....")
+    if cfg.TTS_PREWARM:
+        # Fill the TTS cache while we wait for the wake word
+        vc.prewarm(static_phrases())
+    if cfg.PREWARM_BACKENDS:
+        prewarm_backends()
+    start_retention()
     vc.wake_word_listener("jarvis")
     vc.speak("Hello sir , How May I Help You?")
     a = True
     while a:
-        query = vc.take_command().lower()
-        if "jarvis" in query:
-            multiquery = query.split("and")
-            for i in multiquery:
-                if "stop" in i or "close" in i and "jarvis" in i:
-                    vc.speak("Goodbye sir.")
-                    a = False
-                else:
-                    main(i)
+        # One traced turn: listening and recognition, then handling
+        with tracing.turn():
+            query = vc.take_command().lower()
+            if "jarvis" in query:
+                a = run_compound(query)
 
+    # Flush any interactions still waiting in the log writer
+    db.close()
 
-if __name__ == "__main__":
 
-    start_jarvis()
+def start_jarvis_async():
+    """Run the assistant on the asyncio runtime (see `runtime.py`).
+
+    Listening, command handling, Gemini streaming, speech and logging
+    run as concurrent tasks instead of one after another.
+    """
+    import runtime
+
+    print("Initializing Jarvis.....")
+    if cfg.TTS_PREWARM:
+        vc.prewarm(static_phrases())
+    if cfg.PREWARM_BACKENDS:
+        prewarm_backends()
+    start_retention()
+    runtime.run(engine)
+
+
+def start_server():
+    """Serve text clients over WebSocket/HTTP instead of the microphone."""
+    import server
+
+    if cfg.PREWARM_BACKENDS:
+        prewarm_backends()
+    start_retention()
+    server.run(engine, main)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Jarvis assistant.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="use the concurrent asyncio runtime")
+    parser.add_argument("--serve", action="store_true",
+                        help="answer text clients over WebSocket/HTTP (see server.py)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report per-module import and init time, then exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        import startup_profile
+        startup_profile.report()
+    elif args.serve:
+        start_server()
+    elif args.use_async:
+        start_jarvis_async()
+    else:
+        start_jarvis()
 
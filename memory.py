@@ -0,0 +1,223 @@
+"""Session memory that gives Gemini the context of recent turns.
+
+`ConversationMemory` keeps the latest command/response turns plus a
+rolling summary of everything older, and `prompt` wraps a new question
+with both. The whole context is held under `MEMORY_TOKEN_BUDGET`: when a
+new turn pushes it over, the oldest turns are moved out of the context
+and folded into the summary by a background model call. Prompt size
+therefore stays flat however long a session runs, and the summary is
+updated incrementally instead of being rebuilt from the full history.
+
+The summary and the timestamp of the last folded turn are stored in the
+`ai_memory` table. On first use, memory loads that row and only the
+`ai_log` turns logged after it.
+
+The voice loop uses the module-level `memory`. `use_memory` swaps in
+another one for the current thread, which is how each `server.py`
+client session keeps its own (unpersisted) context.
+"""
+
+import datetime
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import db
+from config import (
+    MEMORY_ENABLED,
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_SUMMARY_TOKENS,
+    MEMORY_LOAD_TURNS,
+)
+from utils import lazy_import
+
+# Summaries are written by the model; imported on first fold so `ai`
+# can import this module
+ai = lazy_import("ai")
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English).
+
+    Good enough for budgeting without a round trip to the tokenizer.
+    """
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    """Recent turns and a rolling summary under a fixed token budget.
+
+    Attributes:
+        summary: Condensed text of every turn no longer kept verbatim.
+        folded_until: Timestamp of the newest turn in `summary`.
+        turns: Verbatim (command, answer, timestamp, tokens) tuples,
+            oldest first.
+    """
+
+    def __init__(self, name="default", budget=MEMORY_TOKEN_BUDGET,
+                 summary_tokens=MEMORY_SUMMARY_TOKENS, summarize=None, persist=True):
+        self.name = name
+        # Unpersisted memories start empty and never touch `ai_memory`
+        self.persist = persist
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize or (lambda summary, turns: ai.summarize(summary, turns, summary_tokens))
+        self.summary = ""
+        self.folded_until = None
+        self.turns = deque()
+        self.folds = 0
+        self._pending = []       # turns moved out of context, not yet summarized
+        self._folding = False
+        self._loaded = not persist
+        self._lock = threading.RLock()
+
+    def _load(self):
+        # Lazy: nothing is read from the database until the first turn
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                row = db.memory_load(self.name)
+                if row is not None:
+                    self.summary, self.folded_until = row
+                recent = db.recent_turns(self.folded_until, MEMORY_LOAD_TURNS, self.name)
+            except Exception as e:
+                print("Memory load error:", e)
+                return
+            # Rows come newest-first
+            for command, answer, at in reversed(recent):
+                self._append(command, answer, at)
+        self._maybe_fold()
+
+    def _context_tokens(self):
+        return estimate_tokens(self.summary) + sum(t[3] for t in self.turns)
+
+    def _append(self, command, answer, at):
+        self.turns.append((command, answer, at, estimate_tokens(command) + estimate_tokens(answer)))
+        # Keep the newest turn even if it alone exceeds the budget
+        while len(self.turns) > 1 and self._context_tokens() > self.budget:
+            self._pending.append(self.turns.popleft())
+
+    def remember(self, command, answer, at=None):
+        """Add a finished turn, folding older turns if over budget."""
+        if not MEMORY_ENABLED:
+            return
+        self._load()
+        with self._lock:
+            self._append(command, answer, at or datetime.datetime.now())
+        self._maybe_fold()
+
+    def context(self):
+        """Return the summary and recent turns as prompt text ("" if empty)."""
+        if not MEMORY_ENABLED:
+            return ""
+        self._load()
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append("Summary of earlier conversation: " + self.summary)
+            if self.turns:
+                parts.append("Recent conversation:")
+                for command, answer, _, _ in self.turns:
+                    parts.append(f"User: {command}\nJarvis: {answer}")
+        return "\n".join(parts)
+
+    def prompt(self, query, context=None):
+        """Return `query` prefixed with the conversation context.
+
+        Pass `context` when it was already read (from `context`), so the
+        prompt matches it even if a turn was added meanwhile.
+        """
+        if context is None:
+            context = self.context()
+        if not context:
+            return query
+        return f"{context}\n\nUser: {query}"
+
+    def _maybe_fold(self):
+        with self._lock:
+            if self._folding or not self._pending:
+                return
+            self._folding = True
+        threading.Thread(target=self._fold, name="jarvis-memory-fold", daemon=True).start()
+
+    def _fold(self):
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                summary = self.summary
+                if not batch:
+                    self._folding = False
+                    return
+            try:
+                summary = self.summarize(summary, [(c, a) for c, a, _, _ in batch])
+            except Exception as e:
+                print("Memory summary error:", e)
+                with self._lock:
+                    # Retry with the next turn rather than losing these
+                    self._pending = batch + self._pending
+                    self._folding = False
+                return
+
+            # Hard cap in case the model ignores the requested length
+            summary = summary.strip()[: self.summary_tokens * 4]
+            with self._lock:
+                self.summary = summary
+                self.folded_until = batch[-1][2]
+                self.folds += 1
+                # A longer summary may push the context back over budget
+                while len(self.turns) > 1 and self._context_tokens() > self.budget:
+                    self._pending.append(self.turns.popleft())
+            if not self.persist:
+                continue
+            try:
+                db.memory_save(self.name, summary, self.folded_until)
+            except Exception as e:
+                print("Memory save error:", e)
+
+    def stats(self):
+        """Return token usage of the current context and fold counters."""
+        with self._lock:
+            return {
+                "turns": len(self.turns),
+                "pending": len(self._pending),
+                "tokens": self._context_tokens(),
+                "budget": self.budget,
+                "folds": self.folds,
+            }
+
+
+memory = ConversationMemory()
+
+_local = threading.local()
+
+
+def current_memory():
+    """Memory of the session running on this thread (default: `memory`)."""
+    return getattr(_local, "memory", None) or memory
+
+
+@contextmanager
+def use_memory(session_memory):
+    """Make `session_memory` the current memory on this thread."""
+    previous = getattr(_local, "memory", None)
+    _local.memory = session_memory
+    try:
+        yield session_memory
+    finally:
+        _local.memory = previous
+
+
+def log_turn(command, answer, timings=None):
+    """Log a turn to `ai_log` and add it to session memory.
+
+    Both get the same timestamp, so a reload after a restart knows which
+    logged turns are already in the persisted summary. `timings` (from
+    `tracing.take`) are logged alongside.
+    """
+    at = datetime.datetime.now()
+    session_memory = current_memory()
+    session_memory.remember(command, answer, at)
+    # Tagged with the memory's name so each conversation reloads only its own turns
+    return db.response(command, answer, at, timings, session_memory.name)
@@ -0,0 +1,219 @@
+"""Background WhatsApp dispatcher.
+
+`commands.send_whatsapp` used to schedule each message with
+`pywhatkit.sendwhatmsg` for "the next minute", which blocked the
+assistant for up to a minute per message, opened a browser tab for
+each one and broke at minute 59. Now messages are queued here and a
+worker thread sends them:
+
+* messages that arrive within `WHATSAPP_COALESCE_WINDOW` seconds of each
+  other (or while a batch is being sent) form one batch, sent
+  back-to-back between one transport `open` and `close`. pywhatkit has
+  no session to share: every message opens its own WhatsApp Web tab and
+  waits for it to load,
+* each message gets a `Delivery` whose status ("queued", "sending",
+  "sent", "failed") the caller can read or wait on,
+* the transport is pluggable: `PyWhatKitTransport` drives WhatsApp Web,
+  `RecordingTransport` just records messages for tests and dry runs.
+"""
+
+import abc
+import atexit
+import queue
+import threading
+import time
+
+from config import (
+    WHATSAPP_COUNTRY_CODE,
+    WHATSAPP_COALESCE_WINDOW,
+    WHATSAPP_LOAD_WAIT,
+    WHATSAPP_CLOSE_TIMEOUT,
+)
+from utils import lazy_import
+
+pywhatkit = lazy_import("pywhatkit")
+
+
+class Delivery:
+    """Status of one queued message."""
+
+    def __init__(self, number, message):
+        self.number = number
+        self.message = message
+        self.status = "queued"
+        self.error = ""
+        self.sent_at = None
+        self._done = threading.Event()
+
+    def _finish(self, status, error=""):
+        self.status = status
+        self.error = error
+        if status == "sent":
+            self.sent_at = time.time()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until the message is sent or failed. Returns the status."""
+        self._done.wait(timeout)
+        return self.status
+
+
+class Transport(abc.ABC):
+    """Interface for sending a batch of messages in one session."""
+
+    def open(self):
+        """Prepare a session before the first message of a batch."""
+
+    @abc.abstractmethod
+    def send(self, number, message):
+        """Send one message."""
+
+    def close(self):
+        """Release the session after the last message of a batch."""
+
+
+class PyWhatKitTransport(Transport):
+    """Sends through WhatsApp Web using pywhatkit's instant send.
+
+    Each message opens WhatsApp Web in a new tab, waits
+    `WHATSAPP_LOAD_WAIT` seconds for it to load, sends and closes the tab
+    (WhatsApp Web only stays active in one tab, so tabs are not kept
+    open for later messages of the batch).
+    """
+
+    def send(self, number, message):
+        pywhatkit.sendwhatmsg_instantly(
+            number,
+            message,
+            wait_time=WHATSAPP_LOAD_WAIT,
+            tab_close=True,
+            close_time=2,
+        )
+
+
+class RecordingTransport(Transport):
+    """Records messages instead of sending them.
+
+    Numbers listed in `fail` raise, so failure reporting can be checked.
+    """
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.sent = []
+        self.sessions = 0
+
+    def open(self):
+        self.sessions += 1
+
+    def send(self, number, message):
+        if number in self.fail:
+            raise RuntimeError(f"cannot reach {number}")
+        self.sent.append((number, message))
+
+
+class MessageDispatcher(threading.Thread):
+    """Worker thread that sends queued messages in coalesced batches."""
+
+    def __init__(self, transport=None, window=WHATSAPP_COALESCE_WINDOW):
+        super().__init__(name="jarvis-messenger", daemon=True)
+        self.transport = transport or PyWhatKitTransport()
+        self.window = window
+        self.batches = 0
+        self._queue = queue.Queue()
+
+    def submit(self, number, message):
+        """Queue a message and return its `Delivery`."""
+        delivery = Delivery(number, message)
+        self._queue.put(delivery)
+        return delivery
+
+    def stop(self, timeout=None):
+        """Send everything queued, then exit.
+
+        Returns:
+            True if the worker finished within `timeout`.
+        """
+        self._queue.put(None)
+        self.join(timeout)
+        return not self.is_alive()
+
+    def run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            # Collect messages queued meanwhile (and, with a window, a moment longer)
+            deadline = time.monotonic() + self.window
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._send_batch(batch)
+            if stopping:
+                return
+
+    def _send_batch(self, batch):
+        self.batches += 1
+        try:
+            self.transport.open()
+        except Exception as e:
+            for delivery in batch:
+                delivery._finish("failed", str(e))
+            return
+        try:
+            for delivery in batch:
+                delivery.status = "sending"
+                try:
+                    self.transport.send(delivery.number, delivery.message)
+                except Exception as e:
+                    print(f"WhatsApp message to {delivery.number} failed:", e)
+                    delivery._finish("failed", str(e))
+                else:
+                    delivery._finish("sent")
+        finally:
+            try:
+                self.transport.close()
+            except Exception as e:
+                print("WhatsApp transport close error:", e)
+
+
+def international(number):
+    """Prefix a local number with `WHATSAPP_COUNTRY_CODE` if it has none."""
+    return number if number.startswith("+") else WHATSAPP_COUNTRY_CODE + number
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the shared dispatcher, starting its worker on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MessageDispatcher()
+            _dispatcher.start()
+            atexit.register(close)
+    return _dispatcher
+
+
+def close(timeout=WHATSAPP_CLOSE_TIMEOUT):
+    """Send whatever is queued and stop the dispatcher.
+
+    Gives up after `timeout` seconds so exit is never held up by a stuck
+    browser; messages not sent by then are lost (the worker is a daemon
+    thread).
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None and dispatcher.is_alive():
+        if not dispatcher.stop(timeout):
+            print(f"WhatsApp: gave up on queued messages after {timeout:.0f}s")
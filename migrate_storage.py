@@ -0,0 +1,98 @@
+"""Copy stored data from one storage backend to another.
+
+Moves `ai_log` (ids and timestamps preserved), `ai_cache`, `ai_memory`
+and `ai_timing` between MySQL and SQLite in bulk: rows are read in id (or
+key) order, page by page, and each page is written with one
+`executemany` in its own transaction, so memory stays bounded and an
+interrupted copy can simply be re-run (existing rows are skipped).
+
+Usage:
+    python migrate_storage.py --from mysql --to sqlite [--sqlite-path jarvis.db]
+    python migrate_storage.py --from sqlite --to mysql [--batch 5000]
+
+Run `db_setup.py` for the MySQL side first; SQLite creates its tables
+automatically.
+"""
+
+import argparse
+import time
+
+import storage
+
+# table -> (columns, ordering key)
+TABLES = {
+    "ai_log": (("id", "command", "response", "timestamp", "source"), "id"),
+    "ai_cache": (("cache_key", "prompt", "response", "expires_at"), "cache_key"),
+    "ai_memory": (("name", "summary", "folded_until"), "name"),
+    "ai_timing": (("id", "log_at", "stage", "ms"), "id"),
+}
+
+
+def insert_ignore(backend, table, columns):
+    placeholders = ", ".join(["%s"] * len(columns))
+    verb = "INSERT IGNORE" if backend.name == "mysql" else "INSERT OR IGNORE"
+    return backend.sql(f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({placeholders})")
+
+
+def copy_table(source, target, table, batch):
+    """Copy every row of `table`; returns the number of rows read."""
+    columns, key = TABLES[table]
+    select = source.sql(
+        f"SELECT {', '.join(columns)} FROM {table} WHERE {key} > %s ORDER BY {key} LIMIT %s"
+    )
+    first = source.sql(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {key} LIMIT %s")
+    insert = insert_ignore(target, table, columns)
+    key_index = columns.index(key)
+
+    src = source.connect()
+    dst = target.connect()
+    copied = 0
+    try:
+        read = src.cursor()
+        write = dst.cursor()
+        last = None
+        while True:
+            if last is None:
+                read.execute(first, (batch,))
+            else:
+                read.execute(select, (last, batch))
+            rows = read.fetchall()
+            if not rows:
+                break
+            write.executemany(insert, rows)
+            dst.commit()
+            copied += len(rows)
+            last = rows[-1][key_index]
+            print(f"  {table}: {copied} rows", end="\r")
+    finally:
+        src.close()
+        dst.close()
+    print(f"  {table}: {copied} rows")
+    return copied
+
+
+def migrate(source, target, batch=5000, tables=tuple(TABLES)):
+    start = time.perf_counter()
+    total = sum(copy_table(source, target, table, batch) for table in tables)
+    elapsed = time.perf_counter() - start
+    print(f"Copied {total} rows from {source.name} to {target.name} in {elapsed:.1f}s")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="source", choices=sorted(storage.BACKENDS), required=True)
+    parser.add_argument("--to", dest="target", choices=sorted(storage.BACKENDS), required=True)
+    parser.add_argument("--sqlite-path", help="SQLite file (default: SQLITE_PATH from config)")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per transaction")
+    parser.add_argument("--tables", nargs="+", choices=sorted(TABLES), default=list(TABLES))
+    args = parser.parse_args()
+    if args.source == args.target:
+        parser.error("--from and --to must differ")
+
+    def make(name):
+        if name == "sqlite" and args.sqlite_path:
+            return storage.SQLiteBackend(args.sqlite_path)
+        return storage.BACKENDS[name]()
+
+    migrate(make(args.source), make(args.target), args.batch, args.tables)
@@ -0,0 +1,288 @@
+"""Background email outbox with a persistent SMTP session.
+
+`commands.send_email` used to connect, run STARTTLS, log in, send and
+quit inside the voice dialogue. Now it only queues the message here and
+returns at once. A worker thread sends queued messages over one
+long-lived `SMTPSession`:
+
+* the connection is reused between messages, checked with NOOP when it
+  has been idle for a while, and closed after `SMTP_IDLE_TIMEOUT`
+  seconds without mail (servers drop idle clients anyway); the next
+  message reconnects,
+* transient failures are retried with exponential backoff and jitter,
+  up to `SMTP_MAX_ATTEMPTS`; refused recipients and bad credentials
+  fail at once,
+* every message gets an id whose status ("queued", "sending", "retry",
+  "sent", "failed") can be looked up with `outbox.status`,
+* on exit, mail waiting for a retry is not dropped: stopping makes it
+  due at once and it is retried without backoff until it is sent or
+  runs out of attempts.
+
+To try it without a real account, run a local SMTP stand-in:
+
+    python -m aiosmtpd -n -l 127.0.0.1:8025
+
+and set SMTP_HOST = "127.0.0.1", SMTP_PORT = 8025, SMTP_STARTTLS = False
+in `config.py` (login is skipped when no password is configured).
+"""
+
+import atexit
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+
+import config as c
+from config import (
+    SMTP_HOST,
+    SMTP_PORT,
+    SMTP_STARTTLS,
+    SMTP_TIMEOUT,
+    SMTP_IDLE_TIMEOUT,
+    SMTP_NOOP_AFTER,
+    SMTP_MAX_ATTEMPTS,
+    SMTP_BACKOFF,
+    SMTP_CLOSE_TIMEOUT,
+)
+from utils import lazy_import
+
+smtplib = lazy_import("smtplib")
+
+
+class SMTPSession:
+    """One SMTP connection, opened on demand and kept between sends."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, starttls=SMTP_STARTTLS,
+                 user=None, password=None, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.server = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.connects += 1
+
+    def _healthy(self):
+        # A NOOP round trip is cheap compared to a failed send on a
+        # connection the server already dropped
+        try:
+            return self.server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def ensure(self):
+        """Return a live connection, reconnecting if needed."""
+        if self.server is not None and time.monotonic() - self.last_used > SMTP_NOOP_AFTER:
+            if not self._healthy():
+                self.close()
+        if self.server is None:
+            self._connect()
+        return self.server
+
+    def send(self, message):
+        """Send an `EmailMessage`, reconnecting once if the server hung up."""
+        try:
+            self.ensure().send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.ensure().send_message(message)
+        self.last_used = time.monotonic()
+
+    def idle_for(self):
+        return time.monotonic() - self.last_used
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+
+@dataclass
+class Mail:
+    """A queued message and its delivery state."""
+
+    id: int
+    to: str
+    subject: str
+    body: str
+    status: str = "queued"
+    attempts: int = 0
+    error: str = ""
+    queued_at: float = field(default_factory=time.time)
+    sent_at: float = None
+
+
+def is_permanent(error):
+    """Errors a retry won't fix: refused recipients, bad credentials, 5xx replies."""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+class Outbox(threading.Thread):
+    """Worker thread that delivers queued mail over one `SMTPSession`."""
+
+    def __init__(self, session=None, sender=None, max_attempts=SMTP_MAX_ATTEMPTS,
+                 backoff=SMTP_BACKOFF, idle_timeout=SMTP_IDLE_TIMEOUT):
+        super().__init__(name="jarvis-outbox", daemon=True)
+        self.session = session or SMTPSession(user=c.mail, password=c.password)
+        self.sender = sender or c.mail
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.mail = {}            # id -> Mail
+        self._due = []            # heap of (due monotonic time, seq, id)
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+
+    def submit(self, to, subject, body):
+        """Queue a message and return its id."""
+        with self._cond:
+            item = Mail(next(self._ids), to, subject, body)
+            self.mail[item.id] = item
+            heapq.heappush(self._due, (time.monotonic(), next(self._seq), item.id))
+            self._cond.notify()
+        return item.id
+
+    def status(self, mail_id):
+        """Return the `Mail` record for `mail_id`, or None."""
+        with self._cond:
+            return self.mail.get(mail_id)
+
+    def pending(self):
+        with self._cond:
+            return len(self._due)
+
+    def stop(self, timeout=None):
+        """Deliver everything still queued, then close the session and exit.
+
+        Messages waiting out a retry backoff are made due immediately.
+
+        Returns:
+            True if the worker finished within `timeout`.
+        """
+        with self._cond:
+            self._stopping = True
+            self._due = [(0.0, seq, mail_id) for _, seq, mail_id in self._due]
+            heapq.heapify(self._due)
+            self._cond.notify()
+        self.join(timeout)
+        return not self.is_alive()
+
+    def _message(self, item):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = item.to
+        message["Subject"] = item.subject
+        message.set_content(item.body)
+        return message
+
+    def run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._due and self._due[0][0] <= now:
+                        _, _, mail_id = heapq.heappop(self._due)
+                        item = self.mail[mail_id]
+                        item.status = "sending"
+                        break
+                    if self._stopping:
+                        self.session.close()
+                        return
+                    if self._due:
+                        wait = self._due[0][0] - now
+                    elif self.session.server is not None:
+                        wait = max(0.0, self.idle_timeout - self.session.idle_for())
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                    if not self._due and self.session.server is not None \
+                            and self.session.idle_for() >= self.idle_timeout:
+                        self.session.close()
+            self._deliver(item)
+
+    def _deliver(self, item):
+        item.attempts += 1
+        try:
+            self.session.send(self._message(item))
+        except Exception as e:
+            item.error = str(e)
+            if is_permanent(e) or item.attempts >= self.max_attempts:
+                item.status = "failed"
+                print(f"Email to {item.to} failed:", e)
+                return
+            # The connection may be in a bad state; start fresh next time
+            self.session.close()
+            with self._cond:
+                # No backoff once stopping: exit is waiting on this mail
+                delay = 0.0 if self._stopping else \
+                    random.uniform(0, self.backoff * 2 ** (item.attempts - 1))
+                item.status = "retry"
+                heapq.heappush(self._due, (time.monotonic() + delay, next(self._seq), item.id))
+            return
+        item.status = "sent"
+        item.sent_at = time.time()
+
+    def stats(self):
+        """Return message counts by status and the number of SMTP connects."""
+        with self._cond:
+            counts = {}
+            for item in self.mail.values():
+                counts[item.status] = counts.get(item.status, 0) + 1
+        return {"by_status": counts, "connects": self.session.connects}
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Return the shared outbox, starting its worker on first use."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+            _outbox.start()
+            atexit.register(close)
+    return _outbox
+
+
+def close(timeout=SMTP_CLOSE_TIMEOUT):
+    """Deliver whatever is queued, including retries, and stop the worker.
+
+    Gives up after `timeout` seconds so exit is never held up by an
+    unreachable server; mail not delivered by then is lost (the worker
+    is a daemon thread).
+    """
+    global _outbox
+    with _outbox_lock:
+        outbox, _outbox = _outbox, None
+    if outbox is not None and outbox.is_alive():
+        if not outbox.stop(timeout):
+            print(f"Email: gave up on {outbox.pending()} queued messages after {timeout:.0f}s")
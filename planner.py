@@ -0,0 +1,100 @@
+"""Planning and execution of compound commands.
+
+"Jarvis open youtube and what is the capital of France and play jazz"
+is split into fragments, each fragment is matched against the intent
+engine, and the plan is executed as:
+
+* local intents that are not `exclusive` run concurrently on a thread
+  pool;
+* every AI-bound fragment is folded into one structured Gemini request
+  (`ai.start_assistant_batch`) that runs alongside them;
+* exclusive intents (dialogues such as email, or shutdown) run one at a
+  time, in order, in the calling thread once everything else has
+  finished and the AI replies have been spoken, so a dialogue never
+  shares the microphone or speaker with another step.
+
+Each fragment keeps its own (fragment, reply) result so it can be
+logged separately.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+# "and" only as a whole word, so "android" or "command" stay intact
+FRAGMENT_SPLIT = re.compile(r"\s*\band(?:\s+then)?\b\s*")
+
+
+@dataclass
+class Step:
+    """One fragment of a compound command and how it will be handled."""
+
+    fragment: str
+    intent: object = None   # matched `intents.Intent`, or None for AI
+    stop: bool = False      # a "stop"/"close jarvis" fragment
+
+
+def split_fragments(query):
+    """Split a compound command into its non-empty fragments."""
+    return [f for f in FRAGMENT_SPLIT.split(query) if f.strip()]
+
+
+def is_stop(fragment, wake_word="jarvis"):
+    """Return True if the fragment asks the assistant to stop."""
+    return "stop" in fragment or "close" in fragment and wake_word in fragment
+
+
+def plan(query, engine, wake_word="jarvis"):
+    """Return the list of `Step`s for `query`, in spoken order."""
+    steps = []
+    for fragment in split_fragments(query):
+        if is_stop(fragment, wake_word):
+            steps.append(Step(fragment, stop=True))
+        else:
+            steps.append(Step(fragment, engine.match(fragment)))
+    return steps
+
+
+def execute(steps, ask_batch, speak, max_workers=4):
+    """Run a plan and return [(fragment, reply)] for every non-stop step.
+
+    Args:
+        steps: Output of `plan`.
+        ask_batch: Callable mapping a list of prompts to a list of
+            replies (normally `ai.start_assistant_batch`).
+        speak: `voice.speak`-compatible callable used for AI replies.
+        max_workers: Threads for concurrent local actions.
+    """
+    results = {}
+    ai_steps = [s for s in steps if s.intent is None and not s.stop]
+    parallel = [s for s in steps if s.intent is not None and not s.intent.exclusive]
+    serial = [s for s in steps if s.intent is not None and s.intent.exclusive]
+
+    def run(step, call):
+        try:
+            results[id(step)] = call()
+        except Exception as e:
+            print(f"Command '{step.fragment}' failed:", e)
+            results[id(step)] = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {id(s): pool.submit(s.intent.handler, s.fragment) for s in parallel}
+        batch = pool.submit(ask_batch, [s.fragment for s in ai_steps]) if ai_steps else None
+
+        for step in parallel:
+            run(step, futures[id(step)].result)
+
+        if batch is not None:
+            handles = []
+            for step, answer in zip(ai_steps, batch.result()):
+                print("Jarvis:", answer)
+                handles.append(speak(answer, block=False))
+                results[id(step)] = answer
+            if handles:
+                handles[-1].wait()
+
+    # Dialogues listen and speak, so they run alone
+    for step in serial:
+        run(step, lambda: step.intent.handler(step.fragment))
+
+    return [(s.fragment, results[id(s)]) for s in steps if not s.stop]
@@ -0,0 +1,247 @@
+"""Tail-latency controls for calls to remote services (Gemini).
+
+`ResilientCaller` wraps a blocking function with:
+
+* a per-call deadline covering every attempt,
+* retries with exponential backoff and full jitter,
+* optional hedging: if an attempt is still running after the observed
+  p95 latency, a second identical attempt is started and whichever
+  finishes first wins,
+* a `CircuitBreaker` that fails fast with `CircuitOpenError` after
+  repeated failures, so callers can answer from a fallback instead of
+  waiting on a degraded backend,
+* a `LatencyHistogram` of successful calls.
+"""
+
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class DeadlineExceeded(Exception):
+    """No attempt finished before the call's deadline."""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open; the backend is not being called."""
+
+
+class LatencyHistogram:
+    """Bucketed latency counts plus a window of recent samples.
+
+    Buckets give a cheap long-run distribution; the recent window is
+    used for percentiles (and therefore for the hedging delay).
+    """
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, math.inf)
+
+    def __init__(self, window=200):
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            self.total += seconds
+            self.recent.append(seconds)
+
+    def percentile(self, p):
+        """Return the `p`th percentile (0-100) of recent samples, or None."""
+        with self._lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        """Return counts, mean and p50/p95/p99 in seconds."""
+        with self._lock:
+            count = sum(self.counts)
+            buckets = {
+                ("+inf" if math.isinf(b) else f"<={b}s"): n
+                for b, n in zip(self.BUCKETS, self.counts)
+            }
+            mean = self.total / count if count else None
+        return {
+            "count": count,
+            "mean": mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": buckets,
+        }
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    `allow` returns False for `reset_timeout` seconds. It then lets a
+    single trial call through (half-open): success closes it again,
+    failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(error):
+    """Client errors (4xx other than 429) won't succeed on retry."""
+    code = getattr(error, "code", None)
+    return not (isinstance(code, int) and 400 <= code < 500 and code != 429)
+
+
+class ResilientCaller:
+    """Runs a function under a deadline with retries, hedging and a breaker."""
+
+    def __init__(self, name, timeout=10.0, retries=2, backoff=0.25, hedge=True,
+                 hedge_min_samples=20, breaker=None, max_workers=8, discard=None):
+        self.name = name
+        # Called with the result of an attempt nobody is waiting for any
+        # more (lost a hedge race, or finished after the deadline), so it
+        # can be released, e.g. an open stream closed
+        self.discard = discard
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.histogram = LatencyHistogram()
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.failed = 0
+        self.short_circuited = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn(*args, **kwargs)` and return its result.
+
+        Raises:
+            CircuitOpenError: The breaker is open.
+            DeadlineExceeded: No attempt finished within `timeout`.
+            Exception: The last attempt's error once retries run out.
+        """
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        self.calls += 1
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(fn, args, kwargs, deadline)
+            except Exception as e:
+                attempt += 1
+                remaining = deadline - time.monotonic()
+                if attempt > self.retries or remaining <= 0 or not is_retryable(e):
+                    self.failed += 1
+                    self.breaker.record_failure()
+                    raise
+                self.retried += 1
+                # Full jitter keeps concurrent retries from synchronizing
+                time.sleep(random.uniform(0, min(remaining, self.backoff * 2 ** (attempt - 1))))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _hedge_delay(self):
+        if not self.hedge or len(self.histogram.recent) < self.hedge_min_samples:
+            return None
+        return self.histogram.percentile(95)
+
+    def _attempt(self, fn, args, kwargs, deadline):
+        start = time.monotonic()
+        pending = {self._pool.submit(fn, *args, **kwargs)}
+        hedge_at = self._hedge_delay()
+        if hedge_at is not None:
+            hedge_at += start
+        error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wake = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=wake - now, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    self.histogram.record(time.monotonic() - start)
+                    # Losers, and any other attempt that finished alongside
+                    self._abandon((done - {future}) | pending)
+                    return future.result()
+                error = future.exception()
+
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                # Slow attempt: race a duplicate against it
+                self.hedged += 1
+                pending.add(self._pool.submit(fn, *args, **kwargs))
+                hedge_at = None
+
+        self._abandon(pending)
+        if pending or error is None:
+            raise DeadlineExceeded(f"{self.name} call exceeded {self.timeout:.1f}s")
+        raise error
+
+    def _abandon(self, futures):
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(self._release)
+
+    def _release(self, future):
+        if self.discard is None or future.cancelled() or future.exception() is not None:
+            return
+        try:
+            self.discard(future.result())
+        except Exception as e:
+            print(f"{self.name}: error releasing an abandoned attempt:", e)
+
+    def stats(self):
+        """Return call counters, breaker state and the latency histogram."""
+        return {
+            "calls": self.calls,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "failed": self.failed,
+            "short_circuited": self.short_circuited,
+            "breaker": self.breaker.state,
+            "latency": self.histogram.snapshot(),
+        }
@@ -0,0 +1,164 @@
+"""Cache of AI replies in front of the Gemini client.
+
+Prompts are normalized (case, punctuation, filler words) and combined
+with a hash of the persona's system prompt, so the same question asked
+of different personas is cached separately and editing a persona
+invalidates its old answers. Lookups hit a bounded in-memory LRU first
+and, optionally, the `ai_cache` table next to `ai_log` so answers
+survive restarts. Every entry carries a TTL, and time-sensitive prompts
+bypass the cache.
+
+Only replies to prompts sent without conversation context are cached.
+Callers pass the context they send with the prompt; when it is not
+empty ("what about him?" only makes sense after what came before) the
+prompt bypasses the cache, both for reading and writing. With
+`MEMORY_ENABLED` that means chat questions are cached only until the
+conversation has its first turn, e.g. the first question of a session.
+"""
+
+import datetime
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import db
+from config import AI_CACHE_SIZE, AI_CACHE_TTL, AI_CACHE_PERSIST, AI_CACHE_BYPASS_WORDS
+from utils import personas, normalize_prompt
+
+
+def persona_version(persona="chat"):
+    """Short hash that changes whenever the persona's text changes."""
+    return hashlib.sha256(personas[persona].encode("utf-8")).hexdigest()[:12]
+
+
+_BYPASS = re.compile(r"\b(" + "|".join(map(re.escape, AI_CACHE_BYPASS_WORDS)) + r")\b")
+
+
+class ResponseCache:
+    """Two-tier (memory, then database) TTL cache of AI replies."""
+
+    def __init__(self, maxsize=AI_CACHE_SIZE, ttl=AI_CACHE_TTL, persist=AI_CACHE_PERSIST):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist = persist
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._entries = OrderedDict()  # key -> (answer, expires_at epoch)
+        self._lock = threading.Lock()
+        self._purged = False
+
+    @staticmethod
+    def key(prompt, persona="chat"):
+        """Return the cache key for `prompt` under a persona's current version."""
+        raw = f"{persona_version(persona)}\0{normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_time_sensitive(prompt):
+        return _BYPASS.search(prompt.lower()) is not None
+
+    @classmethod
+    def is_cacheable(cls, prompt, context=""):
+        """Return True if replies to `prompt` sent with `context` may be cached."""
+        return not context and not cls.is_time_sensitive(prompt)
+
+    def get(self, prompt, persona="chat", context=""):
+        """Return a cached reply for `prompt`, or None.
+
+        `context` is the conversation text sent with the prompt; anything
+        but "" bypasses the cache.
+        """
+        if not self.is_cacheable(prompt, context):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        key = self.key(prompt, persona)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            # Expired entries stay until LRU eviction so `get_stale` can
+            # still answer from them when the model is unreachable
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+        if self.persist:
+            row = self._load(key, now)
+            if row is not None:
+                answer, expires_at = row
+                with self._lock:
+                    self.persistent_hits += 1
+                    self._remember(key, answer, expires_at.timestamp())
+                return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_stale(self, prompt, persona="chat", context=""):
+        """Return any in-memory reply for `prompt`, even if expired.
+
+        Used as a fallback when the model is unreachable, where an old
+        answer beats no answer. Like `get`, never answers a prompt sent
+        with conversation context.
+        """
+        if context:
+            return None
+        with self._lock:
+            entry = self._entries.get(self.key(prompt, persona))
+        return entry[0] if entry is not None else None
+
+    def put(self, prompt, answer, persona="chat", context=""):
+        """Store `answer` for `prompt` in both tiers, unless it had context."""
+        if not self.is_cacheable(prompt, context):
+            return
+        key = self.key(prompt, persona)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, answer, expires_at)
+        if self.persist:
+            try:
+                db.cache_put(key, prompt, answer, datetime.datetime.fromtimestamp(expires_at))
+            except Exception as e:
+                print("Response cache write error:", e)
+
+    def _remember(self, key, answer, expires_at):
+        self._entries[key] = (answer, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _load(self, key, now):
+        # The database tier is best effort: if MySQL is down, just miss
+        try:
+            now_dt = datetime.datetime.fromtimestamp(now)
+            if not self._purged:
+                self._purged = True
+                db.cache_purge(now_dt)
+            return db.cache_get(key, now_dt)
+        except Exception as e:
+            print("Response cache read error:", e)
+            return None
+
+    def metrics(self):
+        """Return hit/miss counters and the overall hit rate."""
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "entries": len(self._entries),
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,251 @@
+"""Retention job for `ai_log`: keep a hot window, archive the rest.
+
+On MySQL, `ai_log` and `ai_timing` are partitioned by month (`pYYYYMM`,
+plus a `pmax` catch-all, see `db_setup.py`). Once a month falls out of the hot window
+(`LOG_RETENTION_MONTHS` full months before the current one), `run`
+
+1. streams its rows into `archive/ai_log-YYYY-MM.jsonl.gz`
+   (see `archive.py`), and
+2. drops the month's partition, which is a metadata operation instead
+   of a row-by-row DELETE.
+
+It also adds partitions for the coming months (`LOG_PARTITIONS_AHEAD`)
+to both tables by splitting the empty `pmax`, and prunes `ai_timing`
+(by dropping its old partitions, without archiving) and the embedded
+search index to the same window. On SQLite, or unpartitioned MySQL
+tables, old rows are removed with one ranged DELETE per table.
+
+`start` runs the job in a background thread at startup and then once a
+day. Run it by hand with:
+
+    python retention.py [--dry-run]
+"""
+
+import datetime
+import sys
+import threading
+
+import archive
+import db
+import storage
+from config import (
+    DB_NAME, LOG_RETENTION_MONTHS, LOG_PARTITIONS_AHEAD, HISTORY_PAGE_SIZE, RETENTION_INTERVAL,
+)
+
+
+# Monthly partitioned tables and the column they are partitioned on
+PARTITIONED_TABLES = {"ai_log": "timestamp", "ai_timing": "log_at"}
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def partition_defs(first, last):
+    """PARTITION clauses for every month from `first` to `last`, then pmax."""
+    defs = []
+    month = first
+    while month <= last:
+        upper = add_months(month, 1)
+        defs.append(f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))")
+        month = upper
+    defs.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return defs
+
+
+def partition_clause(first, last, column="timestamp"):
+    """`PARTITION BY` clause for a table partitioned by month on `column`."""
+    return (f"PARTITION BY RANGE (TO_DAYS({column})) (\n    "
+            + ",\n    ".join(partition_defs(first, last)) + "\n)")
+
+
+def partitions(cursor, table="ai_log"):
+    """Return the names of `table`'s partitions (empty if unpartitioned)."""
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+        (DB_NAME, table),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _partitions(table="ai_log"):
+    if storage.get_backend().name != "mysql":
+        return []
+    mycon = db.get_connection()
+    try:
+        return partitions(mycon.cursor(), table)
+    finally:
+        mycon.close()
+
+
+def ensure_partitions(now, ahead=LOG_PARTITIONS_AHEAD, dry_run=False):
+    """Split `pmax` so partitions exist up to `ahead` months after `now`.
+
+    Returns:
+        The (table, partition) pairs added.
+    """
+    added = []
+    target = add_months(month_start(now), ahead)
+    for table in PARTITIONED_TABLES:
+        existing = sorted(p for p in _partitions(table) if p != "pmax")
+        if not existing:
+            continue
+        last = datetime.datetime.strptime(existing[-1], "p%Y%m")
+        if last >= target:
+            continue
+        first_new = add_months(last, 1)
+        names = [partition_name(m) for m in _months(first_new, add_months(target, 1))]
+        print(f"Adding {table} partitions {', '.join(names)}")
+        added += [(table, name) for name in names]
+        if not dry_run:
+            mycon = db.get_connection()
+            try:
+                # pmax is empty (rows this far ahead don't exist yet), so
+                # reorganizing it copies nothing
+                mycon.cursor().execute(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+                    + ", ".join(partition_defs(first_new, target)) + ")"
+                )
+            finally:
+                mycon.close()
+    return added
+
+
+def _months(start, end):
+    month = start
+    while month < end:
+        yield month
+        month = add_months(month, 1)
+
+
+def oldest_timestamp():
+    mycon = db.get_connection()
+    try:
+        cursor = mycon.cursor()
+        # ORDER BY/LIMIT rather than MIN(): same index lookup, and SQLite
+        # keeps the column's datetime conversion
+        cursor.execute("SELECT timestamp FROM ai_log ORDER BY timestamp LIMIT 1")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        mycon.close()
+
+
+def drop_month(month, partitioned):
+    """Remove one archived month from `ai_log`."""
+    name = partition_name(month)
+    mycon = db.get_connection()
+    try:
+        cursor = mycon.cursor()
+        if name in partitioned:
+            cursor.execute(f"ALTER TABLE ai_log DROP PARTITION {name}")
+        else:
+            cursor.execute(
+                db.sql("DELETE FROM ai_log WHERE timestamp >= %s AND timestamp < %s"),
+                (month, add_months(month, 1)),
+            )
+        mycon.commit()
+    finally:
+        mycon.close()
+
+
+def prune_timings(cutoff):
+    """Remove `ai_timing` rows before `cutoff` (a month start).
+
+    Timings are not archived. A partitioned table loses whole months
+    with DROP PARTITION; otherwise one ranged DELETE runs.
+
+    Returns:
+        The names of the partitions dropped.
+    """
+    existing = _partitions("ai_timing")
+    old = sorted(p for p in existing if p != "pmax" and p < partition_name(cutoff))
+    mycon = db.get_connection()
+    try:
+        cursor = mycon.cursor()
+        if not existing:
+            cursor.execute(db.sql("DELETE FROM ai_timing WHERE log_at < %s"), (cutoff,))
+        elif old:
+            # The first partition also holds anything older than its
+            # month, all of it before the cutoff too
+            cursor.execute(f"ALTER TABLE ai_timing DROP PARTITION {', '.join(old)}")
+        mycon.commit()
+    finally:
+        mycon.close()
+    return old
+
+
+def run(now=None, retention_months=LOG_RETENTION_MONTHS, dry_run=False):
+    """Archive and drop every month older than the hot window.
+
+    Returns:
+        A list of (month, archived row count).
+    """
+    now = now or datetime.datetime.now()
+    cutoff = add_months(month_start(now), -retention_months)
+    ensure_partitions(now, dry_run=dry_run)
+
+    oldest = oldest_timestamp()
+    if oldest is None or oldest >= cutoff:
+        return []
+
+    partitioned = set(_partitions())
+    done = []
+    # Oldest first: the first partition also holds anything older than
+    # its month, so older months must be archived before it is dropped
+    for month in _months(month_start(oldest), cutoff):
+        pages = db.iter_log_range(month, add_months(month, 1), HISTORY_PAGE_SIZE)
+        if dry_run:
+            count = sum(len(page) for page in pages)
+            print(f"Would archive {count} rows from {month:%Y-%m}")
+        else:
+            path, count = archive.write_month(month, pages)
+            drop_month(month, partitioned)
+            print(f"Archived {month:%Y-%m} to {path} ({count} rows)")
+        done.append((month, count))
+
+    if not dry_run:
+        prune_timings(cutoff)
+        # Keep the embedded search index in step with the table
+        history_search = sys.modules.get("history_search")
+        if history_search is not None and history_search._index is not None:
+            history_search._index.remove_before(cutoff)
+    return done
+
+
+def start(interval=RETENTION_INTERVAL):
+    """Run the job now and then every `interval` seconds in a daemon thread."""
+    def loop():
+        while True:
+            try:
+                run()
+            except Exception as e:
+                print("Retention job error:", e)
+            stop.wait(interval)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=loop, name="jarvis-retention", daemon=True)
+    thread.start()
+    return stop
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive ai_log months older than the hot window")
+    parser.add_argument("--months", type=int, default=LOG_RETENTION_MONTHS, help="hot window in months")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    args = parser.parse_args()
+    result = run(retention_months=args.months, dry_run=args.dry_run)
+    if not result:
+        print("Nothing to archive.")
@@ -0,0 +1,171 @@
+"""asyncio runtime that overlaps listening, dispatch, AI, speech and logging.
+
+`main.start_jarvis` runs one stage after another: listen, handle, speak,
+log, then listen again. Here every stage is its own task and the stages
+are connected by queues:
+
+    listener -> queries -> dispatcher -> speech -> speaker
+                                      `-> log    -> logger
+
+Blocking libraries (speech_recognition, the local command handlers and
+the DB writer) run in the default executor. Gemini is called through the
+async client, so sentences reach the speaker while the rest of the
+reply is still being generated, and the next command is heard while
+the previous one is still being logged.
+
+Run with `python main.py --async`.
+"""
+
+import asyncio
+
+import ai
+import db
+import planner
+from memory import log_turn
+import voice as vc
+
+# Marks the end of a queue's stream
+STOP = object()
+
+
+class AsyncJarvis:
+    """One assistant session made of cooperating asyncio tasks."""
+
+    def __init__(self, engine, wake_word="jarvis"):
+        self.engine = engine
+        self.wake_word = wake_word
+        self.queries = asyncio.Queue()
+        self.speech = asyncio.Queue()
+        self.log = asyncio.Queue()
+        # Held by whoever is using the microphone: the listener, or a
+        # local handler running a spoken dialogue (email, message)
+        self.mic = asyncio.Lock()
+        # Set while nothing is speaking or talking to the user, so the
+        # listener does not transcribe the assistant's own voice
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self._busy = 0
+        self.running = True
+
+    def _enter_busy(self):
+        self._busy += 1
+        self.idle.clear()
+
+    def _leave_busy(self):
+        self._busy -= 1
+        if self._busy == 0:
+            self.idle.set()
+
+    async def listener(self):
+        """Transcribe commands and queue the ones addressed to Jarvis."""
+        while self.running:
+            await self.idle.wait()
+            async with self.mic:
+                query = (await asyncio.to_thread(vc.take_command)).lower()
+            if self.running and self.wake_word in query:
+                # Busy before the loop comes back to `idle.wait()`, which
+                # would not yield while the event is still set; the
+                # dispatcher releases it once the command is handled
+                self._enter_busy()
+                await self.queries.put(query)
+
+    async def dispatcher(self):
+        """Route each command fragment to a local handler or to Gemini."""
+        while self.running:
+            query = await self.queries.get()
+            try:
+                for fragment in planner.split_fragments(query):
+                    if planner.is_stop(fragment, self.wake_word):
+                        self.speech.put_nowait("Goodbye sir.")
+                        self.running = False
+                        break
+                    await self.handle(fragment)
+            finally:
+                # Taken by the listener when it queued the command
+                self._leave_busy()
+
+    async def handle(self, fragment):
+        intent = self.engine.match(fragment)
+        if intent is None:
+            # Busy from the question until the reply has been spoken, so
+            # the listener doesn't take the microphone while Gemini is
+            # still thinking or between streamed sentences
+            self._enter_busy()
+            try:
+                answer = await ai.start_assistant_async(fragment, self.speech.put_nowait)
+            finally:
+                # Released by the speaker after the reply's last sentence
+                self.speech.put_nowait(self._leave_busy)
+            print("Jarvis:", answer)
+        else:
+            # Local handlers speak and may ask follow-up questions, so
+            # they get the microphone to themselves
+            self._enter_busy()
+            try:
+                async with self.mic:
+                    answer = await asyncio.to_thread(intent.handler, fragment)
+            finally:
+                self._leave_busy()
+        await self.log.put((fragment, answer))
+
+    async def speaker(self):
+        """Queue sentences for playback as soon as they arrive.
+
+        Besides sentences, the queue carries callables that run once
+        everything queued before them has started playing (`handle`
+        uses one to end an AI reply's busy period).
+        """
+        speaking = False
+        handle = None
+        while True:
+            sentence = await self.speech.get()
+            if sentence is STOP:
+                return
+            if callable(sentence):
+                sentence()
+            else:
+                if not speaking:
+                    speaking = True
+                    self._enter_busy()
+                handle = vc.speak(sentence, block=False)
+            if speaking and self.speech.empty():
+                # End of a burst: wait for the audio to finish before
+                # letting the listener back on the microphone
+                await asyncio.to_thread(handle.wait)
+                if self.speech.empty():
+                    speaking = False
+                    self._leave_busy()
+
+    async def logger(self):
+        """Persist (query, answer) pairs without holding up other stages."""
+        while True:
+            item = await self.log.get()
+            if item is STOP:
+                return
+            try:
+                await asyncio.to_thread(log_turn, *item)
+            except Exception as e:
+                print("Log error:", e)
+
+    async def run(self):
+        """Wait for the wake word, then run every stage until "stop"."""
+        await asyncio.to_thread(vc.wake_word_listener, self.wake_word)
+
+        speaker = asyncio.create_task(self.speaker())
+        logger = asyncio.create_task(self.logger())
+        listener = asyncio.create_task(self.listener())
+        self.speech.put_nowait("Hello sir , How May I Help You?")
+
+        await self.dispatcher()
+
+        # Drain speech and logs, then stop listening
+        await self.speech.put(STOP)
+        await self.log.put(STOP)
+        await asyncio.gather(speaker, logger)
+        listener.cancel()
+        await asyncio.to_thread(db.close)
+
+
+def run(engine, wake_word="jarvis"):
+    """Blocking entry point for the async runtime."""
+    asyncio.run(AsyncJarvis(engine, wake_word).run())
@@ -0,0 +1,421 @@
+"""Text server: the assistant's commands and AI for many clients at once.
+
+`start_jarvis` serves one user through the microphone, one turn at a
+time. `JarvisServer` puts the same `main.main` behind a local endpoint:
+
+* WebSocket (`ws://host:port/?session=ID`): every text frame is a query
+  (plain text or {"text": "..."}); the server streams JSON events back:
+  {"type": "say"} for each sentence as it is produced (AI replies
+  stream sentence by sentence), {"type": "ask"} when a command waits
+  for a follow-up answer (email, message dialogues; the next frame
+  answers it), then {"type": "reply"} with the full reply and timing.
+* HTTP: `GET /query?q=...&session=ID` returns the same events gathered
+  into one JSON object, and `GET /health` returns server counters.
+
+Turns run on a bounded pool of `SERVER_WORKERS` threads. Each runs
+`main.main` with `voice.redirect` (speech goes to the client, follow-up
+questions read the client's next message) and `memory.use_memory` (each
+session has its own conversation context). A session's queries run
+one after another, so its replies stay in order.
+
+A session has one consumer at a time: a second WebSocket (close code
+1008) or an HTTP query while another connection is attached is refused,
+and events produced while nobody is attached are dropped rather than
+delivered to the next connection. If a WebSocket client disconnects
+during a dialogue, the waiting question (and any later one, until a
+client reattaches) raises `ClientGone` in the handler, so the dialogue
+ends instead of holding a worker for `SERVER_ANSWER_TIMEOUT` per
+question.
+
+Admission control: at most `SERVER_WORKERS + SERVER_QUEUE` turns are
+admitted at once and each session may have `SERVER_SESSION_QUEUE`
+waiting. Queries beyond that are refused right away ({"type": "busy"}
+or HTTP 503 with Retry-After) instead of queueing without bound.
+
+Run with `python main.py --serve`; `load_test.py` drives it with many
+clients against fake backends. Requires the `websockets` package.
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import voice as vc
+from memory import ConversationMemory, use_memory
+from config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_QUEUE,
+    SERVER_SESSION_QUEUE,
+    SERVER_MAX_SESSIONS,
+    SERVER_SESSION_TTL,
+    SERVER_ANSWER_TIMEOUT,
+    SERVER_BLOCKED_INTENTS,
+)
+
+
+class ClientGone(Exception):
+    """The client disconnected while a command was waiting for its answer."""
+
+
+# Put on `Session.answers` to wake a handler whose client hung up
+_HUNG_UP = object()
+
+
+class Session:
+    """One client's conversation: its queries, memory and event stream.
+
+    Events are produced on worker threads and consumed on the event
+    loop, so `emit` hands them over with `call_soon_threadsafe`. They go
+    to the queue of the connection attached when they are delivered
+    (`attach`), or nowhere if none is.
+    """
+
+    def __init__(self, session_id, loop, answer_timeout=SERVER_ANSWER_TIMEOUT):
+        self.id = session_id
+        self.loop = loop
+        self.answer_timeout = answer_timeout
+        # The name tags this session's turns in `ai_log` (see `db.response`)
+        self.memory = ConversationMemory(name=f"session-{session_id}"[:40], persist=False)
+        self.inbox = queue.Queue()      # queries waiting for a worker
+        self.answers = queue.Queue()    # replies to follow-up questions
+        self.events = None              # event queue of the attached connection
+        self.scheduled = False          # a worker is draining `inbox`
+        self.waiting = False            # a handler is blocked in `listen`
+        self.hung_up = False            # the WebSocket client left mid-dialogue
+        self.pending = 0                # admitted turns not yet replied to
+        self.turns = 0
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    @property
+    def attached(self):
+        return self.events is not None
+
+    # Event loop thread
+
+    def attach(self):
+        """Give a new connection the session's events; None if one is attached."""
+        if self.events is not None:
+            return None
+        self.hung_up = False
+        self.events = asyncio.Queue()
+        return self.events
+
+    def detach(self, hang_up=False):
+        """Stop delivering events.
+
+        With `hang_up`, the waiting question and any later ones raise
+        `ClientGone` until a connection attaches again.
+        """
+        self.events = None
+        self.last_seen = time.monotonic()
+        if hang_up:
+            self.hung_up = True
+            if self.waiting:
+                self.answers.put(_HUNG_UP)
+
+    def _deliver(self, event):
+        if self.events is not None:
+            self.events.put_nowait(event)
+
+    def emit(self, event):
+        self.loop.call_soon_threadsafe(self._deliver, event)
+
+    # `voice.redirect` channel: called on the worker thread
+
+    def say(self, text):
+        self.emit({"type": "say", "text": text})
+
+    def listen(self):
+        # Drop an answer left over from a dialogue cancelled on disconnect
+        while not self.answers.empty():
+            self.answers.get_nowait()
+        if self.hung_up:
+            raise ClientGone(self.id)
+        self.waiting = True
+        self.emit({"type": "ask"})
+        try:
+            answer = self.answers.get(timeout=self.answer_timeout)
+        except queue.Empty:
+            return "none"
+        finally:
+            self.waiting = False
+        if answer is _HUNG_UP:
+            raise ClientGone(self.id)
+        return answer
+
+
+class JarvisServer:
+    """Admission control, worker pool and sessions around a turn handler.
+
+    Args:
+        engine: The `IntentEngine` used by `handle`, to refuse
+            `blocked` intents before they run.
+        handle: Callable taking a query and returning the reply
+            (`main.main`).
+    """
+
+    def __init__(self, engine, handle, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE,
+                 session_queue=SERVER_SESSION_QUEUE, max_sessions=SERVER_MAX_SESSIONS,
+                 session_ttl=SERVER_SESSION_TTL, blocked=SERVER_BLOCKED_INTENTS):
+        self.engine = engine
+        self.handle = handle
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.session_queue = session_queue
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.blocked = frozenset(blocked)
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="jarvis-worker")
+        self.sessions = {}
+        self.loop = None
+        self.port = None
+        self.admitted = 0               # turns admitted and not finished
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    # ---- sessions and admission (event loop thread) -----------------
+
+    def session(self, session_id=None):
+        """Return the session `session_id`, creating it if needed (None if full)."""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            if len(self.sessions) >= self.max_sessions:
+                return None
+            session = Session(session_id or uuid.uuid4().hex[:12], self.loop)
+            self.sessions[session.id] = session
+        session.last_seen = time.monotonic()
+        return session
+
+    def submit(self, session, text):
+        """Queue `text` for `session`.
+
+        Returns:
+            None if accepted, otherwise the reason it was refused.
+        """
+        session.last_seen = time.monotonic()
+        if session.waiting:
+            # Answer to a follow-up question; the turn is already admitted
+            session.answers.put(text)
+            return None
+        if session.inbox.qsize() >= self.session_queue:
+            self.rejected += 1
+            return "too many queries waiting in this session"
+        with self._lock:
+            if self.admitted >= self.limit:
+                self.rejected += 1
+                return "server busy"
+            self.admitted += 1
+            self.accepted += 1
+            session.pending += 1
+        session.inbox.put((text, time.perf_counter()))
+        with session.lock:
+            if not session.scheduled:
+                session.scheduled = True
+                self.pool.submit(self._drain, session)
+        return None
+
+    async def sweep(self, interval=60):
+        """Drop sessions that have been idle for longer than the TTL."""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if (not session.attached and not session.busy
+                        and now - session.last_seen > self.session_ttl):
+                    del self.sessions[session_id]
+
+    # ---- turns (worker threads) -------------------------------------
+
+    def _drain(self, session):
+        # One worker per session at a time keeps its replies in order
+        while True:
+            with session.lock:
+                try:
+                    text, queued_at = session.inbox.get_nowait()
+                except queue.Empty:
+                    session.scheduled = False
+                    return
+            self._turn(session, text, queued_at)
+
+    def _turn(self, session, text, queued_at):
+        start = time.perf_counter()
+        event = {"type": "reply"}
+        try:
+            intent = self.engine.match(text)
+            if intent is not None and intent.name in self.blocked:
+                event["text"] = "Sorry, " + intent.name + " is not available remotely."
+            else:
+                with vc.redirect(session), use_memory(session.memory):
+                    event["text"] = self.handle(text)
+        except Exception as e:
+            print("Server turn error:", e)
+            event = {"type": "error", "text": "Something went wrong handling that."}
+        finally:
+            with self._lock:
+                self.admitted -= 1
+                self.completed += 1
+                session.pending -= 1
+            session.turns += 1
+        now = time.perf_counter()
+        event["queue_ms"] = round((start - queued_at) * 1000, 1)
+        event["ms"] = round((now - start) * 1000, 1)
+        session.emit(event)
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "workers": self.workers,
+            "admitted": self.admitted,
+            "limit": self.limit,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+        }
+
+    # ---- protocol (event loop thread) -------------------------------
+
+    async def websocket(self, connection):
+        """Serve one WebSocket client until it disconnects."""
+        params = parse_qs(urlsplit(connection.request.path).query)
+        session = self.session(params.get("session", [None])[0])
+        if session is None:
+            await connection.close(1013, "too many sessions")
+            return
+        events = session.attach()
+        if events is None:
+            await connection.close(1008, "session already connected")
+            return
+
+        async def sender():
+            while True:
+                event = await events.get()
+                await connection.send(json.dumps(event))
+
+        await connection.send(json.dumps({"type": "session", "id": session.id}))
+        sending = asyncio.create_task(sender())
+        try:
+            async for message in connection:
+                text = message
+                if message.startswith("{"):
+                    try:
+                        text = json.loads(message).get("text", "")
+                    except ValueError:
+                        pass
+                text = text.strip()
+                if not text:
+                    continue
+                refused = self.submit(session, text)
+                if refused:
+                    await connection.send(json.dumps({"type": "busy", "reason": refused}))
+        except Exception as e:
+            print("WebSocket client error:", e)
+        finally:
+            sending.cancel()
+            # Nobody is left to answer a follow-up question
+            session.detach(hang_up=True)
+
+    async def http(self, connection, request):
+        """Answer plain HTTP requests; None lets WebSocket upgrades through."""
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return None
+        url = urlsplit(request.path)
+        params = parse_qs(url.query)
+        if url.path == "/health":
+            return self._json(connection, HTTPStatus.OK, self.stats())
+        if url.path != "/query" or not params.get("q"):
+            return self._json(connection, HTTPStatus.NOT_FOUND, {"error": "use /query?q=... or /health"})
+
+        session = self.session(params.get("session", [None])[0])
+        if session is None:
+            return self._json(connection, HTTPStatus.SERVICE_UNAVAILABLE, {"error": "too many sessions"},
+                              retry_after=5)
+        if session.busy and not session.waiting:
+            return self._json(connection, HTTPStatus.CONFLICT,
+                              {"session": session.id, "error": "a query is already running"})
+        events = session.attach()
+        if events is None:
+            return self._json(connection, HTTPStatus.CONFLICT,
+                              {"session": session.id, "error": "session is in use by another connection"})
+        try:
+            refused = self.submit(session, params["q"][0].strip())
+            if refused:
+                return self._json(connection, HTTPStatus.SERVICE_UNAVAILABLE,
+                                  {"session": session.id, "error": refused}, retry_after=1)
+
+            said = []
+            while True:
+                event = await events.get()
+                if event["type"] == "say":
+                    said.append(event["text"])
+                    continue
+                body = {"session": session.id, "say": said, "awaiting": event["type"] == "ask"}
+                if event["type"] != "ask":
+                    body.update(event)
+                return self._json(connection, HTTPStatus.OK, body)
+        finally:
+            # After an "ask" the next /query carries the answer, so the
+            # dialogue stays open
+            session.detach()
+
+    @staticmethod
+    def _json(connection, status, body, retry_after=None):
+        response = connection.respond(status, json.dumps(body) + "\n")
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = "application/json"
+        if retry_after is not None:
+            response.headers["Retry-After"] = str(retry_after)
+        return response
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, ready=None):
+        """Run the server until cancelled.
+
+        Args:
+            ready: Optional `threading.Event` set once the port is open.
+        """
+        from websockets.asyncio.server import serve
+
+        self.loop = asyncio.get_running_loop()
+        sweeper = asyncio.create_task(self.sweep())
+        try:
+            async with serve(self.websocket, host, port, process_request=self.http) as server:
+                # Port 0 picks a free port (used by `load_test.py`)
+                self.port = server.sockets[0].getsockname()[1]
+                print(f"Jarvis server listening on ws://{host}:{self.port}/ "
+                      f"and http://{host}:{self.port}/query")
+                if ready is not None:
+                    ready.set()
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run(engine, handle, host=SERVER_HOST, port=SERVER_PORT):
+    """Blocking entry point used by `python main.py --serve`."""
+    server = JarvisServer(engine, handle)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        # Flush any interactions still waiting in the log writer
+        db.close()
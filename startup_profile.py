@@ -0,0 +1,84 @@
+"""Startup-time profile, shown by `python main.py --profile-startup`.
+
+The report has two parts:
+
+* Import time of every top-level module pulled in by `import main`,
+  measured in a fresh interpreter with `python -X importtime`.
+* Time to initialize each lazily loaded backend (see
+  `main.backend_steps`), i.e. what the first use of an intent would
+  otherwise pay.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+
+def import_times(module="main"):
+    """Return (name, self_ms, total_ms) for each module `module` imports.
+
+    Covers the direct imports of `module` plus its own body, sorted
+    slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+
+    # Output is post-order: a module's direct imports (one level deeper)
+    # are printed just before the module itself
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, total_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two extra spaces per level
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        row = (name.strip(), int(self_us) / 1000, int(total_us) / 1000)
+        if depth == 1:
+            if row[0] == module:
+                rows = children + [(f"{module} (own body)", row[1], row[1])]
+                return sorted(rows, key=lambda r: r[2], reverse=True)
+            children = []
+        elif depth == 2:
+            children.append(row)
+    return []
+
+
+def init_times():
+    """Return (name, ms, error) for each lazy backend, loaded in order."""
+    import main
+
+    rows = []
+    for name, step in main.backend_steps():
+        start = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        rows.append((name, (time.perf_counter() - start) * 1000, error))
+    return rows
+
+
+def report():
+    """Print the startup profile to stdout."""
+    imports = import_times()
+    print("Import time for `import main` (python -X importtime)")
+    print(f"  {'module':<32} {'self ms':>9} {'total ms':>9}")
+    for name, self_ms, total_ms in imports:
+        print(f"  {name:<32} {self_ms:>9.1f} {total_ms:>9.1f}")
+    print(f"  {'total':<32} {'':>9} {sum(r[2] for r in imports):>9.1f}")
+
+    print()
+    print("Backend initialization (first use)")
+    inits = init_times()
+    for name, ms, error in inits:
+        status = f"  failed: {error}" if error else ""
+        print(f"  {name:<32} {ms:>9.1f} ms{status}")
+    print(f"  {'total':<32} {sum(r[1] for r in inits):>9.1f} ms")
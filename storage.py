@@ -0,0 +1,232 @@
+"""Storage backends behind `db.py`.
+
+`db.py` writes its SQL once, with %s placeholders, and runs it through
+the backend selected by `DB_BACKEND` in `config.py`:
+
+* `MySQLBackend` - the networked MySQL server, through a small
+  connection pool (the original setup; schema created by `db_setup.py`),
+* `SQLiteBackend` - an embedded database file for single-user desktops.
+  It runs in WAL mode so the background log writer and readers don't
+  block each other, keeps one connection per thread (sqlite3 caches
+  each connection's prepared statements), and creates its schema on
+  first use.
+
+Each backend also supplies the few statements whose syntax differs
+(upserts) and says whether it has a FULLTEXT index for history search.
+`migrate_storage.py` copies data between backends.
+"""
+
+import datetime
+import threading
+
+from config import (
+    DB_BACKEND, DB_USER, DB_PASSWORD, DB_HOST, DB_NAME, DB_POOL_SIZE, SQLITE_PATH,
+)
+
+
+class MySQLBackend:
+    """Pooled connections to the MySQL server in `config.py`."""
+
+    name = "mysql"
+
+    def __init__(self, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, database=DB_NAME,
+                 pool_size=DB_POOL_SIZE):
+        self.options = dict(user=user, password=password, host=host, database=database)
+        self.pool_size = pool_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self._fulltext = None
+
+    @property
+    def fulltext(self):
+        """True if `ai_log` has the FULLTEXT index, read from the schema once.
+
+        `db_setup.py` creates it on unpartitioned tables only (MySQL has
+        no FULLTEXT indexes on partitioned ones).
+        """
+        if self._fulltext is None:
+            try:
+                connection = self.connect()
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute(
+                        "SELECT 1 FROM information_schema.statistics WHERE table_schema = %s "
+                        "AND table_name = 'ai_log' AND index_name = 'ft_ai_log_text' LIMIT 1",
+                        (self.options["database"],),
+                    )
+                    self._fulltext = cursor.fetchone() is not None
+                finally:
+                    connection.close()
+            except Exception as e:
+                # Unknown until the server answers; ask again next time
+                print("FULLTEXT index check failed:", e)
+                return False
+        return self._fulltext
+
+    def connect(self):
+        """Borrow a pooled connection; `close()` hands it back to the pool."""
+        with self._lock:
+            if self._pool is None:
+                # Imported here so loading this module doesn't pull in
+                # the MySQL driver before the first query
+                from mysql.connector import pooling  # pooled MySQL DB-API connections
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name="jarvis", pool_size=self.pool_size, **self.options
+                )
+        return self._pool.get_connection()
+
+    def sql(self, statement):
+        return statement
+
+    def streaming_cursor(self, connection):
+        # Unbuffered: rows are streamed from the server as they are
+        # fetched rather than copied client-side up front
+        return connection.cursor(buffered=False)
+
+    def upsert(self, table, columns, key):
+        """INSERT of `columns` that updates the other columns when `key` exists."""
+        updates = ", ".join(f"{c} = VALUES({c})" for c in columns if c != key)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+
+class _ThreadConnection:
+    """A thread's SQLite connection; `close()` keeps it open for reuse."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        # Mirror a pool: drop any unfinished transaction, keep the handle
+        if self._connection.in_transaction:
+            self._connection.rollback()
+
+
+def _adapt_datetime(value):
+    return value.isoformat(" ")
+
+
+def _convert_datetime(raw):
+    return datetime.datetime.fromisoformat(raw.decode("utf-8"))
+
+
+class SQLiteBackend:
+    """Embedded database file in WAL mode, one connection per thread."""
+
+    name = "sqlite"
+    fulltext = False
+
+    # Same tables and indexes as `db_setup.py` creates on MySQL. SQLite's
+    # CURRENT_TIMESTAMP is UTC; defaults use local time like MySQL's NOW()
+    # and the timestamps `db.py` writes.
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS ai_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            command VARCHAR(255) NOT NULL,
+            response TEXT NOT NULL,
+            timestamp DATETIME DEFAULT (datetime('now', 'localtime')),
+            source VARCHAR(40) NOT NULL DEFAULT 'default'
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_ai_log_ts_id ON ai_log (timestamp, id)",
+        """CREATE TABLE IF NOT EXISTS ai_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            prompt VARCHAR(255) NOT NULL,
+            response TEXT NOT NULL,
+            expires_at DATETIME NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_ai_cache_expires ON ai_cache (expires_at)",
+        """CREATE TABLE IF NOT EXISTS ai_memory (
+            name VARCHAR(32) PRIMARY KEY,
+            summary TEXT NOT NULL,
+            folded_until DATETIME NULL,
+            updated_at DATETIME DEFAULT (datetime('now', 'localtime'))
+        )""",
+        """CREATE TABLE IF NOT EXISTS ai_timing (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            log_at DATETIME NOT NULL,
+            stage VARCHAR(32) NOT NULL,
+            ms DOUBLE NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_ai_timing_log_at ON ai_timing (log_at)",
+    )
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def _open(self):
+        import sqlite3
+
+        sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+        sqlite3.register_converter("DATETIME", _convert_datetime)
+        connection = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=256,   # prepared statements kept per connection
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL safe against corruption; only the last
+        # transactions can be lost on power failure
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        with self._lock:
+            if not self._schema_ready:
+                self.create_schema(connection)
+                self._schema_ready = True
+        return connection
+
+    def create_schema(self, connection):
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+        # Files created before turns were tagged with their conversation
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(ai_log)")}
+        if "source" not in columns:
+            connection.execute("ALTER TABLE ai_log ADD COLUMN source VARCHAR(40) NOT NULL DEFAULT 'default'")
+        connection.commit()
+
+    def connect(self):
+        """Return this thread's connection (opened on first use)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._open()
+        return _ThreadConnection(connection)
+
+    def sql(self, statement):
+        return statement.replace("%s", "?")
+
+    def streaming_cursor(self, connection):
+        # sqlite3 cursors already step through rows lazily
+        return connection.cursor()
+
+    def upsert(self, table, columns, key):
+        """INSERT of `columns` that updates the other columns when `key` exists."""
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != key)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))}) "
+            f"ON CONFLICT ({key}) DO UPDATE SET {updates}"
+        )
+
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the backend selected by `DB_BACKEND`."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if DB_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown DB_BACKEND {DB_BACKEND!r}; use one of {sorted(BACKENDS)}")
+            _backend = BACKENDS[DB_BACKEND]()
+    return _backend
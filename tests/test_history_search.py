@@ -0,0 +1,40 @@
+"""Embedded history index: postings only, text loaded for the top hits."""
+
+import datetime
+
+from history_search import InvertedIndex
+
+ROWS = {
+    1: ("how do i cook pasta", "Boil it in salted water.", datetime.datetime(2026, 1, 5)),
+    2: ("weather in paris", "Sunny.", datetime.datetime(2026, 2, 5)),
+    3: ("pasta sauce ideas", "Tomato and basil pasta.", datetime.datetime(2026, 3, 5)),
+}
+
+
+def test_search_loads_text_for_the_winners_only():
+    loaded = []
+
+    def load(ids):
+        loaded.append(list(ids))
+        return {i: ROWS[i] for i in ids if i in ROWS}
+
+    index = InvertedIndex(load)
+    for row_id, row in ROWS.items():
+        index.add(row_id, *row)
+    assert not hasattr(index, "docs")
+
+    hits = index.search("pasta", limit=1)
+    assert [(h[0], h[1]) for h in hits] == [(3, "pasta sauce ideas")]
+    assert loaded == [[3]]
+    assert [h[0] for h in index.search("pasta", since=datetime.datetime(2026, 2, 1))] == [3]
+
+
+def test_remove_before_drops_postings_of_old_rows():
+    index = InvertedIndex(lambda ids: {i: ROWS[i] for i in ids})
+    for row_id, row in ROWS.items():
+        index.add(row_id, *row)
+
+    assert index.remove_before(datetime.datetime(2026, 2, 1)) == 1
+    assert all(1 not in posting for posting in index.postings.values())
+    assert "boil" not in index.postings
+    assert [h[0] for h in index.search("pasta")] == [3]
@@ -0,0 +1,61 @@
+"""WhatsApp dispatcher: batching, failure reporting and draining on close."""
+
+import time
+
+import messenger
+from messenger import MessageDispatcher, RecordingTransport
+
+
+def test_messages_queued_together_share_one_batch():
+    transport = RecordingTransport()
+    dispatcher = MessageDispatcher(transport, window=0.2)
+    deliveries = [dispatcher.submit("+100", f"message {n}") for n in range(3)]
+    dispatcher.start()
+
+    assert [d.wait(5) for d in deliveries] == ["sent"] * 3
+    assert transport.sent == [("+100", f"message {n}") for n in range(3)]
+    assert dispatcher.batches == transport.sessions == 1
+    dispatcher.stop(5)
+
+
+def test_messages_outside_the_window_get_their_own_batch():
+    transport = RecordingTransport()
+    dispatcher = MessageDispatcher(transport, window=0.0)
+    dispatcher.start()
+    assert dispatcher.submit("+100", "first").wait(5) == "sent"
+    time.sleep(0.05)
+    assert dispatcher.submit("+100", "second").wait(5) == "sent"
+    assert dispatcher.batches == 2
+    dispatcher.stop(5)
+
+
+def test_failed_number_is_reported_without_stopping_the_batch():
+    transport = RecordingTransport(fail={"+200"})
+    dispatcher = MessageDispatcher(transport, window=0.2)
+    ok = dispatcher.submit("+100", "hello")
+    bad = dispatcher.submit("+200", "hello")
+    after = dispatcher.submit("+300", "hello")
+    dispatcher.start()
+
+    assert bad.wait(5) == "failed"
+    assert "+200" in bad.error
+    assert bad.sent_at is None
+    assert (ok.wait(5), after.wait(5)) == ("sent", "sent")
+    assert transport.sent == [("+100", "hello"), ("+300", "hello")]
+    dispatcher.stop(5)
+
+
+def test_close_sends_everything_still_queued(monkeypatch):
+    transport = RecordingTransport()
+    # A long window: only the stop marker ends the batch early
+    dispatcher = MessageDispatcher(transport, window=30)
+    monkeypatch.setattr(messenger, "_dispatcher", dispatcher)
+    dispatcher.start()
+    deliveries = [messenger.get_dispatcher().submit("+100", f"message {n}") for n in range(5)]
+
+    start = time.monotonic()
+    messenger.close(timeout=5)
+    assert time.monotonic() - start < 5
+    assert [d.status for d in deliveries] == ["sent"] * 5
+    assert not dispatcher.is_alive()
+    assert messenger._dispatcher is None
@@ -0,0 +1,113 @@
+"""Email outbox against a local SMTP stand-in (aiosmtpd)."""
+
+import email
+import socket
+import time
+
+import pytest
+
+import outbox
+from outbox import Outbox, SMTPSession
+
+# The same stand-in the outbox docs suggest for trying it by hand
+Controller = pytest.importorskip("aiosmtpd.controller").Controller
+
+
+class Mailbox:
+    """aiosmtpd handler that stores messages and can refuse the next few."""
+
+    def __init__(self):
+        self.messages = []
+        self.refuse = []  # SMTP replies for the next DATA commands
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.refuse:
+            return self.refuse.pop(0)
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    mailbox = Mailbox()
+    controller = Controller(mailbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    mailbox.port = controller.port
+    yield mailbox
+    controller.stop()
+
+
+def make_outbox(smtp, backoff=0.05):
+    session = SMTPSession(host="127.0.0.1", port=smtp.port, starttls=False, timeout=5)
+    return Outbox(session=session, sender="jarvis@example.com", backoff=backoff)
+
+
+def wait_for(worker, mail_id, statuses, timeout=5):
+    deadline = time.monotonic() + timeout
+    while worker.status(mail_id).status not in statuses:
+        assert time.monotonic() < deadline, worker.status(mail_id)
+        time.sleep(0.01)
+    return worker.status(mail_id)
+
+
+def test_queued_mail_is_delivered_over_one_connection(smtp):
+    worker = make_outbox(smtp)
+    worker.start()
+    ids = [worker.submit(f"user{n}@example.com", f"Subject {n}", f"Body {n}") for n in range(3)]
+
+    for mail_id in ids:
+        assert wait_for(worker, mail_id, {"sent", "failed"}).status == "sent"
+    assert [(m["To"], m["Subject"]) for m in smtp.messages] == [
+        (f"user{n}@example.com", f"Subject {n}") for n in range(3)
+    ]
+    assert smtp.messages[0].get_payload().strip() == "Body 0"
+    assert worker.stats()["connects"] == 1
+    worker.stop(5)
+
+
+def test_transient_failure_is_retried_from_the_retry_heap(smtp):
+    smtp.refuse = ["451 Try again later"]
+    worker = make_outbox(smtp)
+    worker.start()
+    mail_id = worker.submit("user@example.com", "Hello", "Body")
+
+    item = wait_for(worker, mail_id, {"sent", "failed"})
+    assert (item.status, item.attempts) == ("sent", 2)
+    assert "Try again later" in item.error
+    assert len(smtp.messages) == 1
+    worker.stop(5)
+
+
+def test_permanent_failure_is_not_retried(smtp):
+    smtp.refuse = ["550 No such user"]
+    worker = make_outbox(smtp)
+    worker.start()
+    mail_id = worker.submit("nobody@example.com", "Hello", "Body")
+
+    item = wait_for(worker, mail_id, {"sent", "failed"})
+    assert (item.status, item.attempts) == ("failed", 1)
+    assert smtp.messages == []
+    worker.stop(5)
+
+
+def test_close_flushes_mail_waiting_for_a_retry(smtp, monkeypatch):
+    smtp.refuse = ["451 Try again later"]
+    # The backoff alone would hold the retry for up to a minute
+    worker = make_outbox(smtp, backoff=60)
+    monkeypatch.setattr(outbox, "_outbox", worker)
+    worker.start()
+    mail_id = outbox.get_outbox().submit("user@example.com", "Hello", "Body")
+    wait_for(worker, mail_id, {"retry"})
+
+    start = time.monotonic()
+    outbox.close(timeout=5)
+    assert time.monotonic() - start < 5
+    assert worker.status(mail_id).status == "sent"
+    assert len(smtp.messages) == 1
+    assert not worker.is_alive()
@@ -0,0 +1,95 @@
+"""Resilience layer against the local fake Gemini server (`fake_gemini.py`)."""
+
+import time
+
+import pytest
+from google import genai
+
+import fake_gemini
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientCaller
+
+MODEL = "gemini-2.0-flash"
+
+
+@pytest.fixture
+def fake():
+    server = fake_gemini.serve(fake_gemini.FakeGemini(latency=0.02), port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = genai.Client(api_key="test", http_options={"base_url": url, "timeout": 5000})
+    server.generate = lambda: client.models.generate_content(model=MODEL, contents="hi").text
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_deadline_expires_while_the_model_is_still_thinking(fake):
+    fake.fake.latency = 1.0
+    caller = ResilientCaller("test", timeout=0.3, retries=2, backoff=0.01, hedge=False)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        caller.call(fake.generate)
+    # Gave up at the deadline instead of waiting for the reply, and the
+    # spent budget left no room for a retry
+    assert time.monotonic() - start < 0.8
+    assert fake.fake.requests == 1
+    assert caller.stats()["failed"] == 1
+
+
+def test_unavailable_replies_are_retried(fake):
+    fake.fake.fail_next = 2
+    caller = ResilientCaller("test", timeout=5.0, retries=2, backoff=0.01, hedge=False)
+
+    assert caller.call(fake.generate) == fake_gemini.DEFAULT_REPLY
+    assert fake.fake.requests == 3
+    stats = caller.stats()
+    assert (stats["retried"], stats["failed"], stats["breaker"]) == (2, 0, "closed")
+
+
+def test_hedging_cuts_the_latency_tail(fake):
+    # One request in 15 stalls; the rest answer in ~20 ms
+    fake.fake.slow_every = 15
+    fake.fake.slow_latency = 0.6
+
+    def slowest(caller, calls=32):
+        fake.fake.requests = 0
+        worst = 0.0
+        for _ in range(calls):
+            start = time.monotonic()
+            caller.call(fake.generate)
+            worst = max(worst, time.monotonic() - start)
+        return worst
+
+    plain = ResilientCaller("plain", timeout=5.0, hedge=False)
+    hedged = ResilientCaller("hedged", timeout=5.0, hedge=True, hedge_min_samples=10)
+    assert slowest(plain) >= 0.6
+    # The stalled attempt is raced by a duplicate after the observed p95
+    assert slowest(hedged) < 0.3
+    assert hedged.stats()["hedged"] >= 2
+
+
+def test_breaker_opens_then_recovers_after_a_trial_call(fake):
+    fake.fake.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.3)
+    caller = ResilientCaller("test", timeout=5.0, retries=0, hedge=False, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(genai.errors.ServerError):
+            caller.call(fake.generate)
+    assert breaker.state == "open"
+    # Open: rejected without reaching the server
+    with pytest.raises(CircuitOpenError):
+        caller.call(fake.generate)
+    assert fake.fake.requests == 2
+
+    # Half-open trial that fails opens it again at once
+    time.sleep(0.35)
+    with pytest.raises(genai.errors.ServerError):
+        caller.call(fake.generate)
+    assert breaker.state == "open"
+
+    fake.fake.error_rate = 0.0
+    time.sleep(0.35)
+    assert caller.call(fake.generate) == fake_gemini.DEFAULT_REPLY
+    assert breaker.state == "closed"
+    assert caller.stats()["short_circuited"] == 1
@@ -0,0 +1,89 @@
+"""Response cache: stale fallback and prompts sent with conversation context."""
+
+import time
+
+import ai
+import memory
+import response_cache
+from memory import ConversationMemory, use_memory
+from response_cache import ResponseCache
+
+
+def expired_cache(monkeypatch):
+    cache = ResponseCache(ttl=0.01, persist=False)
+    monkeypatch.setattr(response_cache, "response_cache", cache)
+    monkeypatch.setattr(ai, "response_cache", cache)
+    # Empty, unpersisted default memory: nothing is read from the database
+    monkeypatch.setattr(memory, "memory", ConversationMemory(persist=False))
+    cache.put("who wrote hamlet", "William Shakespeare.")
+    time.sleep(0.05)
+    return cache
+
+
+def test_expired_entry_is_a_miss_but_kept_for_fallback(monkeypatch):
+    cache = expired_cache(monkeypatch)
+    assert cache.get("who wrote hamlet") is None
+    assert cache.get_stale("who wrote hamlet") == "William Shakespeare."
+
+
+def test_fallback_reply_answers_from_stale_entry(monkeypatch):
+    expired_cache(monkeypatch)
+    # start_assistant looks the prompt up (and misses) before calling the model
+    assert ai.response_cache.get("who wrote hamlet") is None
+    assert ai.fallback_reply("who wrote hamlet") == "William Shakespeare."
+
+
+def test_fallback_reply_without_any_entry(monkeypatch):
+    expired_cache(monkeypatch)
+    assert ai.fallback_reply("something never asked") == ai.ERROR_REPLY
+
+
+def test_replies_sent_with_conversation_context_bypass_the_cache(monkeypatch):
+    cache = ResponseCache(persist=False)
+    monkeypatch.setattr(ai, "response_cache", cache)
+    fresh, talking = ConversationMemory(persist=False), ConversationMemory(persist=False)
+    talking.remember("who wrote hamlet", "William Shakespeare.")
+
+    with use_memory(talking):
+        cache.put("where was he born", "Stratford-upon-Avon.", "chat", ai.cache_context())
+        assert cache.get("where was he born", "chat", ai.cache_context()) is None
+        cache.put("what is python", "A programming language.", "chat", ai.cache_context())
+    with use_memory(fresh):
+        assert cache.get("where was he born", "chat", ai.cache_context()) is None
+        assert cache.get("what is python", "chat", ai.cache_context()) is None
+        cache.put("what is python", "A programming language.", "chat", ai.cache_context())
+        assert cache.get("what is python", "chat", ai.cache_context()) == "A programming language."
+    # Other personas don't send the conversation, so they always cache
+    with use_memory(talking):
+        assert ai.cache_context("email") == ""
+    assert cache.metrics()["bypassed"] == 1
+
+
+def test_batch_sends_the_conversation_and_caches_like_single_questions(monkeypatch):
+    cache = ResponseCache(persist=False)
+    monkeypatch.setattr(ai, "response_cache", cache)
+    sent = []
+
+    class Reply:
+        text = '["Paris.", "Tokyo."]'
+
+    def call(fn, contents, persona, **extra):
+        sent.append(contents)
+        return Reply()
+
+    monkeypatch.setattr(ai.gemini, "call", call)
+    questions = ["capital of france", "capital of japan"]
+
+    talking = ConversationMemory(persist=False)
+    talking.remember("who wrote hamlet", "William Shakespeare.")
+    with use_memory(talking):
+        assert ai.start_assistant_batch(questions) == ["Paris.", "Tokyo."]
+    assert "William Shakespeare." in sent[-1]
+    assert cache.get("capital of france") is None
+
+    with use_memory(ConversationMemory(persist=False)):
+        ai.start_assistant_batch(questions)
+        assert "William Shakespeare." not in sent[-1]
+        # The single-question path finds what the batch cached
+        assert ai.start_assistant("capital of japan") == "Tokyo."
+    assert len(sent) == 2
@@ -0,0 +1,192 @@
+"""Per-turn latency tracing.
+
+A turn (one spoken command) is timed stage by stage with `span`:
+
+    with tracing.turn():
+        with tracing.span("listen"):
+            audio = recognizer.listen(source)
+        ...
+        log_turn(query, answer, tracing.take())
+
+Spans nest freely and repeated spans add up ("tts" for every sentence
+spoken in the turn). `take` returns the stage timings recorded so far
+(in milliseconds, plus "total") and starts a new accumulation, and
+`memory.log_turn` stores them in the `ai_timing` table next to the
+`ai_log` row, through the same batched log writer. `ai_timing.log_at`
+is the turn's `ai_log` timestamp; on MySQL it is a whole-second
+DATETIME, so it dates the timings for `report` but can't reliably join
+them back to one `ai_log` row.
+
+With `TRACE_ENABLED = False`, `span` returns a shared no-op context
+manager and `take` returns None, so tracing costs one flag check.
+
+`report` summarizes stored timings as percentiles per stage; it backs
+the "performance report" intent and this module's CLI:
+
+    python tracing.py [--hours 24]
+"""
+
+import datetime
+import threading
+import time
+
+from config import TRACE_ENABLED
+
+_local = threading.local()
+
+
+class _NullSpan:
+    """Context manager used when there is nothing to record."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+class Turn:
+    """Stage timings accumulated for the current turn."""
+
+    __slots__ = ("stages", "started")
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class _Span:
+    __slots__ = ("turn", "stage", "start")
+
+    def __init__(self, turn, stage):
+        self.turn = turn
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.turn.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _TurnScope:
+    __slots__ = ("turn", "owner")
+
+    def __enter__(self):
+        current = getattr(_local, "turn", None)
+        # Re-entrant: main.main inside the start_jarvis loop joins the
+        # loop's turn instead of starting its own
+        self.owner = current is None
+        self.turn = _local.turn = current or Turn()
+        return self.turn
+
+    def __exit__(self, *exc):
+        if self.owner:
+            _local.turn = None
+        return False
+
+
+def turn():
+    """Context manager that collects spans for one turn on this thread."""
+    if not TRACE_ENABLED:
+        return _NULL
+    return _TurnScope()
+
+
+def span(stage):
+    """Context manager timing `stage` within the current turn (if any)."""
+    if not TRACE_ENABLED:
+        return _NULL
+    current = getattr(_local, "turn", None)
+    if current is None:
+        return _NULL
+    return _Span(current, stage)
+
+
+def record(stage, seconds):
+    """Add an already measured duration to the current turn."""
+    if not TRACE_ENABLED:
+        return
+    current = getattr(_local, "turn", None)
+    if current is not None:
+        current.add(stage, seconds)
+
+
+def take():
+    """Return {stage: ms} recorded since the last `take`, plus "total".
+
+    Returns None when tracing is off or no turn is open.
+    """
+    if not TRACE_ENABLED:
+        return None
+    current = getattr(_local, "turn", None)
+    if current is None:
+        return None
+    now = time.perf_counter()
+    timings = {stage: seconds * 1000 for stage, seconds in current.stages.items()}
+    timings["total"] = (now - current.started) * 1000
+    current.stages = {}
+    current.started = now
+    return timings
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def report(since=None, until=None):
+    """Return {stage: {count, p50, p95, p99, max}} in ms for a time window.
+
+    Args:
+        since: Start of the window (default: 24 hours ago).
+        until: End of the window (default: now).
+    """
+    import db
+
+    since = since or datetime.datetime.now() - datetime.timedelta(hours=24)
+    by_stage = {}
+    for stage, ms in db.timings(since, until):
+        by_stage.setdefault(stage, []).append(ms)
+    summary = {}
+    for stage, values in sorted(by_stage.items()):
+        values.sort()
+        summary[stage] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+    return summary
+
+
+def format_report(summary):
+    lines = [f"{'stage':<20} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for stage, s in summary.items():
+        lines.append(
+            f"{stage:<20} {s['count']:>6} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['max']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize stored per-turn timings")
+    parser.add_argument("--hours", type=float, default=24, help="size of the window")
+    args = parser.parse_args()
+    start = datetime.datetime.now() - datetime.timedelta(hours=args.hours)
+    summary = report(start)
+    print(format_report(summary) if summary else "No timings recorded in this window.")
@@ -6,6 +6,12 @@ contains templates used when calling the AI assistant to compose
 emails or control assistant personality.
 """
 
+import importlib.util
+import re
+import sys
+import threading
+import types
+
 
 def fix_email_spoken(text):
     """Convert spoken text to email/phone format by replacing common words.
@@ -39,6 +45,164 @@ def fix_email_spoken(text):
     return text
 
 
+class _MissingModule(types.ModuleType):
+    """Placeholder for an optional module that is not installed."""
+
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'")
+
+
+class _LockedLazyModule(types.ModuleType):
+    """Module that finishes loading on first attribute access, once.
+
+    `importlib.util.LazyLoader`'s module turns into a plain module as soon
+    as the load *starts*, so on Python < 3.12 a second thread touching it
+    meanwhile sees a half-initialized module. Here the load runs under a
+    per-module lock and the class only changes once it has finished;
+    threads that were waiting find it loaded and skip the load.
+    """
+
+    def __getattribute__(self, attr):
+        state = types.ModuleType.__getattribute__(self, "__spec__").loader_state
+        with state["lock"]:
+            # Re-checked under the lock; `loading` lets the module's own
+            # import (same thread) read the partly loaded module
+            if type(self) is _LockedLazyModule and not state["loading"]:
+                state["loading"] = True
+                try:
+                    _finish_lazy_load(self, state)
+                finally:
+                    state["loading"] = False
+        return types.ModuleType.__getattribute__(self, attr)
+
+
+def _finish_lazy_load(module, state):
+    attrs = types.ModuleType.__getattribute__(module, "__dict__")
+    # Keep attributes assigned before the load, as an eager import would
+    updated = {k: v for k, v in attrs.items()
+               if k not in state["__dict__"] or state["__dict__"][k] is not v}
+    attrs["__spec__"].loader.exec_module(module)
+    attrs.update(updated)
+    module.__class__ = types.ModuleType
+
+
+class _LockedLazyLoader(importlib.util.LazyLoader):
+    """`LazyLoader` whose modules load under a lock (see `_LockedLazyModule`)."""
+
+    def exec_module(self, module):
+        spec = module.__spec__
+        super().exec_module(module)
+        spec.loader_state.update(lock=threading.RLock(), loading=False)
+        module.__class__ = _LockedLazyModule
+
+
+def lazy_import(name):
+    """Return module `name`, deferring its import until first attribute use.
+
+    Heavy backends (pywhatkit, keyboard, the Gemini SDK, ...) are only
+    needed once their intent is used, so importing them up front just
+    delays the wake-word loop. A missing module raises on first use
+    instead of at import time.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _MissingModule(name)
+    loader = _LockedLazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def preload(module):
+    """Force a `lazy_import`ed module to finish loading now."""
+    if isinstance(module, _MissingModule):
+        raise ModuleNotFoundError(f"No module named '{module.__name__}'")
+    module.__name__  # any attribute access completes a lazy load
+    return module
+
+
+# Words that carry no meaning for caching purposes: the wake word,
+# politeness and hesitation sounds. Words that can change a question
+# ("how well", "just", "say hello") are kept.
+FILLER_WORDS = {"jarvis", "please", "kindly", "um", "umm", "uh", "uhm", "er", "hmm"}
+
+
+def normalize_prompt(text):
+    """Reduce a prompt to a canonical form for cache lookups.
+
+    Example: "Jarvis, um, what is Python please?" -> "what is python"
+
+    Args:
+        text: Raw user prompt.
+
+    Returns:
+        Lowercased words with punctuation and filler words removed.
+    """
+    words = re.sub(r"[^\w\s]", " ", text.lower()).split()
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break.
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class SentenceSplitter:
+    """Incrementally regroup streamed text chunks into whole sentences.
+
+    A sentence is only emitted once the text after its terminator has
+    started arriving, so "3." followed later by "5" is not cut. Pieces
+    shorter than `min_length` are merged with the next sentence to avoid
+    choppy speech. Works for both sync and async streams: call `feed`
+    for every chunk and `flush` at the end.
+    """
+
+    def __init__(self, min_length=20):
+        self.min_length = min_length
+        self.buffer = ""
+
+    def feed(self, chunk):
+        """Add a chunk and return the sentences it completed."""
+        self.buffer += chunk
+        sentences = []
+        while True:
+            cut = None
+            for match in SENTENCE_END.finditer(self.buffer):
+                if match.start() >= self.min_length:
+                    cut = match
+                    break
+            if cut is None:
+                return sentences
+            sentence = self.buffer[:cut.start()].strip()
+            self.buffer = self.buffer[cut.end():]
+            if sentence:
+                sentences.append(sentence)
+
+    def flush(self):
+        """Return whatever text is left as a final sentence list."""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def iter_sentences(chunks, min_length=20):
+    """Regroup an iterable of text chunks into whole sentences.
+
+    Args:
+        chunks: Iterable of text fragments in arrival order.
+        min_length: Minimum characters before a boundary is honoured.
+
+    Yields:
+        Stripped sentence strings.
+    """
+    splitter = SentenceSplitter(min_length)
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.flush()
+
+
 # Prompt template for AI-generated email composition. This template asks
 # the model to produce a final-ready email body with no extra commentary.
 prompt = """ You are an email-writer assistant. Your job is to produce the FINAL email exactly as it should be sent.
@@ -60,3 +224,20 @@ Don't Mention Jarvis While Replying.
 Don't Use Bold,Italic And * .
 Don't Have Give Your API Key Or Your Codes.."""
 
+
+# Used by `memory.py` to fold old turns into the rolling summary
+summary_prompt = """You maintain a running summary of a conversation between a user and a voice assistant.
+You are given the current summary and some new turns.
+Return an updated summary that keeps names, facts, preferences and open questions the user may refer back to.
+Drop greetings and small talk. Write plain sentences, no lists or formatting.
+ONLY output the summary."""
+
+
+# Personas sent as the model's system instruction, chosen per intent:
+# "chat" for general questions, "email" for composing emails and
+# "summary" for condensing conversation memory.
+personas = {
+    "chat": system_prompt,
+    "email": prompt,
+    "summary": summary_prompt,
+}
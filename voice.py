@@ -1,13 +1,171 @@
 """Speech I/O helpers: listen for voice and play TTS audio.
 
 This module uses the `speech_recognition` package for microphone input
-and `gTTS` + `playsound` to synthesize and play audio.
+and `gTTS` to synthesize audio. Synthesized audio is kept in a
+size-bounded on-disk cache so fixed phrases are only fetched from gTTS
+once.
+
+Playback runs on a dedicated audio thread fed by a queue: synthesis
+writes into an in-memory buffer, and `pygame.mixer` plays the mp3 bytes
+directly (falling back to `playsound` on a temporary file holding the
+same bytes when pygame is not installed). `speak(..., block=False)` returns a `SpeechHandle` that
+can be waited on or cancelled for barge-in.
+
+Wake-word detection uses a single long-lived `AudioCapture` stream. A
+local energy gate cuts the audio into voiced segments, and only those
+are sent to recognition (or to an optional offline keyword spotter).
+
+`redirect` routes `speak` and `take_command` on the current thread to a
+text channel instead of the speaker and microphone; `server.py` uses it
+to run the same handlers for remote text clients.
 """
 
 import speech_recognition as sr
-from gtts import gTTS
 import os
+import io
+import hashlib
+import json
+import queue
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from playsound import playsound
+from utils import lazy_import
+from tracing import span
+from config import TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
+from config import (
+    VAD_PREROLL,
+    VAD_HANGOVER,
+    VAD_MIN_SEGMENT,
+    VAD_MAX_SEGMENT,
+    VAD_ENERGY_RATIO,
+    VAD_RING_SECONDS,
+    WAKE_SPOTTER,
+    CALIBRATION_FILE,
+    CALIBRATION_DRIFT,
+    CALIBRATION_HISTORY,
+)
+
+try:
+    import audioop  # fast RMS; removed from the stdlib in Python 3.13
+except ImportError:
+    audioop = None
+
+# Synthesis and playback backends load on first use
+gtts = lazy_import("gtts")
+# pygame can play mp3 straight from memory and stop mid-sentence
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+pygame = lazy_import("pygame")
+
+
+class Calibration:
+    """Energy-threshold calibration shared by every `take_command` call.
+
+    The threshold is measured once with `adjust_for_ambient_noise` and
+    saved to `CALIBRATION_FILE`. After that, the quiet lead-in and
+    trailing pause of each captured utterance update a running ambient
+    estimate; the recognizer's threshold is only moved when that
+    estimate drifts more than `CALIBRATION_DRIFT` from the level the
+    threshold was set for. Every change is appended to `history`.
+    """
+
+    def __init__(self, recognizer, path=CALIBRATION_FILE):
+        self.recognizer = recognizer
+        self.path = path
+        self.ambient = None      # running estimate of background RMS
+        self.baseline = None     # ambient level the threshold was set for
+        self.history = []
+        self._load()
+
+    @property
+    def calibrated(self):
+        return self.baseline is not None
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.recognizer.energy_threshold = data["energy_threshold"]
+        self.ambient = self.baseline = data["baseline"]
+        self.history = data.get("history", [])
+
+    def save(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump({
+                    "energy_threshold": self.recognizer.energy_threshold,
+                    "baseline": self.baseline,
+                    "history": self.history[-CALIBRATION_HISTORY:],
+                }, f, indent=2)
+        except OSError as e:
+            print("Could not save calibration:", e)
+
+    def calibrate(self, source, duration=0.5):
+        """Full ambient measurement; only needed once per install."""
+        self.recognizer.adjust_for_ambient_noise(source, duration=duration)
+        self.baseline = self.ambient = (
+            self.recognizer.energy_threshold / self.recognizer.dynamic_energy_ratio
+        )
+        self._record("calibrate")
+
+    def observe(self, audio):
+        """Update the ambient estimate from the quiet edges of `audio`."""
+        rate, width = audio.sample_rate, audio.sample_width
+        edge = int(rate * 0.2) * width  # 200 ms at each end
+        data = audio.frame_data
+        if len(data) < 4 * edge:
+            return
+        quiet = min(frame_rms(data[:edge], width), frame_rms(data[-edge:], width))
+
+        self.ambient = quiet if self.ambient is None else 0.8 * self.ambient + 0.2 * quiet
+        if self.baseline and abs(self.ambient - self.baseline) / self.baseline > CALIBRATION_DRIFT:
+            self.baseline = self.ambient
+            self.recognizer.energy_threshold = max(
+                self.ambient * self.recognizer.dynamic_energy_ratio, ENERGY_FLOOR
+            )
+            self._record("drift")
+
+    def _record(self, reason):
+        self.history.append({
+            "time": time.time(),
+            "reason": reason,
+            "ambient": round(self.ambient, 1),
+            "energy_threshold": round(self.recognizer.energy_threshold, 1),
+        })
+        del self.history[:-CALIBRATION_HISTORY]
+        self.save()
+
+
+# One recognizer for every command; its threshold is managed by
+# `calibration` rather than re-learned each turn.
+recognizer = sr.Recognizer()
+recognizer.dynamic_energy_threshold = False
+calibration = Calibration(recognizer)
+
+
+# Per-thread text channel set by `redirect` (None: use the audio devices)
+_local = threading.local()
+
+
+@contextmanager
+def redirect(channel):
+    """Send this thread's `speak` output and `take_command` input to `channel`.
+
+    Args:
+        channel: Object with `say(text)` and `listen()` methods; `listen`
+            returns the next text from the user, or "none".
+    """
+    previous = getattr(_local, "channel", None)
+    _local.channel = channel
+    try:
+        yield channel
+    finally:
+        _local.channel = previous
 
 
 def take_command():
@@ -17,19 +175,27 @@ def take_command():
         The recognized string in lowercase, or the literal "none" when
         speech could not be understood or a timeout occurred.
     """
-    recognizer = sr.Recognizer()
+    channel = getattr(_local, "channel", None)
+    if channel is not None:
+        return channel.listen().lower()
 
     with sr.Microphone() as source:
-        # Reduce sensitivity to ambient noise for better recognition
-        recognizer.adjust_for_ambient_noise(source, duration=0.3)
+        # Measure ambient noise only the very first time; afterwards the
+        # saved threshold is reused and adjusted from each utterance
+        if not calibration.calibrated:
+            calibration.calibrate(source)
 
         try:
-            audio = recognizer.listen(source, timeout=5, phrase_time_limit=7)
+            with span("listen"):
+                audio = recognizer.listen(source, timeout=5, phrase_time_limit=7)
         except sr.WaitTimeoutError:
             return "none"
 
+    calibration.observe(audio)
+
     try:
-        command = recognizer.recognize_google(audio, language='en-in')
+        with span("recognize"):
+            command = recognizer.recognize_google(audio, language='en-in')
         print("User said:", command)
         return command.lower()
 
@@ -43,43 +209,537 @@ def take_command():
         return "none"
 
 
-def speak(text):
+class TTSCache:
+    """On-disk LRU cache of synthesized speech.
+
+    Entries are mp3 files named by a SHA-256 of (text, lang, slow).
+    Recency is tracked in memory and mirrored to file mtimes, so the LRU
+    order survives restarts. When the total size exceeds `max_bytes`,
+    the least recently used files are deleted.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size, least recent first
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, lang, slow):
+        """Return the content address for a (text, lang, slow) triple."""
+        raw = f"{lang}\0{int(slow)}\0{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".mp3")
+
+    def _load(self):
+        # Rebuild the LRU order from the files left by a previous run
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".mp3"):
+                st = os.stat(os.path.join(self.directory, name))
+                files.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+        self._loaded = True
+
+    def get(self, key):
+        """Return the cached file path for `key`, or None on a miss."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key, data):
+        """Store mp3 bytes under `key` and return the file path."""
+        path = self.path(key)
+        # Per-thread temp name so concurrent writers never clash
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            if not self._loaded:
+                self._load()
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        # Never evict the most recent entry, even if it alone is too big
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Return hit/miss counters and current cache usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+tts_cache = TTSCache()
+
+
+def synthesize(text, lang="en", slow=False):
+    """Return mp3 bytes for `text`, calling gTTS only on a cache miss."""
+    key = TTSCache.key(text, lang, slow)
+    path = tts_cache.get(key)
+    if path is not None:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass  # evicted between lookup and read; synthesize again
+
+    buf = io.BytesIO()
+    gtts.gTTS(text=text, lang=lang, slow=slow).write_to_fp(buf)
+    data = buf.getvalue()
+    tts_cache.put(key, data)
+    return data
+
+
+class SpeechHandle:
+    """Tracks one queued utterance through synthesis and playback."""
+
+    def __init__(self, text, lang="en", slow=False):
+        self.text = text
+        self.lang = lang
+        self.slow = slow
+        self.audio = None
+        self.error = None
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait(self, timeout=None):
+        """Block until playback finishes or is cancelled.
+
+        Returns:
+            True if the utterance finished (or was cancelled), False if
+            `timeout` expired first.
+        """
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Skip this utterance, stopping it if it is already playing."""
+        self._cancelled.set()
+
+    def _finish(self):
+        with _pending_lock:
+            _pending.discard(self)
+        self._done.set()
+
+
+# Utterances that have been queued but not finished, for `stop_speaking`
+_pending = set()
+_pending_lock = threading.Lock()
+
+_synth_queue = queue.Queue()
+_play_queue = queue.Queue()
+_workers_started = False
+_use_pygame = True
+_workers_lock = threading.Lock()
+
+
+def _synth_worker():
+    # Synthesizes the next utterance while the previous one is playing
+    while True:
+        handle = _synth_queue.get()
+        if handle.cancelled:
+            handle._finish()
+            continue
+        try:
+            handle.audio = synthesize(handle.text, handle.lang, handle.slow)
+        except Exception as e:
+            print("Error in speak():", e)
+            handle.error = e
+            handle._finish()
+            continue
+        _play_queue.put(handle)
+
+
+def _audio_worker():
+    # Sole owner of the output device: plays queued utterances in order
+    global _use_pygame
+    if _use_pygame:
+        try:
+            pygame.mixer.init()
+        except Exception as e:
+            print("pygame mixer unavailable, using playsound:", e)
+            _use_pygame = False
+    while True:
+        handle = _play_queue.get()
+        try:
+            if not handle.cancelled:
+                _play(handle)
+        except Exception as e:
+            print("Error in speak():", e)
+            handle.error = e
+        finally:
+            handle._finish()
+
+
+def _play(handle):
+    if not _use_pygame:
+        # playsound needs a file. The cached one can be evicted before
+        # or during playback, so play a private copy of the bytes
+        # synthesis returned. It cannot be interrupted.
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
+            f.write(handle.audio)
+        try:
+            playsound(f.name)
+        finally:
+            os.remove(f.name)
+        return
+
+    pygame.mixer.music.load(io.BytesIO(handle.audio), "mp3")
+    pygame.mixer.music.play()
+    while pygame.mixer.music.get_busy():
+        if handle.cancelled:
+            pygame.mixer.music.stop()
+            break
+        time.sleep(0.02)
+    pygame.mixer.music.unload()
+
+
+def _start_workers():
+    global _workers_started
+    with _workers_lock:
+        if _workers_started:
+            return
+        for target, name in ((_synth_worker, "jarvis-tts"), (_audio_worker, "jarvis-audio")):
+            threading.Thread(target=target, name=name, daemon=True).start()
+        _workers_started = True
+
+
+def speak(text, lang="en", slow=False, block=True):
     """Convert `text` to speech using Google TTS and play it.
 
-    The function saves a temporary `voice.mp3` file, plays it and removes
-    the file. Exceptions are logged to stdout for debugging.
+    Audio comes from the TTS cache when the phrase has been spoken
+    before. Utterances are played in the order they were queued.
+    Exceptions are logged to stdout for debugging.
+
+    Args:
+        text: What to say.
+        lang: gTTS language code.
+        slow: Use gTTS slow speech.
+        block: Wait for playback to finish. Pass False to return
+            immediately and use the handle to wait or cancel later.
+
+    Returns:
+        A `SpeechHandle` for the queued utterance.
     """
-    try:
-        tts = gTTS(text=text, lang='en', slow=False)
+    channel = getattr(_local, "channel", None)
+    if channel is not None:
+        # Text client: nothing to synthesize, the handle is already done
+        channel.say(text)
+        handle = SpeechHandle(text, lang, slow)
+        handle._done.set()
+        return handle
+
+    _start_workers()
+    handle = SpeechHandle(text, lang, slow)
+    with _pending_lock:
+        _pending.add(handle)
+    _synth_queue.put(handle)
+    if block:
+        with span("tts"):
+            handle.wait()
+    return handle
+
+
+def stop_speaking():
+    """Cancel everything queued or playing (barge-in)."""
+    with _pending_lock:
+        handles = list(_pending)
+    for handle in handles:
+        handle.cancel()
+
+
+def prewarm(phrases, background=True):
+    """Make sure every phrase in `phrases` is in the TTS cache.
+
+    Args:
+        phrases: Iterable of strings to synthesize ahead of time.
+        background: Run in a daemon thread instead of blocking.
+
+    Returns:
+        The thread when `background` is True, otherwise None.
+    """
+    def run():
+        for phrase in phrases:
+            try:
+                synthesize(phrase)
+            except Exception as e:
+                print("TTS prewarm failed for", repr(phrase), "-", e)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="jarvis-tts-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def frame_rms(frame, width=2):
+    """Return the RMS energy of a 16-bit PCM frame."""
+    if audioop is not None:
+        return audioop.rms(frame, width)
+    samples = array("h", frame)
+    if not samples:
+        return 0
+    return int((sum(x * x for x in samples) / len(samples)) ** 0.5)
+
+
+# Below this RMS nothing counts as speech, even in a silent room
+ENERGY_FLOOR = 100
+
+
+class AudioCapture:
+    """One microphone stream read continuously by a background thread.
+
+    Frames go into a ring buffer; an energy gate opens when a frame is
+    `VAD_ENERGY_RATIO` times louder than the tracked ambient level and
+    closes after `VAD_HANGOVER` seconds of quiet. Each closed segment,
+    including `VAD_PREROLL` seconds of audio from before the gate
+    opened, is queued as an `sr.AudioData` for `next_segment`.
+
+    If reading fails (device unplugged, stream error), the thread records
+    the error in `error` and stops; `next_segment` then reopens the
+    stream, and raises the error if it fails again before any audio.
+    """
+
+    def __init__(self, device_index=None):
+        self.microphone = sr.Microphone(device_index=device_index)
+        self.segments = queue.Queue(maxsize=8)
+        self.ambient = None
+        self.error = None
+        self._running = threading.Event()
+        self._thread = None
+        self._reopened = False
+
+    def start(self):
+        """Open the stream (once) and start or resume capturing."""
+        if self._thread is not None and not self._thread.is_alive():
+            # The capture thread died on an error: start over
+            self._close()
+        if self._thread is None:
+            self.microphone.__enter__()
+            self._thread = threading.Thread(target=self._run, name="jarvis-capture", daemon=True)
+            self._running.set()
+            self._thread.start()
+        else:
+            self._running.set()
+
+    def pause(self):
+        """Stop reading without closing the device, e.g. while `take_command` listens."""
+        if self._running.is_set():
+            self._running.clear()
+            # Drop stale speech so resuming does not replay old segments
+            while not self.segments.empty():
+                self.segments.get_nowait()
 
-        fname = "voice.mp3"
-        tts.save(fname)
+    def next_segment(self, timeout=None):
+        """Return the next voiced `sr.AudioData`, or None on timeout.
 
-        playsound(fname)
+        Raises:
+            Exception: The capture error, if the stream failed again
+                right after being reopened.
+        """
+        try:
+            audio = self.segments.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if audio is not None:
+            self._reopened = False
+            return audio
+        # The capture thread stopped on an error
+        error = self.error
+        self._close()
+        if self._reopened:
+            raise error
+        self._reopened = True
+        print("Reopening the microphone after:", error)
+        self.start()
+        return self.next_segment(timeout)
+
+    def _close(self):
+        self._running.clear()
+        self._thread = None
+        self.error = None
+        try:
+            self.microphone.__exit__(None, None, None)
+        except Exception as e:
+            print("Microphone close error:", e)
+        while not self.segments.empty():
+            self.segments.get_nowait()
+
+    def _run(self):
+        try:
+            self._capture()
+        except Exception as e:
+            print("Microphone capture error:", e)
+            self.error = e
+            # None wakes `next_segment`, which reopens or raises
+            self._emit(None)
+
+    def _capture(self):
+        mic = self.microphone
+        rate, width, chunk = mic.SAMPLE_RATE, mic.SAMPLE_WIDTH, mic.CHUNK
+        frame_seconds = chunk / rate
+        ring = deque(maxlen=int(VAD_RING_SECONDS / frame_seconds))
+        preroll = int(VAD_PREROLL / frame_seconds)
+        hangover = int(VAD_HANGOVER / frame_seconds)
+        min_frames = int(VAD_MIN_SEGMENT / frame_seconds)
+        max_frames = int(VAD_MAX_SEGMENT / frame_seconds)
+
+        # Seed the noise floor from the first half second of audio
+        calibration = [frame_rms(mic.stream.read(chunk), width)
+                       for _ in range(max(1, int(0.5 / frame_seconds)))]
+        self.ambient = sum(calibration) / len(calibration)
+
+        segment = None  # frames of the open segment, None while silent
+        voiced = quiet = 0
+        while True:
+            if not self._running.is_set():
+                # Stream start/stop stays on this thread, next to the reads
+                mic.stream.pyaudio_stream.stop_stream()
+                self._running.wait()
+                mic.stream.pyaudio_stream.start_stream()
+                segment = None
+
+            frame = mic.stream.read(chunk)
+            ring.append(frame)
+            energy = frame_rms(frame, width)
+            threshold = max(self.ambient * VAD_ENERGY_RATIO, ENERGY_FLOOR)
+
+            if segment is None:
+                if energy > threshold:
+                    segment = list(ring)[-(preroll + 1):]
+                    voiced, quiet = 1, 0
+                else:
+                    # Track the noise floor only while nobody is talking
+                    self.ambient = 0.95 * self.ambient + 0.05 * energy
+                continue
+
+            segment.append(frame)
+            if energy > threshold:
+                voiced, quiet = voiced + 1, 0
+            else:
+                quiet += 1
+            if quiet >= hangover or len(segment) >= max_frames:
+                if voiced >= min_frames:
+                    self._emit(sr.AudioData(b"".join(segment), rate, width))
+                segment = None
+
+    def _emit(self, audio):
+        try:
+            self.segments.put_nowait(audio)
+        except queue.Full:
+            # Recognition is falling behind: the oldest segment matters least
+            self.segments.get_nowait()
+            self.segments.put_nowait(audio)
 
-        os.remove(fname)
 
-    except Exception as e:
-        print("Error in speak():", e)
+_capture = None
 
 
-def wake_word_listener(wake_word="jarvis"):
+def get_capture():
+    """Return the shared `AudioCapture`, creating it on first use."""
+    global _capture
+    if _capture is None:
+        _capture = AudioCapture()
+    return _capture
+
+
+def sphinx_spotter(wake_word, sensitivity=1e-20):
+    """Return an offline keyword spotter built on pocketsphinx.
+
+    The returned callable takes an `sr.AudioData` and returns True when
+    `wake_word` is heard, without any network call. Requires the
+    `pocketsphinx` package.
+    """
+    recognizer = sr.Recognizer()
+
+    def spot(audio):
+        try:
+            heard = recognizer.recognize_sphinx(audio, keyword_entries=[(wake_word, sensitivity)])
+        except sr.UnknownValueError:
+            return False
+        return wake_word.lower() in heard.lower()
+
+    return spot
+
+
+def wake_word_listener(wake_word="jarvis", spotter=None):
     """Block until the configured wake word is heard and return True.
 
-    The function runs an infinite loop listening in short intervals and
-    returns when the wake word is detected. It intentionally swallows
-    transient recognition errors to keep the loop robust.
+    Audio comes from the shared `AudioCapture`, which stays open across
+    calls and only hands over voiced segments, so silence never costs a
+    recognition request. Transient recognition errors are swallowed to
+    keep the loop robust.
+
+    Args:
+        wake_word: Word that wakes the assistant.
+        spotter: Optional callable taking an `sr.AudioData` and returning
+            True when the wake word is present. When given (or when
+            `WAKE_SPOTTER` is "sphinx"), detection is fully offline.
     """
+    if spotter is None and WAKE_SPOTTER == "sphinx":
+        spotter = sphinx_spotter(wake_word)
+
     recognizer = sr.Recognizer()
+    capture = get_capture()
+    print(f"Listening for wake word: {wake_word}...")
+    capture.start()
 
-    with sr.Microphone() as source:
-        print(f"Listening for wake word: {wake_word}...")
-        recognizer.adjust_for_ambient_noise(source)
+    try:
+        while True:
+            audio = capture.next_segment()
+
+            if spotter is not None:
+                if spotter(audio):
+                    print("Wake word detected!")
+                    return True
+                continue
 
-    while True:
-        with sr.Microphone() as source:
             try:
-                audio = recognizer.listen(source, timeout=5, phrase_time_limit=5)
                 query = recognizer.recognize_google(audio, language='en-in').lower()
                 print("Heard:", query)
 
@@ -90,9 +750,9 @@ def wake_word_listener(wake_word="jarvis"):
             except sr.UnknownValueError:
                 continue  # ignore noise
 
-            except sr.WaitTimeoutError:
-                continue
-
             except sr.RequestError:
                 print("Speech Recognition API unavailable.")
                 continue
+    finally:
+        # Release the device to `take_command` until we listen again
+        capture.pause()